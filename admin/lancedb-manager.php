@@ -797,6 +797,25 @@ function fukami_lens_view_database_page() {
                 echo "<p><strong>Total Posts:</strong> " . number_format($total_posts) . "</p>";
                 echo "<p><strong>Database Size:</strong> " . $stats['db_size_mb'] . " MB</p>";
                 echo "<p><strong>Current Page:</strong> " . $page . " of " . $total_pages . "</p>";
+                
+                $facets_result = $lancedb_service->get_facets();
+                if ($facets_result['success']) {
+                    $facets = $facets_result['data'];
+                    $coverage = $facets['coverage'];
+                    if ($coverage['with_chunks'] !== null) {
+                        echo "<p><strong>Chunked Posts:</strong> " . number_format($coverage['with_chunks']) . " of " . number_format($coverage['posts']) . "</p>";
+                    }
+                    echo "<p><strong>Posts with Content Hash:</strong> " . number_format($coverage['with_content_hash']) . " of " . number_format($coverage['posts']) . "</p>";
+                    foreach (['categories' => 'Categories', 'tags' => 'Tags', 'months' => 'Months'] as $facet => $label) {
+                        if (empty($facets[$facet])) {
+                            continue;
+                        }
+                        $counts = array_map(function($entry) {
+                            return esc_html($entry['value']) . ' (' . number_format($entry['count']) . ')';
+                        }, array_slice($facets[$facet], 0, 12));
+                        echo "<p><strong>" . $label . ":</strong> " . implode(', ', $counts) . "</p>";
+                    }
+                }
                 echo "</div>";
                 
                 // Search and filter form
@@ -831,7 +850,8 @@ function fukami_lens_view_database_page() {
                     'page' => $page,
                     'per_page' => $per_page,
                     'search' => $search,
-                    'date_filter' => $date_filter
+                    'date_filter' => $date_filter,
+                    'embedding_preview' => 5
                 ];
                 
                 // Create temporary JSON file
@@ -890,7 +910,7 @@ function fukami_lens_view_database_page() {
                                 echo "<td>" . esc_html($post['date']) . "</td>";
                                 echo "<td>" . esc_html(implode(', ', $post['categories'])) . "</td>";
                                 echo "<td>" . esc_html(implode(', ', $post['tags'])) . "</td>";
-                                echo "<td>" . (isset($post['embedding']) ? count($post['embedding']) . " dim" : "N/A") . "</td>";
+                                echo "<td>" . (!empty($post['embedding_dim']) ? intval($post['embedding_dim']) . " dim" : "N/A") . "</td>";
                                 echo "<td>";
                                 echo "<button type='button' class='button button-small view-content-btn' data-post-id='" . esc_attr($post['id']) . "'>View</button>";
                                 echo "</td>";
@@ -903,9 +923,9 @@ function fukami_lens_view_database_page() {
                                 echo "<h4>Content Preview:</h4>";
                                 echo "<p>" . esc_html(substr($post['content'], 0, 500)) . (strlen($post['content']) > 500 ? '...' : '') . "</p>";
                                 echo "<p><strong>Permalink:</strong> <a href='" . esc_url($post['permalink']) . "' target='_blank'>" . esc_html($post['permalink']) . "</a></p>";
-                                if (isset($post['embedding'])) {
-                                    echo "<p><strong>Embedding Dimensions:</strong> " . count($post['embedding']) . "</p>";
-                                    echo "<p><strong>Embedding Preview:</strong> [" . implode(', ', array_slice($post['embedding'], 0, 5)) . "...]</p>";
+                                if (isset($post['embedding_preview'])) {
+                                    echo "<p><strong>Embedding Dimensions:</strong> " . intval($post['embedding_dim']) . "</p>";
+                                    echo "<p><strong>Embedding Preview:</strong> [" . implode(', ', $post['embedding_preview']) . "...]</p>";
                                 }
                                 echo "</div>";
                                 echo "</td>";
@@ -123,19 +123,49 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
                 $system_prompt = $dashboard_prompt;
             }
 
-            // Compose prompt (very basic RAG logic for demo)
+            // Compose prompt: RAG context packed into the context window by LanceDB
             $context = '';
-            if ($use_rag && $rag_source) {
-                // build context URL including dates
-                $params = ['q'=>$question];
-                if ($start_date) $params['start_date']=$start_date;
-                if ($end_date)   $params['end_date']=$end_date;
-                $url = $rag_source . '?' . http_build_query($params);
-                $rag_response = wp_remote_get($url);
-
-                if (!is_wp_error($rag_response)
-                    && wp_remote_retrieve_response_code($rag_response)==200) {
-                    $context = wp_remote_retrieve_body($rag_response);
+            $lancedb_service = null;
+            $query_embedding = null;
+            $source_ids = [];
+            $cache_scope = '';
+            if ($use_rag) {
+                $filters = [];
+                if ($start_date) $filters['start_date'] = $start_date;
+                if ($end_date)   $filters['end_date'] = $end_date;
+                $context_model = $provider === 'openai'
+                    ? get_option('fukami_lens_openai_gpt_model', 'gpt-3.5-turbo')
+                    : get_option('fukami_lens_anthropic_gpt_model', 'claude-3-opus-20240229');
+                // Answers are only reused for the same model, prompts, filters and settings
+                $cache_scope = md5(wp_json_encode([
+                    $provider, $context_model, $system_prompt, $filters,
+                    $rag_context_window, $rag_temp, $rag_tokens
+                ]));
+                try {
+                    $lancedb_service = new FUKAMI_LENS_LanceDB_Service();
+                    $embedding_result = $lancedb_service->get_embedding($question);
+                    if ($embedding_result['success']) {
+                        $query_embedding = $embedding_result['data']['embedding'];
+                        
+                        // A similar question answered before: skip retrieval and completion
+                        $cache_result = $lancedb_service->semantic_cache_lookup($query_embedding, $cache_scope);
+                        if ($cache_result['success'] && !empty($cache_result['data']['hit'])) {
+                            wp_send_json_success([
+                                'answer' => nl2br(esc_html($cache_result['data']['answer'])),
+                                'cached' => true
+                            ]);
+                        }
+                        
+                        $context_result = $lancedb_service->build_context(
+                            $question, $rag_context_window, $filters, $context_model, $query_embedding
+                        );
+                        if ($context_result['success']) {
+                            $context = $context_result['data']['context'];
+                            $source_ids = array_column($context_result['data']['sources'], 'post_id');
+                        }
+                    }
+                } catch (Exception $e) {
+                    error_log('FUKAMI_LENS RAG context error: ' . $e->getMessage());
                 }
             }
 
@@ -146,8 +176,8 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
             $prompt .= "User: " . $question;
 
             // Use RAG or proofreader temp/tokens
-            $temperature = ($use_rag && $rag_source) ? $rag_temp : $proof_temp;
-            $max_tokens = ($use_rag && $rag_source) ? $rag_tokens : $proof_tokens;
+            $temperature = $use_rag ? $rag_temp : $proof_temp;
+            $max_tokens = $use_rag ? $rag_tokens : $proof_tokens;
 
             // Call AI API (OpenAI example)
             $answer = '';
@@ -173,10 +203,17 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
                 ]);
                 if (is_wp_error($response)) wp_send_json_error('OpenAI API error.');
                 $body = json_decode(wp_remote_retrieve_body($response), true);
-                $answer = $body['choices'][0]['message']['content'] ?? 'No answer.';
+                $answer = $body['choices'][0]['message']['content'] ?? '';
             }
             // TODO: Add Anthropic support if needed
 
+            if ($answer && $lancedb_service && $query_embedding && $context) {
+                $lancedb_service->semantic_cache_store($question, $query_embedding, $answer, $source_ids, $cache_scope);
+            }
+            if (!$answer) {
+                $answer = 'No answer.';
+            }
+
             wp_send_json_success(['answer' => nl2br(esc_html($answer))]);
         }
 
@@ -269,6 +306,7 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
                             'title' => $post->post_title,
                             'content' => wp_strip_all_tags($post->post_content),
                             'date' => $post->post_date,
+                            'modified' => $post->post_modified,
                             'permalink' => get_permalink($post->ID),
                             'categories' => $category_names,
                             'tags' => $tag_names
@@ -317,13 +355,6 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
             try {
                 $lancedb_service = new FUKAMI_LENS_LanceDB_Service();
                 
-                // Get embedding for query text
-                $embedding_result = $lancedb_service->get_embedding($query_text);
-                
-                if (!$embedding_result['success']) {
-                    wp_send_json_error('Failed to get query embedding: ' . $embedding_result['data']);
-                }
-                
                 // Prepare filters
                 $filters = [];
                 if (!empty($start_date)) {
@@ -333,12 +364,8 @@ if ( ! class_exists( 'FUKAMI_LENS_Core' ) ) {
                     $filters['end_date'] = $end_date;
                 }
                 
-                // Search for similar content
-                $search_result = $lancedb_service->search_similar(
-                    $embedding_result['data']['embedding'],
-                    $limit,
-                    $filters
-                );
+                // Embed the query and search in one call
+                $search_result = $lancedb_service->search_text($query_text, $limit, $filters);
                 
                 if ($search_result['success']) {
                     wp_send_json_success($search_result['data']);
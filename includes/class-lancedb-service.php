@@ -65,12 +65,13 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
         public function store_embeddings($posts, $embeddings) {
             try {
                 // Prepare data for Python processing
-                $data = [
+                $vectors_file = $this->write_embeddings_file($embeddings);
+                $data = array_merge([
                     'posts' => $posts,
-                    'embeddings' => $embeddings,
+                    'model' => $this->get_active_embedding_model(),
                     'db_path' => $this->db_path,
                     'table_name' => $this->table_name
-                ];
+                ], $vectors_file);
                 
                 // Create temporary JSON file
                 $tmpfile = tempnam(sys_get_temp_dir(), 'fukami_lens_lancedb_');
@@ -85,6 +86,7 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
                 
                 // Clean up
                 unlink($tmpfile);
+                unlink($vectors_file['embeddings_file']);
                 
                 // Parse output
                 $result = json_decode($output, true);
@@ -112,15 +114,17 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
          * @param array $query_embedding Query embedding vector
          * @param int $limit Number of results to return
          * @param array $filters Optional filters (date range, categories, etc.)
+         * @param float|null $min_similarity Optional minimum similarity score (0-1)
          * @return array Response with success status and similar posts
          */
-        public function search_similar($query_embedding, $limit = 5, $filters = []) {
+        public function search_similar($query_embedding, $limit = 5, $filters = [], $min_similarity = null) {
             try {
                 // Prepare search data
                 $search_data = [
                     'query_embedding' => $query_embedding,
                     'limit' => $limit,
                     'filters' => $filters,
+                    'min_similarity' => $min_similarity,
                     'db_path' => $this->db_path,
                     'table_name' => $this->table_name
                 ];
@@ -159,6 +163,103 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
             }
         }
         
+        /**
+         * Search for content similar to a query text
+         *
+         * Embeds the query and searches in a single Python process; repeated queries
+         * are served from the query-embedding cache without an API call.
+         *
+         * @param string $query_text Query text
+         * @param int $limit Number of results to return
+         * @param array $filters Optional filters (date range, categories, etc.)
+         * @param float|null $min_similarity Optional minimum similarity score (0-1)
+         * @return array Response with success status and similar posts
+         */
+        public function search_text($query_text, $limit = 5, $filters = [], $min_similarity = null) {
+            $openai_key = get_option('fukami_lens_openai_api_key', '');
+            if (!$openai_key) {
+                return [
+                    'success' => false,
+                    'data' => 'OpenAI API key not configured for embeddings'
+                ];
+            }
+            
+            return $this->run_operation('search_text', [
+                'query_text' => $query_text,
+                'api_key' => $openai_key,
+                'model' => $this->get_active_embedding_model(),
+                'limit' => $limit,
+                'filters' => $filters,
+                'min_similarity' => $min_similarity
+            ]);
+        }
+        
+        /**
+         * Build RAG context for a query within a token budget
+         *
+         * Retrieves the chunks closest to the query, drops overlapping ones and packs the
+         * best into $token_budget tokens of $model's tokenizer.
+         *
+         * @param string $query_text Question to build context for
+         * @param int $token_budget Maximum context size in tokens
+         * @param array $filters Optional date/category filters
+         * @param string $model LLM the context is for (selects the tokenizer)
+         * @param array|null $query_embedding Embedding of $query_text, if already computed
+         * @return array Response with success status and context, token count and sources
+         */
+        public function build_context($query_text, $token_budget, $filters = [], $model = '', $query_embedding = null) {
+            try {
+                if ($query_embedding === null) {
+                    $embedding_result = $this->get_embedding($query_text);
+                    if (!$embedding_result['success']) {
+                        return $embedding_result;
+                    }
+                    $query_embedding = $embedding_result['data']['embedding'];
+                }
+                
+                $context_data = [
+                    'query_embedding' => $query_embedding,
+                    'token_budget' => intval($token_budget),
+                    'filters' => $filters,
+                    'model' => $model,
+                    'db_path' => $this->db_path,
+                    'table_name' => $this->table_name
+                ];
+                
+                // Create temporary JSON file
+                $tmpfile = tempnam(sys_get_temp_dir(), 'fukami_lens_lancedb_context_');
+                file_put_contents($tmpfile, json_encode($context_data));
+                
+                // Run Python script to build the context
+                $cmd = escapeshellcmd('/usr/bin/python3') . ' ' . 
+                       escapeshellarg($this->python_script_path) . ' ' . 
+                       escapeshellarg($tmpfile) . ' build_context 2>&1';
+                
+                $output = shell_exec($cmd);
+                
+                // Clean up
+                unlink($tmpfile);
+                
+                // Parse output
+                $result = json_decode($output, true);
+                
+                if ($result && isset($result['success'])) {
+                    return $result;
+                } else {
+                    return [
+                        'success' => false,
+                        'data' => 'Failed to build context: ' . $output
+                    ];
+                }
+                
+            } catch (Exception $e) {
+                return [
+                    'success' => false,
+                    'data' => 'Exception: ' . $e->getMessage()
+                ];
+            }
+        }
+        
         /**
          * Get embedding for text using configured model
          *
@@ -167,8 +268,8 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
          */
         public function get_embedding($text) {
             try {
-                // Get embedding model from settings
-                $embedding_model = get_option('fukami_lens_rag_embeddings_model', 'text-embedding-3-small');
+                // Embed with the model of the vectors being served, not necessarily the configured one
+                $embedding_model = $this->get_active_embedding_model();
                 $openai_key = get_option('fukami_lens_openai_api_key', '');
                 
                 if (!$openai_key) {
@@ -220,6 +321,181 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
             }
         }
         
+        /**
+         * Embedding model of the vectors currently served
+         *
+         * Read from the table's state file, which changes when a re-embedding migration
+         * cuts over; falls back to the configured model for tables that have none yet.
+         *
+         * @return string Embedding model name
+         */
+        public function get_active_embedding_model() {
+            $configured = get_option('fukami_lens_rag_embeddings_model', 'text-embedding-3-small');
+            $state_file = $this->db_path . '/' . $this->table_name . '.state.json';
+            if (file_exists($state_file)) {
+                $state = json_decode(file_get_contents($state_file), true);
+                if (!empty($state['model'])) {
+                    return $state['model'];
+                }
+            }
+            return $configured;
+        }
+        
+        /**
+         * Re-embed the table with the configured embedding model
+         *
+         * Runs up to $max_batches batches of a resumable migration; call it again (e.g.
+         * from WP-Cron) until the returned status is 'complete'. Searches keep using the
+         * current vectors until the new ones cover every post.
+         *
+         * @param int $max_batches Batches to run in this call
+         * @param int $batch_size Posts per batch
+         * @param string $current_model Model of the existing vectors, if not recorded yet
+         * @return array Response with success status and migration progress
+         */
+        public function reembed($max_batches = 10, $batch_size = 100, $current_model = '') {
+            $openai_key = get_option('fukami_lens_openai_api_key', '');
+            if (!$openai_key) {
+                return [
+                    'success' => false,
+                    'data' => 'OpenAI API key not configured for embeddings'
+                ];
+            }
+            
+            return $this->run_operation('reembed', [
+                'api_key' => $openai_key,
+                'target_model' => get_option('fukami_lens_rag_embeddings_model', 'text-embedding-3-small'),
+                'current_model' => $current_model,
+                'max_batches' => $max_batches,
+                'batch_size' => $batch_size
+            ]);
+        }
+        
+        /**
+         * Progress and estimated remaining cost of the re-embedding migration
+         *
+         * @return array Response with success status and migration progress
+         */
+        public function get_reembed_status() {
+            return $this->run_operation('reembed_status');
+        }
+        
+        /**
+         * Abort the re-embedding migration and discard its vectors
+         *
+         * @return array Response with success status and data
+         */
+        public function abort_reembed() {
+            return $this->run_operation('reembed_abort');
+        }
+        
+        /**
+         * Look up a cached answer for a query similar to this one
+         *
+         * @param array $query_embedding Embedding of the question
+         * @param string $scope Key of everything else the answer depends on (model, prompt, filters)
+         * @return array Response with success status and data['hit'], plus the answer on a hit
+         */
+        public function semantic_cache_lookup($query_embedding, $scope) {
+            return $this->run_operation('semantic_cache_lookup', [
+                'query_embedding' => $query_embedding,
+                'scope' => $scope
+            ]);
+        }
+        
+        /**
+         * Cache an answer; it is dropped when any of its source posts is updated
+         *
+         * @param string $query Question
+         * @param array $query_embedding Embedding of the question
+         * @param string $answer Answer to cache
+         * @param array $source_ids IDs of the posts the answer was based on
+         * @param string $scope Key of everything else the answer depends on
+         * @return array Response with success status and data
+         */
+        public function semantic_cache_store($query, $query_embedding, $answer, $source_ids, $scope) {
+            return $this->run_operation('semantic_cache_store', [
+                'query' => $query,
+                'query_embedding' => $query_embedding,
+                'answer' => $answer,
+                'source_ids' => array_values(array_map('intval', $source_ids)),
+                'scope' => $scope
+            ]);
+        }
+        
+        /**
+         * Write embeddings to a raw little-endian float32 sidecar file
+         *
+         * The vectors are read memory-mapped on the Python side instead of being
+         * parsed from JSON, which for thousands of 1536-dimensional vectors is most of
+         * the request. The caller deletes the file.
+         *
+         * @param array $embeddings Array of embeddings
+         * @return array Request parameters referencing the file
+         */
+        private function write_embeddings_file($embeddings) {
+            $path = tempnam(sys_get_temp_dir(), 'fukami_lens_vectors_');
+            $handle = fopen($path, 'wb');
+            foreach ($embeddings as $embedding) {
+                fwrite($handle, pack('g*', ...array_map('floatval', $embedding)));
+            }
+            fclose($handle);
+            
+            return [
+                'embeddings_file' => $path,
+                'embeddings_format' => 'f32',
+                'embeddings_dim' => empty($embeddings) ? 0 : count(reset($embeddings))
+            ];
+        }
+        
+        /**
+         * Run an operation of the Python script
+         *
+         * @param string $operation Operation name
+         * @param array $params Extra request parameters
+         * @param string|null $script Python script to run (defaults to lancedb_operations.py)
+         * @return array Response with success status and data
+         */
+        private function run_operation($operation, $params = [], $script = null) {
+            try {
+                $data = array_merge($params, [
+                    'db_path' => $this->db_path,
+                    'table_name' => $this->table_name
+                ]);
+                
+                // Create temporary JSON file
+                $tmpfile = tempnam(sys_get_temp_dir(), 'fukami_lens_lancedb_op_');
+                file_put_contents($tmpfile, json_encode($data));
+                
+                $cmd = escapeshellcmd('/usr/bin/python3') . ' ' . 
+                       escapeshellarg($script ?: $this->python_script_path) . ' ' . 
+                       escapeshellarg($tmpfile) . ' ' . escapeshellarg($operation) . ' 2>&1';
+                
+                $output = shell_exec($cmd);
+                
+                // Clean up
+                unlink($tmpfile);
+                
+                // Parse output
+                $result = json_decode($output, true);
+                
+                if ($result && isset($result['success'])) {
+                    return $result;
+                } else {
+                    return [
+                        'success' => false,
+                        'data' => 'Failed to run ' . $operation . ': ' . $output
+                    ];
+                }
+                
+            } catch (Exception $e) {
+                return [
+                    'success' => false,
+                    'data' => 'Exception: ' . $e->getMessage()
+                ];
+            }
+        }
+        
         /**
          * Update embeddings for existing posts
          *
@@ -238,6 +514,7 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
                             'title' => $post->post_title,
                             'content' => wp_strip_all_tags($post->post_content),
                             'date' => $post->post_date,
+                            'modified' => $post->post_modified,
                             'permalink' => get_permalink($post->ID),
                             'categories' => wp_get_post_categories($post->ID, ['fields' => 'names']),
                             'tags' => wp_get_post_tags($post->ID, ['fields' => 'names'])
@@ -523,12 +800,13 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
          */
         public function upsert_embeddings($posts, $embeddings) {
             try {
-                $upsert_data = [
+                $vectors_file = $this->write_embeddings_file($embeddings);
+                $upsert_data = array_merge([
                     'posts' => $posts,
-                    'embeddings' => $embeddings,
+                    'model' => $this->get_active_embedding_model(),
                     'db_path' => $this->db_path,
                     'table_name' => $this->table_name
-                ];
+                ], $vectors_file);
                 
                 // Create temporary JSON file
                 $tmpfile = tempnam(sys_get_temp_dir(), 'fukami_lens_lancedb_upsert_');
@@ -543,6 +821,7 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
                 
                 // Clean up
                 unlink($tmpfile);
+                unlink($vectors_file['embeddings_file']);
                 
                 // Parse output
                 $result = json_decode($output, true);
@@ -564,6 +843,97 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
             }
         }
         
+        /**
+         * Queue embeddings for the single LanceDB writer and make sure it is running
+         *
+         * Posts saved again before they are written replace their queued version, and
+         * everything queued meanwhile is written in one batched upsert.
+         *
+         * @param array $posts Array of post data
+         * @param array $embeddings Array of embeddings
+         * @return array Response with success status and queue statistics
+         */
+        public function enqueue_embeddings($posts, $embeddings) {
+            $vectors_file = $this->write_embeddings_file($embeddings);
+            $result = $this->run_operation('enqueue_embeddings', array_merge([
+                'posts' => $posts,
+                'model' => $this->get_active_embedding_model()
+            ], $vectors_file));
+            unlink($vectors_file['embeddings_file']);
+            if ($result['success']) {
+                $this->start_queue_writer();
+            }
+            return $result;
+        }
+        
+        /**
+         * Start draining the ingestion queue in the background
+         *
+         * Returns immediately; the Python writer exits at once if another one is running.
+         */
+        public function start_queue_writer() {
+            $tmpfile = tempnam(sys_get_temp_dir(), 'fukami_lens_lancedb_drain_');
+            file_put_contents($tmpfile, json_encode([
+                'db_path' => $this->db_path,
+                'table_name' => $this->table_name
+            ]));
+            
+            $cmd = escapeshellcmd('/usr/bin/python3') . ' ' . 
+                   escapeshellarg($this->python_script_path) . ' ' . 
+                   escapeshellarg($tmpfile) . ' drain_queue; rm -f ' . escapeshellarg($tmpfile);
+            shell_exec('(' . $cmd . ') > /dev/null 2>&1 &');
+        }
+        
+        /**
+         * Ingestion queue depth, lag and writer status
+         *
+         * @return array Response with success status and queue statistics
+         */
+        public function get_queue_stats() {
+            return $this->run_operation('queue_stats');
+        }
+        
+        /**
+         * Post counts per category, tag and month, and embedding coverage
+         *
+         * Cached by the Python side until the table changes.
+         *
+         * @return array Response with success status and facet counts
+         */
+        public function get_facets() {
+            return $this->run_operation('facets', [], plugin_dir_path(__FILE__) . '../python/view_database.py');
+        }
+        
+        /**
+         * Hash of the text a post's embedding is computed from
+         *
+         * Must match content_hash() in python/lancedb_operations.py.
+         *
+         * @param array $post Post data with title and content
+         * @return string SHA-256 hex digest
+         */
+        public function content_hash($post) {
+            return hash('sha256', $post['title'] . "\0" . $post['content']);
+        }
+        
+        /**
+         * Compare posts with their stored embeddings
+         *
+         * @param array $posts Array of post data (id, title, content)
+         * @return array Response with success status and missing_ids, stale_ids and
+         *               orphaned_ids (embedded posts not in $posts)
+         */
+        public function diff_embeddings($posts) {
+            $pairs = [];
+            foreach ($posts as $post) {
+                $pairs[] = [
+                    'id' => intval($post['id']),
+                    'hash' => $this->content_hash($post)
+                ];
+            }
+            return $this->run_operation('diff', ['posts' => $pairs]);
+        }
+        
         /**
          * Store embeddings with duplicate checking to avoid unnecessary API calls
          *
@@ -572,27 +942,26 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
          */
         public function store_embeddings_with_check($posts) {
             try {
-                // Extract post IDs
-                $post_ids = array_column($posts, 'id');
-                
-                // Check which posts already have embeddings
-                $check_result = $this->check_existing_embeddings($post_ids);
+                // Check which posts have no embedding, or one of outdated content
+                $diff_result = $this->diff_embeddings($posts);
                 
-                if (!$check_result['success']) {
-                    return $check_result;
+                if (!$diff_result['success']) {
+                    return $diff_result;
                 }
                 
-                $existing_ids = $check_result['data']['existing_ids'];
-                $missing_ids = $check_result['data']['missing_ids'];
+                $outdated_ids = array_flip(array_merge(
+                    $diff_result['data']['missing_ids'],
+                    $diff_result['data']['stale_ids']
+                ));
                 
                 // Filter posts that need new embeddings
-                $posts_to_embed = array_filter($posts, function($post) use ($missing_ids) {
-                    return in_array($post['id'], $missing_ids);
+                $posts_to_embed = array_filter($posts, function($post) use ($outdated_ids) {
+                    return isset($outdated_ids[$post['id']]);
                 });
                 
                 $posts_to_embed = array_values($posts_to_embed); // Re-index array
                 
-                $result_message = "Found {$existing_ids} existing embeddings, ";
+                $result_message = "Found {$diff_result['data']['up_to_date']} up-to-date embeddings, ";
                 
                 if (empty($posts_to_embed)) {
                     $result_message .= "no new embeddings needed.";
@@ -613,11 +982,11 @@ if ( ! class_exists( 'FUKAMI_LENS_LanceDB_Service' ) ) {
                     }
                 }
                 
-                // Store new embeddings
-                $store_result = $this->upsert_embeddings($posts_to_embed, $embeddings);
+                // Queue new embeddings for the batching writer
+                $store_result = $this->enqueue_embeddings($posts_to_embed, $embeddings);
                 
                 if ($store_result['success']) {
-                    $result_message .= "stored " . count($posts_to_embed) . " new embeddings.";
+                    $result_message .= "queued " . count($posts_to_embed) . " new embeddings.";
                     return [
                         'success' => true,
                         'data' => $result_message
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Resumable Backfill for WP Fukami Lens AI
+
+Indexes a whole site from a posts.json export in parallel, surviving timeouts and
+crashes:
+
+- The export is split once into ranges of `range_size` post IDs, written as JSON-lines
+  shards under `<db_path>/<table>.backfill/`.
+- `workers` processes each take one range at a time and run it through the ingestion
+  pipeline (convert → chunk → embed → write, see pipeline.py). Writes go to LanceDB in
+  batches of `write_batch_size` posts; the state lock serializes them across workers.
+- Every finished range is recorded in `checkpoint.json`. The next run skips them, and
+  posts of an interrupted range that were already written (same content hash) are
+  not embedded again.
+- Progress and the ETA are printed to stderr as ranges finish and returned in the
+  result.
+
+With `max_seconds` set, the run stops taking new ranges after that long, so it fits
+in a request with a timeout and can simply be started again until `complete`.
+
+Usage:
+    python3 backfill.py <input_file> [run|status|reset]
+
+The input JSON holds `posts_path`, `api_key`, `db_path`, `table_name`, and optionally
+`model`, `workers`, `range_size`, `embed_workers`, `embed_batch_size`, `embed_batch_max_tokens`,
+`write_batch_size` and `max_seconds`.
+"""
+
+import sys
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from typing import Any, Dict
+
+from utils.instrumentation import Instrumentation
+
+# Set environment variables for HuggingFace cache
+os.environ["HF_HOME"] = "/tmp"
+os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
+os.environ["XDG_CACHE_HOME"] = "/tmp"
+
+from config import load_config
+from conversion.html_to_markdown import START_METHOD
+from models.post import Post, iter_items_from_json
+from utils.serialization import write_json
+
+# Post IDs per range
+DEFAULT_RANGE_SIZE = 1000
+
+# Shard lines buffered before they are appended to their files
+SHARD_FLUSH_ITEMS = 1000
+
+
+def backfill_dir(db_path, table_name):
+    return os.path.join(db_path, f'{table_name}.backfill')
+
+
+def range_key(start, end):
+    return f'{start}-{end}'
+
+
+def export_fingerprint(posts_path, range_size):
+    st = os.stat(posts_path)
+    return {
+        'posts_path': os.path.abspath(posts_path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'range_size': range_size,
+    }
+
+
+def shard_export(posts_path, shard_dir, range_size):
+    """Split the export into one JSON-lines file per ID range; returns {start: posts}."""
+    os.makedirs(shard_dir, exist_ok=True)
+    counts, buffers, buffered = {}, {}, 0
+
+    def flush():
+        for start, lines in buffers.items():
+            with open(os.path.join(shard_dir, f'{start}.jsonl'), 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        buffers.clear()
+
+    for item in iter_items_from_json(posts_path):
+        start = int(item['ID']) // range_size * range_size
+        buffers.setdefault(start, []).append(json.dumps(item, ensure_ascii=False) + '\n')
+        counts[start] = counts.get(start, 0) + 1
+        buffered += 1
+        if buffered >= SHARD_FLUSH_ITEMS:
+            flush()
+            buffered = 0
+    flush()
+    return counts
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(tmp, path)
+
+
+def prepare(settings) -> Dict[str, Any]:
+    """The checkpoint for this export, sharding it first when it is new or has changed."""
+    directory = backfill_dir(settings['db_path'], settings['table_name'])
+    path = os.path.join(directory, 'checkpoint.json')
+    fingerprint = export_fingerprint(settings['posts_path'], settings['range_size'])
+    checkpoint = load_checkpoint(path)
+    if checkpoint is not None and checkpoint['export'] == fingerprint:
+        return checkpoint
+
+    shutil.rmtree(directory, ignore_errors=True)
+    counts = shard_export(settings['posts_path'], os.path.join(directory, 'shards'), settings['range_size'])
+    checkpoint = {
+        'export': fingerprint,
+        'created_at': time.time(),
+        'ranges': {
+            range_key(start, start + settings['range_size']): {'start': start, 'posts': n, 'done': False}
+            for start, n in sorted(counts.items())
+        },
+    }
+    save_checkpoint(path, checkpoint)
+    return checkpoint
+
+
+def run_range(job) -> Dict[str, Any]:
+    """Worker: embed and write the posts of one range that are missing or changed."""
+    key, start, settings = job
+    started = time.perf_counter()
+    try:
+        from chunking.post_chunker import PostChunker
+        from lancedb_operations import LanceDBManager, content_hash
+        from pipeline import IngestionPipeline, strip_tags
+
+        shard = os.path.join(backfill_dir(settings['db_path'], settings['table_name']), 'shards', f'{start}.jsonl')
+        with open(shard, 'r', encoding='utf-8') as f:
+            posts = [Post(json.loads(line)) for line in f]
+
+        manager = LanceDBManager(settings['db_path'], settings['table_name'])
+        diff = manager.diff([
+            {'id': post.id, 'hash': content_hash({'title': post.title, 'content': strip_tags(post.content)})}
+            for post in posts
+        ])
+        if not diff['success']:
+            raise Exception(diff['data'])
+        todo = set(diff['data']['missing_ids']) | set(diff['data']['stale_ids'])
+        posts = [post for post in posts if int(post.id) in todo]
+
+        report = {'posts': 0, 'chunks': 0, 'skipped': []}
+        if posts:
+            # The processes are the parallelism: convert in-process, and no shared chunk
+            # cache (written posts are skipped by content hash instead)
+            chunker = PostChunker(settings['max_input_tokens'], settings['model'], workers=1,
+                                  overlap=settings['chunk_overlap_tokens'])
+            pipeline = IngestionPipeline(
+                chunker,
+                manager,
+                settings['api_key'],
+                settings['model'],
+                embed_workers=settings['embed_workers'],
+                embed_batch_size=settings['embed_batch_size'],
+                write_batch_size=settings['write_batch_size'],
+                queue_size=settings['queue_size'],
+                embed_batch_max_tokens=settings['embed_batch_max_tokens'],
+            )
+            report = pipeline.run(posts)
+        return {
+            'key': key,
+            'embedded': report['posts'],
+            'chunks': report['chunks'],
+            'skipped': report['skipped'],
+            'seconds': round(time.perf_counter() - started, 3),
+        }
+    except Exception as e:
+        return {'key': key, 'error': str(e)}
+
+
+def summarize(checkpoint, posts_per_second=None) -> Dict[str, Any]:
+    ranges = checkpoint['ranges'].values()
+    posts_total = sum(r['posts'] for r in ranges)
+    posts_done = sum(r['posts'] for r in ranges if r['done'])
+    remaining = posts_total - posts_done
+    summary = {
+        'ranges_total': len(ranges),
+        'ranges_done': sum(1 for r in ranges if r['done']),
+        'posts_total': posts_total,
+        'posts_done': posts_done,
+        'posts_embedded': sum(r.get('embedded', 0) for r in ranges),
+        # Posts with neither content nor a title, never written
+        'posts_skipped': sum(len(r.get('skipped', [])) for r in ranges),
+        'percent': round(100 * posts_done / posts_total, 1) if posts_total else 100.0,
+        'complete': remaining == 0,
+        'failed_ranges': {key: r['error'] for key, r in checkpoint['ranges'].items() if r.get('error')},
+    }
+    if posts_per_second:
+        summary['posts_per_second'] = round(posts_per_second, 2)
+        summary['eta_seconds'] = round(remaining / posts_per_second)
+    return summary
+
+
+def log_progress(summary):
+    eta = summary.get('eta_seconds')
+    eta = f", ETA {eta // 3600}h{eta % 3600 // 60:02d}m{eta % 60:02d}s" if eta is not None else ''
+    print(
+        f"backfill: {summary['ranges_done']}/{summary['ranges_total']} ranges, "
+        f"{summary['posts_done']}/{summary['posts_total']} posts ({summary['percent']}%)"
+        f"{', %.1f posts/s' % summary['posts_per_second'] if 'posts_per_second' in summary else ''}{eta}",
+        file=sys.stderr, flush=True
+    )
+
+
+def backfill(settings) -> Dict[str, Any]:
+    checkpoint = prepare(settings)
+    path = os.path.join(backfill_dir(settings['db_path'], settings['table_name']), 'checkpoint.json')
+    pending = [(key, r['start'], settings) for key, r in checkpoint['ranges'].items() if not r['done']]
+    deadline = time.monotonic() + settings['max_seconds'] if settings['max_seconds'] else None
+
+    started = time.monotonic()
+    processed = 0
+    stopped_early = False
+    if pending:
+        pool = multiprocessing.get_context(START_METHOD).Pool(processes=min(settings['workers'], len(pending)))
+        try:
+            for result in pool.imap_unordered(run_range, pending):
+                entry = checkpoint['ranges'][result['key']]
+                if 'error' in result:
+                    entry['error'] = result['error']
+                else:
+                    entry.pop('error', None)
+                    entry.update(done=True, finished_at=time.time(), embedded=result['embedded'],
+                                 chunks=result['chunks'], skipped=result['skipped'], seconds=result['seconds'])
+                    processed += entry['posts']
+                save_checkpoint(path, checkpoint)
+                log_progress(summarize(checkpoint, processed / max(time.monotonic() - started, 1e-9)))
+                if deadline is not None and time.monotonic() >= deadline:
+                    # Ranges in flight are redone next run; their written posts are skipped
+                    stopped_early = True
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+
+    elapsed = time.monotonic() - started
+    summary = summarize(checkpoint, processed / elapsed if processed and elapsed > 0 else None)
+    summary['elapsed_seconds'] = round(elapsed, 3)
+    summary['stopped_early'] = stopped_early
+    return summary
+
+
+def main():
+    """Main function to run, inspect or reset a backfill"""
+    if len(sys.argv) < 2:
+        write_json({
+            'success': False,
+            'data': 'Usage: python backfill.py <input_file> [run|status|reset]'
+        })
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    command = sys.argv[2] if len(sys.argv) > 2 else 'run'
+    instr = Instrumentation('backfill')
+    instr.operation = command
+
+    try:
+        data = instr.read_input(input_file, json.load)
+        instr.enable_timings(data.get('timings', False))
+
+        config = load_config()
+        db_path = data.get('db_path', '/tmp/lancedb')
+        table_name = data.get('table_name', 'wordpress_posts')
+        directory = backfill_dir(db_path, table_name)
+
+        if command == 'status':
+            checkpoint = load_checkpoint(os.path.join(directory, 'checkpoint.json'))
+            result = {
+                'success': checkpoint is not None,
+                'data': summarize(checkpoint) if checkpoint else 'No backfill has been started'
+            }
+        elif command == 'reset':
+            shutil.rmtree(directory, ignore_errors=True)
+            result = {
+                'success': True,
+                'data': 'Backfill checkpoint removed'
+            }
+        elif command == 'run':
+            if not data.get('api_key'):
+                raise Exception('No API key provided')
+            if not data.get('posts_path'):
+                raise Exception('No posts_path provided')
+            settings = {
+                'posts_path': data['posts_path'],
+                'api_key': data['api_key'],
+                'db_path': db_path,
+                'table_name': table_name,
+                'model': data.get('model', config.embeddings_model),
+                'workers': max(1, int(data.get('workers', config.convert_workers))),
+                'range_size': max(1, int(data.get('range_size', DEFAULT_RANGE_SIZE))),
+                'max_seconds': data.get('max_seconds'),
+                'max_input_tokens': config.max_input_tokens,
+                'chunk_overlap_tokens': config.chunk_overlap_tokens,
+                'embed_workers': data.get('embed_workers', config.embed_workers),
+                'embed_batch_size': data.get('embed_batch_size', config.embed_batch_size),
+                'embed_batch_max_tokens': data.get('embed_batch_max_tokens', config.embed_batch_max_tokens),
+                'write_batch_size': data.get('write_batch_size', config.write_batch_size),
+                'queue_size': config.pipeline_queue_size,
+            }
+            result = {
+                'success': True,
+                'data': backfill(settings)
+            }
+        else:
+            result = {
+                'success': False,
+                'data': f'Unknown command: {command}'
+            }
+
+        instr.emit(result)
+
+    except Exception as e:
+        instr.emit({
+            'success': False,
+            'data': f'Error: {str(e)}'
+        })
+
+
+if __name__ == '__main__':
+    main()
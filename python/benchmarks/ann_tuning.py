@@ -0,0 +1,293 @@
+"""
+ANN index tuning harness for WP Fukami Lens AI.
+
+Measures recall against latency for vector index and search parameters on the
+embeddings already stored for a site, so `search_similar` can use the best trade-off
+for that corpus:
+
+1. Copy the ids, vectors and filter columns of the active posts table into a
+   scratch database (the site's table and its indexes are left alone).
+2. Sample `--queries` stored vectors as queries and compute their exact top-k by
+   brute force, in the table's distance metric (or `--metric`). A query's own row
+   is not counted as a neighbour.
+3. For every index configuration (type × partitions × sub-vectors), build the index,
+   recording build time and on-disk size, then run the queries for every search
+   configuration (nprobes × refine_factor, plus ef for HNSW indexes; an ef smaller
+   than the candidates a refined query asks for is skipped, LanceDB rejects it).
+
+Each result row holds recall@k, p50/p95/p99 latency and the index build time and size;
+`pareto` marks the rows no other row beats on both recall and p95 latency. The
+`flat` rows are the baselines without an index: LanceDB's own scan and the exact
+in-process search over the memory-mapped vector cache.
+
+Usage (from the python directory):
+    python3 -m benchmarks.ann_tuning --db-path=/path/to/lancedb [--table=wordpress_posts]
+        [--queries=200] [--k=10] [--index-types=IVF_PQ,IVF_HNSW_SQ]
+        [--partitions=16,64] [--sub-vectors=96,192] [--nprobes=1,5,10,20,50]
+        [--refine-factors=0,5,10] [--ef=40,100] [--metric=cosine|dot|l2]
+        [--output=results.json|results.csv]
+        [--keep-db]
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ["HF_HOME"] = "/tmp"
+os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
+os.environ["XDG_CACHE_HOME"] = "/tmp"
+
+import lancedb
+import numpy as np
+
+from benchmarks.run import latency_summary
+from config import load_config
+from main import parse_options
+from utils.embedding_state import load_state
+from utils.serialization import write_json
+from vector_cache import VectorCache
+
+DEFAULT_INDEX_TYPES = ('IVF_PQ', 'IVF_HNSW_SQ')
+DEFAULT_NPROBES = (1, 5, 10, 20, 50)
+DEFAULT_REFINE_FACTORS = (0, 5, 10)
+DEFAULT_EF = (40, 100)
+SCRATCH_TABLE = 'ann_tuning'
+
+CSV_COLUMNS = (
+    'index_type', 'num_partitions', 'num_sub_vectors', 'nprobes', 'refine_factor', 'ef',
+    'recall', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'build_seconds', 'index_bytes', 'pareto',
+)
+
+
+def int_list(value, default):
+    return [int(v) for v in value.split(',')] if value else list(default)
+
+
+def default_partitions(rows):
+    """Around sqrt(rows) partitions, plus half and double that."""
+    root = max(1, int(np.sqrt(rows)))
+    return sorted({max(1, root // 2), root, min(rows, root * 2)})
+
+
+def default_sub_vectors(dim):
+    """Sub-vector counts dividing `dim` into 16 and 8 dimensions each."""
+    return [n for n in (dim // 16, dim // 8) if n and dim % n == 0]
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+def ground_truth(vectors, sq_norms, query_rows, k, metric):
+    """Row indexes of the exact k nearest neighbours (in `metric`) of each query row."""
+    truth = []
+    for row in query_rows:
+        dots = vectors @ vectors[row]
+        if metric == 'l2':
+            distances = sq_norms - 2 * dots + sq_norms[row]
+        elif metric == 'cosine':
+            distances = 1 - dots / np.sqrt(np.maximum(sq_norms * sq_norms[row], 1e-30))
+        else:
+            distances = 1 - dots
+        distances[row] = np.inf
+        top = np.argpartition(distances, k)[:k]
+        truth.append(set(top[np.argsort(distances[top])].tolist()))
+    return truth
+
+
+def measure(search, queries, query_ids, truth_ids, k):
+    """Recall@k and latency of `search(vector, limit) -> ids` over the queries."""
+    samples, hits = [], 0
+    for vector, own_id, truth in zip(queries, query_ids, truth_ids):
+        started = time.perf_counter()
+        ids = search(vector, k + 1)
+        samples.append(time.perf_counter() - started)
+        found = [pid for pid in ids if pid != own_id][:k]
+        hits += len(truth & set(found))
+    result = latency_summary(samples)
+    result['recall'] = round(hits / (k * len(queries)), 4)
+    return result
+
+
+def mark_pareto(rows):
+    """Flag rows with no other row at least as good on recall and p95 and better on one."""
+    for row in rows:
+        row['pareto'] = not any(
+            other['recall'] >= row['recall'] and other['p95_ms'] <= row['p95_ms']
+            and (other['recall'] > row['recall'] or other['p95_ms'] < row['p95_ms'])
+            for other in rows
+        )
+    return rows
+
+
+def search_configs(index_type, nprobes, refine_factors, efs, limit):
+    for probes in nprobes:
+        for refine in refine_factors:
+            if 'HNSW' in index_type:
+                for ef in efs:
+                    if ef >= limit * max(refine, 1):
+                        yield {'nprobes': probes, 'refine_factor': refine, 'ef': ef}
+            else:
+                yield {'nprobes': probes, 'refine_factor': refine, 'ef': None}
+
+
+def run_index(table, table_dir, index_type, partitions, sub_vectors, options, queries, query_ids, truth_ids, k,
+              metric):
+    """Build one index and run every search configuration against it."""
+    params = {'num_partitions': partitions}
+    if 'PQ' in index_type:
+        params['num_sub_vectors'] = sub_vectors
+    started = time.perf_counter()
+    table.create_index(metric=metric, vector_column_name='embedding', index_type=index_type, replace=True, **params)
+    build_seconds = time.perf_counter() - started
+    index_bytes = directory_size(os.path.join(table_dir, '_indices'))
+    print(f'[ann] {index_type} partitions={partitions} sub_vectors={sub_vectors}: '
+          f'built in {build_seconds:.2f}s', file=sys.stderr)
+
+    rows = []
+    for config in search_configs(index_type, options['nprobes'], options['refine_factors'], options['ef'], k + 1):
+        def search(vector, limit):
+            query = (table.search(vector, vector_column_name='embedding').distance_type(metric)
+                     .limit(limit).nprobes(config['nprobes']))
+            if config['refine_factor']:
+                query = query.refine_factor(config['refine_factor'])
+            if config['ef']:
+                query = query.ef(config['ef'])
+            return query.select(['id']).to_arrow().column('id').to_pylist()
+
+        result = measure(search, queries, query_ids, truth_ids, k)
+        rows.append(dict(
+            index_type=index_type,
+            num_partitions=partitions,
+            num_sub_vectors=params.get('num_sub_vectors'),
+            build_seconds=round(build_seconds, 3),
+            index_bytes=index_bytes,
+            **config,
+            **result,
+        ))
+    return rows
+
+
+def write_csv(rows, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    args, options = parse_options(sys.argv[1:])
+    db_path = options.get('db-path', '/tmp/lancedb')
+    state = load_state(db_path, options.get('table', 'wordpress_posts'))
+    table_name = state['active_table']
+    metric = options.get('metric') or state['metric'] or load_config().distance_metric
+    k = int(options.get('k', 10))
+    rng = np.random.default_rng(int(options.get('seed', 0)))
+
+    source = lancedb.connect(db_path)
+    if table_name not in source.table_names():
+        write_json({
+            'success': False,
+            'data': f"No table '{table_name}' in {db_path}"
+        })
+        sys.exit(1)
+    data = (source.open_table(table_name).search().select(['id', 'embedding', 'date', 'categories'])
+            .limit(None).to_arrow())
+    embeddings = data.column('embedding').combine_chunks()
+    dim = embeddings.type.list_size
+    vectors = embeddings.flatten().to_numpy(zero_copy_only=False).astype(np.float32).reshape(-1, dim)
+    ids = np.asarray(data.column('id').to_pylist(), dtype=np.int64)
+    if len(ids) <= k + 1:
+        write_json({
+            'success': False,
+            'data': f'{len(ids)} rows are too few to measure recall@{k}'
+        })
+        sys.exit(1)
+
+    query_rows = rng.choice(len(ids), size=min(int(options.get('queries', 200)), len(ids)), replace=False)
+    queries = [vectors[row].tolist() for row in query_rows]
+    query_ids = ids[query_rows].tolist()
+    sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    print(f'[ann] ground truth for {len(query_rows)} queries over {len(ids)} rows', file=sys.stderr)
+    truth_ids = [{int(ids[row]) for row in rows} for rows in ground_truth(vectors, sq_norms, query_rows, k, metric)]
+
+    sweep = {
+        'index_types': options['index-types'].split(',') if options.get('index-types') else list(DEFAULT_INDEX_TYPES),
+        'partitions': int_list(options.get('partitions'), default_partitions(len(ids))),
+        'sub_vectors': int_list(options.get('sub-vectors'), default_sub_vectors(dim)),
+        'nprobes': int_list(options.get('nprobes'), DEFAULT_NPROBES),
+        'refine_factors': int_list(options.get('refine-factors'), DEFAULT_REFINE_FACTORS),
+        'ef': int_list(options.get('ef'), DEFAULT_EF),
+    }
+
+    scratch = tempfile.mkdtemp(prefix='fukami_lens_ann_')
+    results = []
+    try:
+        db = lancedb.connect(scratch)
+        table = db.create_table(SCRATCH_TABLE, data=data)
+        table_dir = os.path.join(scratch, f'{SCRATCH_TABLE}.lance')
+
+        flat = measure(
+            lambda vector, limit: table.search(vector, vector_column_name='embedding').distance_type(metric).limit(limit)
+            .select(['id']).to_arrow().column('id').to_pylist(),
+            queries, query_ids, truth_ids, k)
+        results.append(dict(index_type='flat', build_seconds=0.0, index_bytes=0, **flat))
+
+        cache = VectorCache(scratch, SCRATCH_TABLE)
+        started = time.perf_counter()
+        cache.load(table)
+        exact = measure(lambda vector, limit: cache.search(vector, limit, metric=metric)[0].tolist(),
+                        queries, query_ids, truth_ids, k)
+        results.append(dict(index_type='flat_mmap', build_seconds=round(time.perf_counter() - started, 3),
+                            index_bytes=directory_size(cache.directory), **exact))
+
+        for index_type in sweep['index_types']:
+            for partitions in sweep['partitions']:
+                for sub_vectors in (sweep['sub_vectors'] if 'PQ' in index_type else [None]):
+                    try:
+                        results.extend(run_index(table, table_dir, index_type, partitions, sub_vectors, sweep,
+                                                 queries, query_ids, truth_ids, k, metric))
+                    except Exception as e:
+                        # e.g. too few rows to train this many partitions
+                        print(f'[ann] {index_type} partitions={partitions} sub_vectors={sub_vectors}: {e}',
+                              file=sys.stderr)
+    finally:
+        if 'keep-db' in options:
+            print(f'[ann] scratch database kept at {scratch}', file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    mark_pareto(results)
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'db_path': db_path,
+            'table_name': table_name,
+            'rows': len(ids),
+            'dim': dim,
+            'metric': metric,
+            'k': k,
+            'queries': len(query_rows),
+            'sweep': sweep,
+        },
+        'results': results,
+    }
+
+    output = options.get('output')
+    if output and output.endswith('.csv'):
+        write_csv(results, output)
+    elif output:
+        with open(output, 'w', encoding='utf-8') as f:
+            write_json({'success': True, 'data': report}, f)
+    else:
+        write_json({'success': True, 'data': report})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Synthetic WordPress corpus for benchmarks.
+
+Generates posts in the same shape as the plugin's posts.json export (see models/post.py):
+a mix of English and Japanese posts of varied length, with headings, lists, categories
+and tags. Output is deterministic for a given seed.
+
+Usage:
+    python3 -m benchmarks.corpus <count> <output.json> [seed]
+"""
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+EN_WORDS = (
+    'search index vector embedding post archive plugin content query result model token '
+    'chunk page site theme author editor update draft publish database latency cache '
+    'server request response category tag feature release guide review summary'
+).split()
+
+JA_SENTENCES = [
+    '今日は新しい記事を公開しました。',
+    'このプラグインは検索を改善します。',
+    'ベクトル検索の仕組みについて説明します。',
+    '東京の天気は晴れでした。',
+    '詳しくは以下のリンクをご覧ください！',
+    'なぜこの方法が速いのでしょうか？',
+    'データベースの更新には時間がかかります。',
+    '読者の皆様、いつもありがとうございます。',
+]
+
+CATEGORIES = [
+    'News', 'Tutorials', 'Reviews', 'Events', 'Engineering', 'Design', 'Business', 'Travel',
+    'お知らせ', 'チュートリアル', 'レビュー', 'イベント', '技術', 'デザイン', '旅行', '日記',
+]
+
+TAGS = [f'tag-{i}' for i in range(60)] + [f'タグ{i}' for i in range(40)]
+
+# Paragraph counts for short, medium and long posts, and how often each occurs
+LENGTHS = ((2, 0.5), (8, 0.35), (30, 0.15))
+
+
+def _english_sentence(rng):
+    words = rng.choices(EN_WORDS, k=rng.randint(6, 18))
+    return ' '.join(words).capitalize() + rng.choice('..!?')
+
+
+def _paragraph(rng, japanese):
+    if japanese:
+        return ''.join(rng.choices(JA_SENTENCES, k=rng.randint(2, 6)))
+    return ' '.join(_english_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def _content(rng, japanese, paragraphs):
+    parts = []
+    for i in range(paragraphs):
+        if i and i % 4 == 0:
+            heading = '見出し' if japanese else 'Section'
+            parts.append(f'<h2>{heading} {i // 4}</h2>')
+        if rng.random() < 0.1:
+            items = ''.join(f'<li>{_paragraph(rng, japanese)[:60]}</li>' for _ in range(rng.randint(2, 5)))
+            parts.append(f'<ul>{items}</ul>')
+        parts.append(f'<p>{_paragraph(rng, japanese)}</p>')
+    return '\n'.join(parts)
+
+
+def generate_post(post_id, rng, start=datetime(2015, 1, 1)):
+    """One post in WordPress export format; roughly 40% Japanese."""
+    japanese = rng.random() < 0.4
+    paragraphs = rng.choices([n for n, _ in LENGTHS], weights=[w for _, w in LENGTHS])[0]
+    date = start + timedelta(minutes=rng.randint(0, 10 * 365 * 24 * 60))
+    title = (JA_SENTENCES[post_id % len(JA_SENTENCES)].rstrip('。！？') if japanese
+             else _english_sentence(rng).rstrip('.!?'))
+    return {
+        'ID': post_id,
+        'title': {'rendered': title},
+        'date': date.strftime('%Y-%m-%dT%H:%M:%S'),
+        'content': {'rendered': _content(rng, japanese, paragraphs)},
+        'permalink': f'https://example.com/?p={post_id}',
+        'categories': rng.sample(CATEGORIES, rng.randint(1, 3)),
+        'tags': rng.sample(TAGS, rng.randint(0, 5)),
+    }
+
+
+def generate_posts(count, seed=0):
+    """Yield `count` synthetic posts with IDs 1..count."""
+    rng = random.Random(seed)
+    for post_id in range(1, count + 1):
+        yield generate_post(post_id, rng)
+
+
+def write_corpus(path, count, seed=0):
+    """Write a posts.json export, one post at a time."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for i, post in enumerate(generate_posts(count, seed)):
+            if i:
+                f.write(',\n')
+            json.dump(post, f, ensure_ascii=False)
+        f.write(']\n')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: python3 -m benchmarks.corpus <count> <output.json> [seed]')
+        sys.exit(1)
+    write_corpus(sys.argv[2], int(sys.argv[1]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
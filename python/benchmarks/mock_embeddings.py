@@ -0,0 +1,142 @@
+"""
+Local stand-in for the OpenAI `/v1/embeddings` endpoint.
+
+Returns deterministic unit vectors (seeded by a hash of each input) after a configurable
+latency, and can answer a fraction of requests with 429 to exercise client retries.
+Point the plugin at it with FUKAMI_LENS_OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage:
+    python3 -m benchmarks.mock_embeddings [port] [latency_ms] [rate_limit_ratio]
+"""
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 1536
+
+
+def fake_embedding(text, dimensions=DEFAULT_DIMENSIONS):
+    """Deterministic unit vector for `text`."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimensions, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class MockEmbeddingsServer:
+    """Threaded HTTP server answering POST /v1/embeddings.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        latency_ms: Delay added to every response
+        rate_limit_ratio: Fraction of requests answered with 429
+        dimensions: Embedding dimension
+        seed: Seed for choosing which requests are rate limited
+    """
+
+    def __init__(self, port=0, latency_ms=50, rate_limit_ratio=0.0,
+                 dimensions=DEFAULT_DIMENSIONS, seed=0):
+        self.latency_ms = latency_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.dimensions = dimensions
+        self.requests = 0
+        self.rate_limited = 0
+        self.inputs = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/v1'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/v1/embeddings':
+                    self._send(404, {'error': {'message': 'Not found'}})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                texts = body.get('input', [])
+                if isinstance(texts, str):
+                    texts = [texts]
+
+                with server._lock:
+                    server.requests += 1
+                    limited = server._rng.random() < server.rate_limit_ratio
+                    if limited:
+                        server.rate_limited += 1
+                    else:
+                        server.inputs += len(texts)
+                time.sleep(server.latency_ms / 1000)
+                if limited:
+                    self._send(429, {'error': {'message': 'Rate limit reached'}}, [('Retry-After', '0')])
+                    return
+
+                self._send(200, {
+                    'object': 'list',
+                    'model': body.get('model', ''),
+                    'data': [
+                        {'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, server.dimensions).tolist()}
+                        for i, text in enumerate(texts)
+                    ],
+                    'usage': {'prompt_tokens': 0, 'total_tokens': 0},
+                })
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'inputs': self.inputs,
+        }
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    server = MockEmbeddingsServer(port, latency, ratio)
+    print(f'Serving mock embeddings at {server.base_url} (latency {latency} ms, 429 ratio {ratio})')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,301 @@
+"""
+Benchmark runner for WP Fukami Lens AI.
+
+Runs each scenario against a synthetic corpus (benchmarks/corpus.py) at every requested
+size and writes the results as JSON, so runs can be compared over time. Embeddings
+are served by a local mock of the OpenAI API (benchmarks/mock_embeddings.py); the
+database scenarios use a throwaway LanceDB directory.
+
+Usage (from the python directory):
+    python3 -m benchmarks.run [--sizes=1000,10000,100000] [--scenarios=a,b,...]
+                              [--stage-limit=10000] [--latency-ms=50] [--rate-limit-ratio=0.05]
+                              [--output=results.json] [--keep-db]
+
+Scenarios: conversion, chunking, embedding, upsert_embeddings, search_similar,
+check_existing_embeddings, get_paginated_data. Conversion, chunking and embedding use
+at most --stage-limit posts per size; the database scenarios use every row.
+"""
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+os.environ["HF_HOME"] = "/tmp"
+os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
+os.environ["XDG_CACHE_HOME"] = "/tmp"
+
+import numpy as np
+
+from benchmarks.corpus import generate_posts
+from benchmarks.mock_embeddings import MockEmbeddingsServer
+from config import load_config
+from main import parse_options
+from utils.serialization import write_json
+
+SCENARIOS = (
+    'conversion',
+    'chunking',
+    'embedding',
+    'upsert_embeddings',
+    'search_similar',
+    'check_existing_embeddings',
+    'get_paginated_data',
+)
+DB_SCENARIOS = SCENARIOS[3:]
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+EMBEDDING_DIMENSIONS = 1536
+UPSERT_BATCH_SIZE = 500
+SEARCH_QUERIES = 100
+CHECK_CALLS = 20
+CHECK_IDS_PER_CALL = 500
+
+
+def latency_summary(samples):
+    """p50/p95/p99/mean of per-call latencies, in ms."""
+    ms = np.asarray(samples) * 1000
+    return {
+        'calls': len(samples),
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3),
+    }
+
+
+def throughput(count, seconds, unit):
+    return {
+        unit: count,
+        'seconds': round(seconds, 3),
+        f'{unit}_per_sec': round(count / seconds, 2) if seconds > 0 else None,
+    }
+
+
+def random_unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_conversion(posts, config):
+    from chunking.post_chunker import render_post_html
+    from conversion.html_to_markdown import convert_posts
+    from models.post import Post
+
+    htmls = [render_post_html(Post(post)) for post in posts]
+    started = time.perf_counter()
+    markdowns = list(convert_posts(htmls, workers=config.convert_workers,
+                                   max_posts_per_worker=config.convert_max_posts_per_worker))
+    result = throughput(len(markdowns), time.perf_counter() - started, 'posts')
+    result['workers'] = config.convert_workers
+    return result, markdowns
+
+
+def bench_chunking(markdowns, config):
+    from chunking.post_chunker import PostChunker
+
+    chunker = PostChunker(config.max_input_tokens, config.embeddings_model, overlap=config.chunk_overlap_tokens)
+    started = time.perf_counter()
+    chunks = [chunk for markdown in markdowns for chunk in chunker.chunk_markdown(markdown)]
+    seconds = time.perf_counter() - started
+    result = throughput(len(markdowns), seconds, 'posts')
+    tokens = sum(chunk['tokens'] for chunk in chunks)
+    result.update({
+        'chunks': len(chunks),
+        'tokens': tokens,
+        'tokens_per_sec': round(tokens / seconds, 2) if seconds > 0 else None,
+    })
+    return result, [chunk['contextualized'] for chunk in chunks]
+
+
+def bench_embedding(texts, server, config):
+    from get_embedding import get_openai_embeddings
+
+    batches = [texts[i:i + config.embed_batch_size] for i in range(0, len(texts), config.embed_batch_size)]
+    before = server.stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=config.embed_workers) as pool:
+        list(pool.map(lambda batch: get_openai_embeddings(batch, config.embeddings_model, 'benchmark', backoff=0.01),
+                      batches))
+    result = throughput(len(texts), time.perf_counter() - started, 'inputs')
+    after = server.stats()
+    result.update({
+        'workers': config.embed_workers,
+        'batch_size': config.embed_batch_size,
+        'requests': after['requests'] - before['requests'],
+        'rate_limited': after['rate_limited'] - before['rate_limited'],
+        'latency_ms': server.latency_ms,
+    })
+    return result
+
+
+def bench_upsert(manager, posts, rng):
+    from pipeline import strip_tags
+
+    started = time.perf_counter()
+    for i in range(0, len(posts), UPSERT_BATCH_SIZE):
+        batch = [{
+            'id': post['ID'],
+            'title': post['title']['rendered'],
+            'content': strip_tags(post['content']['rendered']),
+            'date': post['date'],
+            'permalink': post['permalink'],
+            'categories': post['categories'],
+            'tags': post['tags'],
+        } for post in posts[i:i + UPSERT_BATCH_SIZE]]
+        result = manager.upsert_embeddings(batch, random_unit_vectors(rng, len(batch)).tolist())
+        if not result['success']:
+            raise Exception(result['data'])
+    result = throughput(len(posts), time.perf_counter() - started, 'rows')
+    result['batch_size'] = UPSERT_BATCH_SIZE
+    return result
+
+
+def bench_search(manager, rng):
+    samples = []
+    for vector in random_unit_vectors(rng, SEARCH_QUERIES):
+        started = time.perf_counter()
+        result = manager.search_similar(vector.tolist(), 5)
+        samples.append(time.perf_counter() - started)
+        if not result['success']:
+            raise Exception(result['data'])
+    return latency_summary(samples)
+
+
+def bench_check_existing(manager, size, rng):
+    samples = []
+    for _ in range(CHECK_CALLS):
+        # Half of the ids exist, half do not
+        ids = [int(i) for i in rng.integers(1, size * 2 + 1, CHECK_IDS_PER_CALL)]
+        started = time.perf_counter()
+        result = manager.check_existing_embeddings(ids)
+        samples.append(time.perf_counter() - started)
+        if not result['success']:
+            raise Exception(result['data'])
+    summary = latency_summary(samples)
+    summary['ids_per_call'] = CHECK_IDS_PER_CALL
+    return summary
+
+
+def bench_paginated(db_path, table_name, size):
+    from view_database import DatabaseViewer
+
+    viewer = DatabaseViewer(db_path, table_name)
+    per_page = 20
+    last_page = max(1, -(-size // per_page))
+    cases = {
+        'first_page': {'page': 1},
+        'middle_page': {'page': max(1, last_page // 2)},
+        'last_page': {'page': last_page},
+        'search': {'page': 1, 'search': 'vector'},
+    }
+    results = {}
+    for name, args in cases.items():
+        samples = []
+        for _ in range(5):
+            started = time.perf_counter()
+            result = viewer.get_paginated_data(per_page=per_page, **args)
+            samples.append(time.perf_counter() - started)
+            if not result['success']:
+                raise Exception(result['data'])
+        results[name] = latency_summary(samples)
+    return results
+
+
+def run_size(size, scenarios, config, server, stage_limit, keep_db):
+    results = {}
+    rng = np.random.default_rng(size)
+    stage_posts = list(generate_posts(min(size, stage_limit))) if stage_limit else list(generate_posts(size))
+
+    markdowns = None
+    texts = None
+    if 'conversion' in scenarios or 'chunking' in scenarios:
+        results['conversion'], markdowns = bench_conversion(stage_posts, config)
+        if 'conversion' not in scenarios:
+            del results['conversion']
+    if 'chunking' in scenarios:
+        results['chunking'], texts = bench_chunking(markdowns, config)
+    if 'embedding' in scenarios:
+        if texts is None:
+            from pipeline import strip_tags
+            texts = [post['title']['rendered'] + '\n' + strip_tags(post['content']['rendered'])[:2000]
+                     for post in stage_posts]
+        results['embedding'] = bench_embedding(texts, server, config)
+
+    if any(name in scenarios for name in DB_SCENARIOS):
+        from lancedb_operations import LanceDBManager
+
+        db_path = tempfile.mkdtemp(prefix=f'fukami-bench-{size}-')
+        try:
+            manager = LanceDBManager(db_path, 'wordpress_posts')
+            upsert = bench_upsert(manager, list(generate_posts(size)), rng)
+            if 'upsert_embeddings' in scenarios:
+                results['upsert_embeddings'] = upsert
+            if 'search_similar' in scenarios:
+                results['search_similar'] = bench_search(manager, rng)
+            if 'check_existing_embeddings' in scenarios:
+                results['check_existing_embeddings'] = bench_check_existing(manager, size, rng)
+            if 'get_paginated_data' in scenarios:
+                results['get_paginated_data'] = bench_paginated(db_path, 'wordpress_posts', size)
+        finally:
+            if keep_db:
+                results['db_path'] = db_path
+            else:
+                shutil.rmtree(db_path, ignore_errors=True)
+    return results
+
+
+def main():
+    args, options = parse_options(sys.argv[1:])
+    sizes = [int(s) for s in options['sizes'].split(',')] if options.get('sizes') else list(DEFAULT_SIZES)
+    scenarios = options['scenarios'].split(',') if options.get('scenarios') else list(SCENARIOS)
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        write_json({
+            'success': False,
+            'data': f'Unknown scenarios: {", ".join(unknown)}'
+        })
+        sys.exit(1)
+    stage_limit = int(options.get('stage-limit', 10000))
+    config = load_config()
+
+    server = MockEmbeddingsServer(
+        latency_ms=float(options.get('latency-ms', 50)),
+        rate_limit_ratio=float(options.get('rate-limit-ratio', 0.0)),
+    ).start()
+    os.environ['FUKAMI_LENS_OPENAI_BASE_URL'] = server.base_url
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sizes': sizes,
+            'scenarios': scenarios,
+            'stage_limit': stage_limit,
+            'max_input_tokens': config.max_input_tokens,
+            'embeddings_model': config.embeddings_model,
+        },
+        'results': {},
+    }
+    try:
+        for size in sizes:
+            print(f'[bench] {size} rows', file=sys.stderr)
+            report['results'][str(size)] = run_size(size, scenarios, config, server, stage_limit,
+                                                    'keep-db' in options)
+    finally:
+        server.stop()
+
+    if options.get('output'):
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            write_json({'success': True, 'data': report}, f)
+    else:
+        write_json({'success': True, 'data': report})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Persistent per-post chunk cache.
+
+Stores the converted Markdown and the chunks of every post in a SQLite file so
+unchanged posts skip Docling conversion and chunking on the next run. Entries are
+keyed by post id plus a hash of the rendered HTML, the tokenizer encoding and
+`max_input_tokens`; the whole cache is dropped when the chunker config changes.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Bump when the cached chunk format changes
+CACHE_VERSION = 3
+
+# Entries written before an automatic commit
+COMMIT_EVERY = 100
+
+DEFAULT_CACHE_PATH = os.path.normpath(os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'data', 'chunk_cache.sqlite3'
+))
+
+
+def content_hash(html, encoding, max_tokens):
+    """Hash of everything that determines a post's chunks."""
+    h = hashlib.sha256()
+    h.update(f"{CACHE_VERSION}\0{encoding}\0{max_tokens}\0".encode('utf-8'))
+    h.update(html.encode('utf-8'))
+    return h.hexdigest()
+
+
+class ChunkCache:
+    """SQLite-backed cache of per-post Markdown and chunks."""
+
+    def __init__(self, path=None, config_fingerprint=''):
+        self.path = path or os.environ.get('FUKAMI_LENS_CHUNK_CACHE', DEFAULT_CACHE_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # The pipeline opens the cache on the main thread and chunks on a worker thread
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' post_id TEXT PRIMARY KEY,'
+            ' content_hash TEXT NOT NULL,'
+            ' markdown TEXT NOT NULL,'
+            ' chunks TEXT NOT NULL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.invalidated = 0
+
+        # Drop everything cached under a different chunker config
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+        if row is None or row[0] != config_fingerprint:
+            if row is not None:
+                self.invalidate()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('config', ?)", (config_fingerprint,)
+            )
+            self.conn.commit()
+
+    def get(self, post_id, key):
+        """Return the cached entry {'markdown', 'chunks'} if `key` still matches, else None."""
+        row = self.conn.execute(
+            'SELECT content_hash, markdown, chunks FROM entries WHERE post_id = ?', (str(post_id),)
+        ).fetchone()
+        if row is None or row[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'markdown': row[1], 'chunks': json.loads(row[2])}
+
+    def put(self, post_id, key, markdown, chunks):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO entries (post_id, content_hash, markdown, chunks, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?)',
+            (str(post_id), key, markdown, json.dumps(chunks, ensure_ascii=False), time.time())
+        )
+        self.stored += 1
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def invalidate(self):
+        """Remove every cached entry."""
+        cur = self.conn.execute('DELETE FROM entries')
+        self.invalidated += cur.rowcount
+        self.conn.commit()
+
+    def stats(self):
+        entries = self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stored': self.stored,
+            'invalidated': self.invalidated,
+            'entries': entries,
+            'path': self.path,
+        }
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
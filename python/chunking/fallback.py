@@ -0,0 +1,102 @@
+"""
+Token-offset fallback chunker (used when Docling is not available).
+
+Each document is encoded once. Chunks are cut on token offsets at the last sentence
+boundary that fits in `max_tokens` (Japanese `。！？` as well as `.!?` and line breaks),
+so long paragraphs without line breaks are still split, and no chunk ever exceeds
+the limit. Consecutive chunks can share `overlap` tokens.
+"""
+import bisect
+import re
+
+# Sentence terminators, optionally followed by closing brackets/quotes, or a line break.
+# A '.' only ends a sentence when followed by whitespace, so decimals and URLs are kept whole.
+SENTENCE_END_RE = re.compile(
+    r'(?:[。！？!?．｡…]+|\.+(?=\s|$))[」』）】〉》)\]"\'”’]*|\n'
+)
+
+
+class TokenChunker:
+    """Splits text into chunks of at most `max_tokens` tokens."""
+
+    def __init__(self, encoding, max_tokens, overlap=0):
+        """
+        Args:
+            encoding: A tiktoken Encoding
+            max_tokens: Maximum number of tokens per chunk
+            overlap: Number of tokens repeated at the start of the next chunk
+        """
+        if max_tokens < 1:
+            raise ValueError('max_tokens must be at least 1')
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.overlap = max(0, min(overlap, max_tokens - 1))
+
+    def _offsets(self, tokens):
+        """Character offset of every token, plus which tokens start mid-character."""
+        offsets = []
+        splits_char = []
+        text_len = 0
+        for token in self.encoding.decode_tokens_bytes(tokens):
+            continuation = 0x80 <= token[0] < 0xC0
+            offsets.append(text_len - continuation if continuation else text_len)
+            splits_char.append(continuation)
+            text_len += sum(1 for c in token if not 0x80 <= c < 0xC0)
+        offsets.append(text_len)
+        splits_char.append(False)
+        return offsets, splits_char
+
+    def iter_chunks(self, text):
+        """Yield {'text', 'tokens', 'start', 'end'} dicts; start/end are character offsets."""
+        tokens = self.encoding.encode_ordinary(text)
+        n = len(tokens)
+        if n == 0:
+            return
+        offsets, splits_char = self._offsets(tokens)
+
+        # Token indices at which a sentence boundary allows a cut
+        cuts = []
+        for m in SENTENCE_END_RE.finditer(text):
+            cut = bisect.bisect_left(offsets, m.end())
+            if 0 < cut < n and not splits_char[cut] and (not cuts or cuts[-1] != cut):
+                cuts.append(cut)
+
+        start = 0
+        prev_end = 0
+        while start < n:
+            limit = start + self.max_tokens
+            if limit >= n:
+                end = n
+            else:
+                # Only a boundary past the previous chunk's end: with overlap, its cut
+                # is still ahead of `start` and would be picked again
+                j = bisect.bisect_right(cuts, limit) - 1
+                if j >= 0 and cuts[j] > max(start, prev_end):
+                    end = cuts[j]
+                else:
+                    # No boundary fits: hard cut, without splitting a multi-byte character
+                    end = limit
+                    while end > start + 1 and splits_char[end]:
+                        end -= 1
+            yield {
+                'text': text[offsets[start]:offsets[end]],
+                'tokens': end - start,
+                'start': offsets[start],
+                'end': offsets[end],
+            }
+            if end >= n:
+                break
+            prev_end = end
+            next_start = max(end - self.overlap, start + 1)
+            while next_start < end and splits_char[next_start]:
+                next_start += 1
+            start = next_start
+
+    def chunk(self, text):
+        """Return the chunks of `text` as a list."""
+        return list(self.iter_chunks(text))
+
+
+def chunk_text(text, encoding, max_tokens, overlap=0):
+    """Chunk `text` with a tiktoken `encoding`; see TokenChunker."""
+    return TokenChunker(encoding, max_tokens, overlap).chunk(text)
@@ -0,0 +1,193 @@
+"""
+Per-post chunking with provenance.
+
+Every post is converted and chunked on its own, so chunks never straddle two posts
+and memory stays flat regardless of how many posts are processed. Chunks are
+yielded as soon as they are produced, each carrying the id, permalink and heading
+path of the post it came from.
+"""
+import importlib.util
+import re
+from collections import deque
+
+from chunking.cache import content_hash
+from chunking.fallback import TokenChunker
+from chunking.tokenizer import build_hybrid_chunker, get_tokenizer
+from conversion.html_to_markdown import convert_document, convert_posts
+from utils import instrumentation
+from utils.yaml_utils import build_yaml_front_matter
+
+# Marks the end of the converted posts
+_END = object()
+
+# Docling's HybridChunker is used when installed (imported in build_hybrid_chunker)
+try:
+    DOCLING_AVAILABLE = importlib.util.find_spec('docling.chunking') is not None
+except ImportError:
+    # find_spec imports the parent package, which is missing
+    DOCLING_AVAILABLE = False
+
+HEADING_RE = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t]*#*[ \t]*$', re.MULTILINE)
+
+
+def render_post_html(post):
+    """Return the post HTML with a canonical link added for Docling provenance."""
+    content_html = post.content
+    if '<head>' in content_html:
+        return content_html.replace(
+            '<head>',
+            f'<head>\n<link rel="canonical" href="{post.permalink}">',
+            1
+        )
+    # If no <head>, prepend it
+    return f'<head><link rel="canonical" href="{post.permalink}"></head>\n' + content_html
+
+
+class PostChunker:
+    """Chunks posts one at a time, reusing cached chunks for unchanged posts."""
+
+    def __init__(self, max_input_tokens, embeddings_model, cache=None,
+                 workers=None, max_posts_per_worker=None, overlap=0):
+        self.max_input_tokens = max_input_tokens
+        self.embeddings_model = embeddings_model
+        self.overlap = overlap
+        self.workers = workers
+        self.max_posts_per_worker = max_posts_per_worker
+
+        if DOCLING_AVAILABLE:
+            # Load our custom tokenizer for OpenAI
+            self.tokenizer = get_tokenizer(embeddings_model)
+            self.enc = self.tokenizer.tokenizer
+            self.chunker = build_hybrid_chunker(self.tokenizer, max_input_tokens)
+        else:
+            import tiktoken
+            self.tokenizer = None
+            self.enc = tiktoken.encoding_for_model(embeddings_model)
+            self.chunker = TokenChunker(self.enc, max_input_tokens, overlap)
+        self.encoding = self.enc.name
+        self.cache = cache
+
+    @property
+    def config_fingerprint(self):
+        chunker_name = 'docling' if DOCLING_AVAILABLE else 'tiktoken'
+        return f'{chunker_name}:{self.encoding}:{self.max_input_tokens}:{self.overlap}'
+
+    def iter_document_chunks(self, doc):
+        """Yield the chunks of a DoclingDocument with HybridChunker, one at a time."""
+        for chunk in self.chunker.chunk(dl_doc=doc):
+            headings = getattr(getattr(chunk, 'meta', None), 'headings', None) or []
+            contextualized = self.chunker.contextualize(chunk=chunk)
+            yield {
+                'text': chunk.text,
+                'tokens': self.tokenizer.count_tokens(chunk.text),
+                'contextualized': contextualized,
+                'contextualized_tokens': self.tokenizer.count_tokens(contextualized),
+                'heading_path': list(headings),
+            }
+
+    def chunk_document(self, doc):
+        """Chunk a DoclingDocument with HybridChunker."""
+        return list(self.iter_document_chunks(doc))
+
+    def chunk_markdown(self, markdown, permalink=''):
+        """Chunk one post's Markdown.
+
+        Returns a list of {'text', 'tokens', 'contextualized', 'contextualized_tokens',
+        'heading_path'} dicts.
+        """
+        if DOCLING_AVAILABLE:
+            doc = convert_document(markdown, 'post.md')
+            # --- Set doc.origin.uri to the post's own permalink ---
+            if permalink and hasattr(doc, 'origin') and hasattr(doc.origin, 'uri'):
+                doc.origin.uri = permalink
+            return self.chunk_document(doc)
+        return self._chunk_tokens(markdown)
+
+    def iter_html_chunks(self, html):
+        """Yield the chunks of a single HTML document (Docling), or of its raw text with
+        the fallback chunker, as each is produced."""
+        if DOCLING_AVAILABLE:
+            return self.iter_document_chunks(convert_document(html, 'post.html'))
+        return self._iter_token_chunks(html)
+
+    def chunk_html(self, html):
+        """Chunk a single HTML document (Docling), or its raw text with the fallback chunker."""
+        return list(self.iter_html_chunks(html))
+
+    def _chunk_tokens(self, markdown):
+        return list(self._iter_token_chunks(markdown))
+
+    def _iter_token_chunks(self, markdown):
+        """Fallback: token-offset chunking, tracking the Markdown heading path."""
+        headings = [(m.start(), len(m.group(1)), m.group(2)) for m in HEADING_RE.finditer(markdown)]
+        stack = []
+        h = 0
+        for chunk in self.chunker.iter_chunks(markdown):
+            # Apply every heading that starts at or before this chunk
+            while h < len(headings) and headings[h][0] <= chunk['start']:
+                _, level, text = headings[h]
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, text))
+                h += 1
+            heading_path = [text for _, text in stack]
+            # Same shape as HybridChunker.contextualize(): headings, then the text
+            contextualized = '\n'.join(heading_path + [chunk['text']])
+            yield {
+                'text': chunk['text'],
+                'tokens': chunk['tokens'],
+                'contextualized': contextualized,
+                'contextualized_tokens': (
+                    chunk['tokens'] if not heading_path else len(self.enc.encode_ordinary(contextualized))
+                ),
+                'heading_path': heading_path,
+            }
+
+    def iter_chunks(self, posts):
+        """Yield chunk records for `posts` (an iterable of models.post.Post) in post order."""
+        pending = deque()
+
+        def htmls():
+            for post in posts:
+                front_matter = build_yaml_front_matter(post)
+                html = render_post_html(post)
+                key = content_hash(front_matter + post.title + html, self.encoding, self.max_input_tokens)
+                entry = self.cache.get(post.id, key) if self.cache is not None else None
+                pending.append((post, front_matter, key, entry))
+                # Cached posts skip conversion entirely
+                yield html if entry is None else None
+
+        markdowns = iter(convert_posts(
+            htmls(),
+            workers=self.workers,
+            max_posts_per_worker=self.max_posts_per_worker,
+        ))
+        while True:
+            # Time spent here is conversion (or waiting on the conversion workers)
+            with instrumentation.stage('convert'):
+                body = next(markdowns, _END)
+            if body is _END:
+                break
+            post, front_matter, key, entry = pending.popleft()
+            if entry is None:
+                md = front_matter + f'# {post.title}\n\n' + body
+                with instrumentation.stage('chunk'):
+                    entry = {'markdown': md, 'chunks': self.chunk_markdown(md, post.permalink)}
+                if self.cache is not None:
+                    self.cache.put(post.id, key, md, entry['chunks'])
+            instrumentation.count('posts', 1)
+            instrumentation.count('chunks', len(entry['chunks']))
+            for index, chunk in enumerate(entry['chunks']):
+                yield {
+                    'post_id': post.id,
+                    'chunk_index': index,
+                    'title': post.title,
+                    'permalink': post.permalink,
+                    'heading_path': chunk['heading_path'],
+                    'tokens': chunk['tokens'],
+                    'text': chunk['text'],
+                    'contextualized_tokens': chunk['contextualized_tokens'],
+                    'contextualized': chunk['contextualized'],
+                }
+        if self.cache is not None:
+            self.cache.commit()
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from utils.tokenizer import OpenAITokenizerWrapper
 
 MODEL_TO_ENCODING = {
@@ -6,9 +8,26 @@ MODEL_TO_ENCODING = {
     "text-embedding-ada-002": "cl100k_base",
     "gpt-3.5-turbo": "cl100k_base",
     "gpt-4": "cl100k_base",
+    "gpt-4o": "o200k_base",
+    "gpt-4o-mini": "o200k_base",
     # Add more mappings as needed
 }
 
+@lru_cache(maxsize=None)
+def _tokenizer_for_encoding(encoding):
+    return OpenAITokenizerWrapper(model_name=encoding)
+
 def get_tokenizer(model_name):
+    # One wrapper per encoding, so its vocab and token-count cache are shared
     encoding = MODEL_TO_ENCODING.get(model_name, "cl100k_base")
-    return OpenAITokenizerWrapper(model_name=encoding) 
\ No newline at end of file
+    return _tokenizer_for_encoding(encoding)
+
+def build_hybrid_chunker(tokenizer, max_tokens, merge_peers=True):
+    """Create a Docling HybridChunker that counts tokens through `tokenizer`'s cache."""
+    from docling.chunking import HybridChunker
+
+    chunker_tokenizer = tokenizer.chunker_tokenizer(max_tokens)
+    if chunker_tokenizer is tokenizer:
+        # Older Docling: HuggingFace-style tokenizer plus max_tokens
+        return HybridChunker(tokenizer=tokenizer, max_tokens=max_tokens, merge_peers=merge_peers)
+    return HybridChunker(tokenizer=chunker_tokenizer, merge_peers=merge_peers)
\ No newline at end of file
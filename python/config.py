@@ -4,6 +4,22 @@ class Config:
     def __init__(self):
         self.max_input_tokens = int(os.environ.get("FUKAMI_LENS_RAG_MAX_INPUT_TOKENS", 8191))
         self.embeddings_model = os.environ.get("FUKAMI_LENS_RAG_EMBEDDINGS_MODEL", "text-embedding-3-small")
+        self.convert_workers = int(os.environ.get("FUKAMI_LENS_CONVERT_WORKERS", os.cpu_count() or 1))
+        self.chunk_overlap_tokens = int(os.environ.get("FUKAMI_LENS_CHUNK_OVERLAP_TOKENS", 0))
+        self.convert_max_posts_per_worker = int(os.environ.get("FUKAMI_LENS_CONVERT_MAX_POSTS_PER_WORKER", 200))
+        self.embed_workers = int(os.environ.get("FUKAMI_LENS_EMBED_WORKERS", 4))
+        self.embed_batch_size = int(os.environ.get("FUKAMI_LENS_EMBED_BATCH_SIZE", 128))
+        self.embed_batch_max_tokens = int(os.environ.get("FUKAMI_LENS_EMBED_BATCH_MAX_TOKENS", 250000))
+        self.write_batch_size = int(os.environ.get("FUKAMI_LENS_WRITE_BATCH_SIZE", 500))
+        self.pipeline_queue_size = int(os.environ.get("FUKAMI_LENS_PIPELINE_QUEUE_SIZE", 8))
+        self.queue_linger_ms = int(os.environ.get("FUKAMI_LENS_QUEUE_LINGER_MS", 500))
+        self.semantic_cache_threshold = float(os.environ.get("FUKAMI_LENS_SEMANTIC_CACHE_THRESHOLD", 0.95))
+        self.semantic_cache_ttl = int(os.environ.get("FUKAMI_LENS_SEMANTIC_CACHE_TTL", 86400))
+        self.semantic_cache_max_entries = int(os.environ.get("FUKAMI_LENS_SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+        self.query_embedding_cache_max_entries = int(os.environ.get("FUKAMI_LENS_QUERY_EMBEDDING_CACHE_MAX_ENTRIES", 10000))
+        self.distance_metric = os.environ.get("FUKAMI_LENS_DISTANCE_METRIC", "cosine")
+        self.keyword_index_sync_seconds = float(os.environ.get("FUKAMI_LENS_KEYWORD_INDEX_SYNC_SECONDS", 10))
+        self.exact_search_max_rows = int(os.environ.get("FUKAMI_LENS_EXACT_SEARCH_MAX_ROWS", 50000))
 
 def load_config():
-    return Config() 
\ No newline at end of file
+    return Config()
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Token-budgeted context assembly for RAG prompts.
+
+`ContextBuilder.build()` turns a query vector into the smallest prompt context that
+fits a token budget:
+
+1. Retrieve candidates: the nearest chunks from the `<table>_chunks` table (written by
+   pipeline.py) or, for tables without chunks, the nearest posts split on the fly
+   with the fallback TokenChunker.
+2. Drop chunks that mostly repeat text already selected (overlapping chunk windows,
+   the same passage quoted in several posts), by token-trigram containment.
+3. Pack the best chunks into the budget, counting tokens with the LLM's tokenizer
+   (chunking.tokenizer). Chunks of one post share a single source header and are
+   kept in document order.
+"""
+from typing import Any, Dict, List, Optional
+
+from chunking.fallback import TokenChunker
+from chunking.tokenizer import get_tokenizer
+from utils import instrumentation
+
+# Candidate chunks retrieved per call
+DEFAULT_CANDIDATES = 40
+
+# Chunk size for posts that are chunked on the fly
+FALLBACK_CHUNK_TOKENS = 256
+
+# A chunk is dropped when this share of its token trigrams is already in the context
+DUPLICATE_CONTAINMENT = 0.8
+
+SEPARATOR = '\n\n'
+
+
+def shingles(ids: List[int], n: int = 3) -> set:
+    """Token n-grams of `ids` (the whole sequence when it is shorter than n)"""
+    if len(ids) < n:
+        return {tuple(ids)} if ids else set()
+    return {tuple(ids[i:i + n]) for i in range(len(ids) - n + 1)}
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into a token budget for one LLM's tokenizer"""
+
+    def __init__(self, manager, model: str = 'gpt-4o-mini'):
+        self.manager = manager
+        self.tokenizer = get_tokenizer(model)
+        self.encoding = self.tokenizer.tokenizer
+
+    def _candidates(self, query_embedding, candidates: int, filters: Optional[Dict]):
+        chunks = self.manager.nearest_chunks(query_embedding, candidates, filters)
+        if chunks is not None:
+            return 'chunks', chunks
+
+        # No chunks table: chunk the nearest posts, taking each post's opening chunk
+        # first, then the second ones, so the budget covers several posts
+        posts = self.manager.nearest_posts(query_embedding, max(1, candidates // 4), filters)
+        chunker = TokenChunker(self.encoding, FALLBACK_CHUNK_TOKENS)
+        ranked = []
+        with instrumentation.stage('chunk'):
+            for rank, post in enumerate(posts):
+                for index, chunk in enumerate(chunker.iter_chunks(post['content'] or '')):
+                    ranked.append(((index, rank), {
+                        'post_id': post['id'],
+                        'chunk_index': index,
+                        'title': post['title'],
+                        'permalink': post['permalink'],
+                        'heading_path': [],
+                        'text': chunk['text'],
+                    }))
+        ranked.sort(key=lambda item: item[0])
+        return 'posts', [chunk for _, chunk in ranked[:candidates]]
+
+    @staticmethod
+    def _header(chunk) -> str:
+        return f"# {chunk['title']}\n{chunk['permalink']}" if chunk.get('permalink') else f"# {chunk['title']}"
+
+    @staticmethod
+    def _block(chunk) -> str:
+        path = chunk.get('heading_path') or []
+        if path and path[0] == chunk['title']:
+            # The source header already names the post
+            path = path[1:]
+        return f"[{' > '.join(path)}]\n{chunk['text']}" if path else chunk['text']
+
+    def _render(self, selected: List[Dict]) -> str:
+        """Context text: posts in order of their best chunk, chunks in document order"""
+        by_post = {}
+        for chunk in selected:
+            by_post.setdefault(chunk['post_id'], []).append(chunk)
+        parts = []
+        for chunks in by_post.values():
+            parts.append(self._header(chunks[0]))
+            parts.extend(self._block(c) for c in sorted(chunks, key=lambda c: c['chunk_index']))
+        return SEPARATOR.join(parts)
+
+    def build(self, query_embedding: List[float], token_budget: int,
+              filters: Optional[Dict] = None, candidates: int = DEFAULT_CANDIDATES) -> Dict[str, Any]:
+        source, chunks = self._candidates(query_embedding, candidates, filters)
+
+        with instrumentation.stage('tokenize'):
+            headers = [self._header(c) for c in chunks]
+            blocks = [self._block(c) for c in chunks]
+            encoded = self.tokenizer.encode_batch(headers + blocks + [c['text'] for c in chunks])
+        n = len(chunks)
+        header_tokens, block_ids, text_ids = encoded[:n], encoded[n:2 * n], encoded[2 * n:]
+        separator_tokens = len(self.encoding.encode_ordinary(SEPARATOR))
+
+        selected = []
+        seen = set()
+        posts = set()
+        used = 0
+        duplicates = 0
+        with instrumentation.stage('pack'):
+            for i, chunk in enumerate(chunks):
+                grams = shingles(text_ids[i])
+                if grams and len(grams & seen) >= DUPLICATE_CONTAINMENT * len(grams):
+                    duplicates += 1
+                    continue
+                cost = len(block_ids[i]) + (separator_tokens if selected else 0)
+                if chunk['post_id'] not in posts:
+                    cost += len(header_tokens[i]) + separator_tokens
+                if used + cost > token_budget:
+                    room = token_budget - (cost - len(block_ids[i])) - used
+                    if selected or room <= 0:
+                        continue
+                    # Not even the best chunk fits: keep as much of it as the budget allows
+                    chunk = dict(chunk, text=self.encoding.decode(text_ids[i][:room]), heading_path=[])
+                    cost = token_budget - used
+                selected.append(chunk)
+                seen |= grams
+                posts.add(chunk['post_id'])
+                used += cost
+
+            context = self._render(selected)
+            tokens = self.tokenizer.count_tokens(context)
+            # Token counts of the parts can be off by a few at the joins
+            while tokens > token_budget and selected:
+                selected.pop()
+                context = self._render(selected)
+                tokens = self.tokenizer.count_tokens(context)
+
+        sources = {}
+        for chunk in selected:
+            entry = sources.setdefault(chunk['post_id'], {
+                'post_id': chunk['post_id'],
+                'title': chunk['title'],
+                'permalink': chunk['permalink'],
+                'chunks': [],
+            })
+            entry['chunks'].append(chunk['chunk_index'])
+
+        return {
+            'context': context,
+            'tokens': tokens,
+            'token_budget': token_budget,
+            'source': source,
+            'sources': list(sources.values()),
+            'chunks_considered': n,
+            'chunks_used': len(selected),
+            'duplicates_dropped': duplicates,
+        }
@@ -1,22 +1,88 @@
-import tempfile
 import os
+import multiprocessing
+from collections import deque
+from io import BytesIO
+
+# Recycle each conversion worker after this many posts to cap its memory
+DEFAULT_MAX_POSTS_PER_WORKER = 200
+
+# Fork the workers from a clean server process where possible: the parent may already
+# hold LanceDB's async runtime, which is not safe to fork
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+
+# One DocumentConverter per process; building it loads Docling's pipelines
+_converter = None
+
+
+def get_converter():
+    global _converter
+    if _converter is None:
+        from docling.document_converter import DocumentConverter
+        _converter = DocumentConverter()
+    return _converter
+
+
+def convert_document(content, filename='post.html'):
+    """Convert in-memory content to a DoclingDocument; the format follows the filename suffix."""
+    from docling.datamodel.base_models import DocumentStream
+    stream = DocumentStream(name=filename, stream=BytesIO(content.encode('utf-8')))
+    return get_converter().convert(stream).document
+
 
 def html_to_markdown(html):
     try:
-        from docling.document_converter import DocumentConverter
-        converter = DocumentConverter()
-        with tempfile.NamedTemporaryFile('w+', suffix='.html', delete=False, encoding='utf-8') as tmp:
-            tmp.write(html)
-            tmp.flush()
-            tmp_path = tmp.name
-        try:
-            result = converter.convert(tmp_path)
-            return result.document.export_to_markdown()
-        finally:
-            os.unlink(tmp_path)
+        return convert_document(html, 'post.html').export_to_markdown()
     except ImportError:
         try:
             from markdownify import markdownify as md
             return md(html)
         except ImportError:
-            return "[ERROR: Neither docling nor markdownify is available]" 
\ No newline at end of file
+            return "[ERROR: Neither docling nor markdownify is available]"
+
+
+def _init_worker():
+    # Build the converter up front so each worker pays for it once
+    try:
+        get_converter()
+    except ImportError:
+        pass
+
+
+def _convert_or_skip(html):
+    return None if html is None else html_to_markdown(html)
+
+
+def convert_posts(htmls, workers=None, max_posts_per_worker=DEFAULT_MAX_POSTS_PER_WORKER):
+    """Convert HTML strings to Markdown across a process pool, yielding results in input order.
+
+    `None` items are passed through unchanged (e.g. posts served from the chunk cache).
+    Only a small window of posts is in flight at a time, so the input can be a lazy
+    iterator of any length.
+
+    Args:
+        htmls: Iterable of HTML strings
+        workers: Number of worker processes (defaults to the number of cores)
+        max_posts_per_worker: Posts a worker converts before it is replaced
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for html in htmls:
+            yield _convert_or_skip(html)
+        return
+
+    window = workers * 2
+    with multiprocessing.get_context(START_METHOD).Pool(
+        processes=workers,
+        initializer=_init_worker,
+        maxtasksperchild=max_posts_per_worker or None,
+    ) as pool:
+        pending = deque()
+        for html in htmls:
+            pending.append(pool.apply_async(html_to_markdown, (html,)) if html is not None else None)
+            while len(pending) >= window:
+                result = pending.popleft()
+                yield result.get() if result is not None else None
+        while pending:
+            result = pending.popleft()
+            yield result.get() if result is not None else None
@@ -0,0 +1,347 @@
+"""
+Online re-embedding of a posts table with a new embedding model.
+
+A migration builds a shadow table (`<table>__<model>`, see utils/embedding_state.py)
+holding every post re-embedded with the target model, one batch of posts per step,
+so it can run in the background (e.g. from WP-Cron) and resume wherever it stopped.
+Searches keep reading the active table until every post has a vector in the shadow
+table; the cutover then switches `active_table` in the state file under the state
+lock, which readers see atomically.
+
+Posts are re-embedded from the title and content already stored in the table and,
+when the table has chunks, from the stored chunk texts, so nothing is re-fetched from
+WordPress or re-chunked. Posts upserted with the old model while a migration runs are
+dropped from the shadow table by LanceDBManager and picked up by a later step.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from config import load_config
+from utils import instrumentation
+from utils.embedding_state import save_state, shadow_table_name, state_lock
+
+# USD per 1M input tokens
+PRICE_PER_MILLION_TOKENS = {
+    'text-embedding-3-small': 0.02,
+    'text-embedding-3-large': 0.13,
+    'text-embedding-ada-002': 0.10,
+}
+
+# Longest input the OpenAI embedding models accept
+MAX_INPUT_TOKENS = 8191
+
+# Most inputs per embeddings API request; requests are also capped at
+# `embed_batch_max_tokens` tokens in total (see get_embedding.request_batches)
+REQUEST_BATCH = 256
+
+# Pending posts tokenized to estimate the cost before the first batch has run
+ESTIMATE_SAMPLE = 200
+
+POST_COLUMNS = ['id', 'title', 'content', 'date', 'permalink', 'categories', 'tags', 'created_at',
+                'content_hash', 'modified']
+
+
+def encoder_for(model: str):
+    """tiktoken encoding of `model`, cl100k_base for models tiktoken does not know"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def estimate_cost(model: str, tokens: float) -> Optional[float]:
+    price = PRICE_PER_MILLION_TOKENS.get(model)
+    return None if price is None else round(tokens * price / 1_000_000, 6)
+
+
+def unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class EmbeddingMigration:
+    """Re-embeds the posts (and chunks) behind a LanceDBManager's table"""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.db = manager.db
+        self.db_path = manager.db_path
+        self.table = manager.logical_table_name
+
+    def _save(self, state):
+        save_state(self.db_path, self.table, state)
+
+    def _ids(self, table_name: str, column: str = 'id') -> pa.Array:
+        if table_name not in self.db.table_names():
+            return pa.array([], pa.int64())
+        table = self.db.open_table(table_name)
+        with instrumentation.stage('scan_keys'):
+            ids = table.search().select([column]).limit(None).to_arrow().column(column)
+        return ids.combine_chunks()
+
+    def _rows(self, table_name: str, column: str, ids: List[int], columns: List[str]) -> pa.Table:
+        table = self.db.open_table(table_name)
+        condition = f"{column} IN ({', '.join(str(int(i)) for i in ids)})"
+        with instrumentation.stage('query'):
+            return table.search().where(condition).select(columns).limit(None).to_arrow()
+
+    def _pending(self, migration) -> pa.Array:
+        """Ids in the source table that have no row in the shadow table yet, ascending"""
+        source = self._ids(migration['source_table'])
+        done = self._ids(migration['shadow_table'])
+        pending = pc.filter(source, pc.invert(pc.is_in(source, value_set=done)))
+        return pc.take(pending, pc.sort_indices(pending))
+
+    def _post_texts(self, rows: pa.Table) -> List[str]:
+        return [f'{title} {content}' for title, content in
+                zip(rows.column('title').to_pylist(), rows.column('content').to_pylist())]
+
+    def _chunk_texts(self, chunks: pa.Table) -> List[str]:
+        # Same contextualized text the pipeline embeds: heading path above the chunk
+        return ['\n'.join((path or []) + [text]) for path, text in
+                zip(chunks.column('heading_path').to_pylist(), chunks.column('text').to_pylist())]
+
+    def _progress(self, state, pending: int) -> Dict[str, Any]:
+        migration = state['migration']
+        total = len(self._ids(migration['source_table']))
+        done = migration['posts_done']
+        if done:
+            tokens_per_post = migration['tokens_used'] / done
+        else:
+            tokens_per_post = self._sample_tokens(migration)
+        remaining_tokens = int(round(tokens_per_post * pending))
+        return {
+            'status': 'migrating',
+            'from_model': state['model'],
+            'target_model': migration['target_model'],
+            'serving_table': state['active_table'],
+            'shadow_table': migration['shadow_table'],
+            'total_posts': total,
+            'pending_posts': pending,
+            'coverage': round((total - pending) / total, 4) if total else 1.0,
+            'tokens_used': migration['tokens_used'],
+            'cost_used_usd': estimate_cost(migration['target_model'], migration['tokens_used']),
+            'estimated_remaining_tokens': remaining_tokens,
+            'estimated_remaining_cost_usd': estimate_cost(migration['target_model'], remaining_tokens),
+            'started_at': migration['started_at'],
+        }
+
+    def _sample_tokens(self, migration) -> float:
+        """Average tokens per pending post, from a sample, including its chunks"""
+        pending = self._pending(migration)
+        if not len(pending):
+            return 0.0
+        sample = pending.slice(0, ESTIMATE_SAMPLE).to_pylist()
+        encoder = encoder_for(migration['target_model'])
+        texts = self._post_texts(self._rows(migration['source_table'], 'id', sample, ['title', 'content']))
+        chunks_table = f"{migration['source_table']}_chunks"
+        if chunks_table in self.db.table_names():
+            texts += self._chunk_texts(self._rows(chunks_table, 'post_id', sample, ['heading_path', 'text']))
+        tokens = sum(min(len(t), MAX_INPUT_TOKENS) for t in encoder.encode_ordinary_batch(texts))
+        return tokens / len(sample)
+
+    def start(self, target_model: str, current_model: Optional[str] = None) -> Dict[str, Any]:
+        """Record a migration to `target_model` (or keep the one in progress).
+
+        `current_model` names the model of the existing vectors for tables written
+        before the state file recorded it.
+        """
+        with state_lock(self.db_path, self.table):
+            state = self.manager.refresh_state()
+            if state['model'] is None and current_model:
+                state['model'] = current_model
+            migration = state['migration']
+            if migration and migration['target_model'] == target_model:
+                return state
+            if migration:
+                raise ValueError(
+                    f"A migration to {migration['target_model']} is in progress; abort it first"
+                )
+            if state['model'] == target_model:
+                return state
+            shadow = shadow_table_name(self.table, target_model)
+            if shadow == state['active_table']:
+                raise ValueError(f"'{shadow}' is already the active table")
+            # A table left from an earlier migration to this model holds stale vectors
+            self._drop(shadow)
+            if state.get('previous_table') == shadow:
+                state.pop('previous_table')
+            state['migration'] = {
+                'target_model': target_model,
+                'source_table': state['active_table'],
+                'shadow_table': shadow,
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'posts_done': 0,
+                'tokens_used': 0,
+            }
+            self._save(state)
+            return state
+
+    def status(self) -> Dict[str, Any]:
+        state = self.manager.refresh_state()
+        if not state['migration']:
+            return {
+                'status': 'idle',
+                'model': state['model'],
+                'serving_table': state['active_table'],
+                'previous_table': state.get('previous_table'),
+            }
+        return self._progress(state, len(self._pending(state['migration'])))
+
+    def run(self, api_key: str, target_model: str, batch_size: int = 100,
+            max_batches: int = 10, drop_old: bool = False,
+            current_model: Optional[str] = None) -> Dict[str, Any]:
+        """Re-embed up to `max_batches` batches of `batch_size` posts; cut over when done"""
+        from get_embedding import get_openai_embeddings, request_batches
+
+        state = self.start(target_model, current_model)
+        if not state['migration']:
+            return dict(self.status(), batches=0)
+        migration = state['migration']
+        encoder = encoder_for(target_model)
+        max_request_tokens = load_config().embed_batch_max_tokens
+        chunks_table = f"{migration['source_table']}_chunks"
+
+        batches = 0
+        pending = self._pending(migration)
+        while len(pending) and batches < max_batches:
+            ids = pending.slice(0, batch_size).to_pylist()
+            source_columns = self.db.open_table(migration['source_table']).schema.names
+            rows = self._rows(migration['source_table'], 'id', ids,
+                              [c for c in POST_COLUMNS if c in source_columns])
+            chunks = None
+            if chunks_table in self.db.table_names():
+                chunks = self._rows(chunks_table, 'post_id', ids,
+                                    ['post_id', 'chunk_index', 'title', 'permalink', 'heading_path', 'text', 'tokens'])
+                chunks = chunks.sort_by([('post_id', 'ascending'), ('chunk_index', 'ascending')])
+
+            texts = self._post_texts(rows)
+            if chunks is not None:
+                texts += self._chunk_texts(chunks)
+            with instrumentation.stage('tokenize'):
+                tokens = [t[:MAX_INPUT_TOKENS] for t in encoder.encode_ordinary_batch(texts)]
+            inputs = [encoder.decode(t) if len(t) == MAX_INPUT_TOKENS else text for t, text in zip(tokens, texts)]
+            vectors = []
+            with instrumentation.stage('api_request'):
+                for part in request_batches([len(t) for t in tokens], REQUEST_BATCH, max_request_tokens):
+                    vectors.extend(get_openai_embeddings(inputs[part.start:part.stop], target_model, api_key))
+            vectors = np.asarray(vectors, dtype=np.float32)
+            post_vectors = vectors[:rows.num_rows]
+            chunk_vectors = vectors[rows.num_rows:]
+
+            if chunks is not None and chunks.num_rows:
+                # A post with chunks is represented by the mean of its chunk vectors, as in the pipeline
+                chunk_post_ids = chunks.column('post_id').to_numpy()
+                for i, pid in enumerate(rows.column('id').to_pylist()):
+                    mask = chunk_post_ids == pid
+                    if mask.any():
+                        post_vectors[i] = unit(chunk_vectors[mask].mean(axis=0))
+
+            with state_lock(self.db_path, self.table):
+                state = self.manager.refresh_state()
+                if (state['migration'] or {}).get('shadow_table') != migration['shadow_table']:
+                    raise ValueError('The migration was aborted')
+                # Posts upserted since they were read are left pending for the next batch
+                current = self._rows(migration['source_table'], 'id', ids, ['id', 'created_at'])
+                unchanged = pc.is_in(
+                    rows.column('id'),
+                    value_set=pc.filter(
+                        current.column('id'),
+                        pc.is_in(current.column('created_at'), value_set=rows.column('created_at'))
+                    )
+                )
+                keep = unchanged.to_numpy(zero_copy_only=False)
+                written = self._write(migration['shadow_table'], rows, post_vectors, keep,
+                                      chunks, chunk_vectors)
+                migration = state['migration']
+                migration['posts_done'] += written
+                migration['tokens_used'] += sum(len(t) for t in tokens)
+                self._save(state)
+            instrumentation.count('posts_reembedded', written)
+
+            batches += 1
+            pending = self._pending(migration)
+
+        if not len(pending):
+            return dict(self.cutover(drop_old), batches=batches)
+        return dict(self._progress(state, len(pending)), batches=batches)
+
+    def _write(self, shadow: str, rows: pa.Table, post_vectors, keep, chunks, chunk_vectors) -> int:
+        ids = [pid for pid, k in zip(rows.column('id').to_pylist(), keep) if k]
+        if not ids:
+            return 0
+        # Stored vectors are unit-length, like lancedb_operations.normalize_vectors() writes them
+        norms = np.linalg.norm(post_vectors, axis=1, keepdims=True)
+        post_vectors = (post_vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+        dim = post_vectors.shape[1]
+        self.manager.create_table_if_not_exists(shadow, dim)
+        table = self.db.open_table(shadow)
+        table.delete(f"id IN ({', '.join(str(int(pid)) for pid in ids)})")
+
+        kept = rows.filter(pa.array(keep))
+        for field in table.schema:
+            if field.name not in kept.column_names and field.name != 'embedding':
+                # Columns the source table predates
+                kept = kept.append_column(field, pa.nulls(kept.num_rows, field.type))
+        batch = kept.append_column(
+            'embedding',
+            pa.FixedSizeListArray.from_arrays(pa.array(post_vectors[keep].ravel(), pa.float32()), dim)
+        ).select(table.schema.names).cast(table.schema)
+        with instrumentation.stage('add'):
+            table.add(batch)
+
+        if chunks is not None:
+            chunk_keep = pc.is_in(chunks.column('post_id'), value_set=pa.array(ids, pa.int64()))
+            kept_chunks = chunks.filter(chunk_keep).to_pylist()
+            self.manager.write_chunks(f'{shadow}_chunks', ids, kept_chunks,
+                                      chunk_vectors[chunk_keep.to_numpy(zero_copy_only=False)].reshape(-1, dim))
+        return len(ids)
+
+    def cutover(self, drop_old: bool = False) -> Dict[str, Any]:
+        """Serve from the shadow table once it covers every post"""
+        with state_lock(self.db_path, self.table):
+            state = self.manager.refresh_state()
+            migration = state['migration']
+            if not migration:
+                return self.status()
+            pending = len(self._pending(migration))
+            if pending:
+                return self._progress(state, pending)
+            state.update({
+                'active_table': migration['shadow_table'],
+                'model': migration['target_model'],
+                'previous_table': migration['source_table'],
+                'migration': None,
+                'migrated_at': datetime.now().isoformat(timespec='seconds'),
+            })
+            self._save(state)
+            if drop_old:
+                self._drop(migration['source_table'])
+                state.pop('previous_table')
+                self._save(state)
+            self.manager.refresh_state()
+
+        return dict(self.status(), status='complete', tokens_used=migration['tokens_used'],
+                    cost_used_usd=estimate_cost(migration['target_model'], migration['tokens_used']))
+
+    def abort(self, drop_shadow: bool = True) -> Dict[str, Any]:
+        """Stop the migration in progress and discard its shadow table"""
+        with state_lock(self.db_path, self.table):
+            state = self.manager.refresh_state()
+            migration = state['migration']
+            state['migration'] = None
+            self._save(state)
+        if migration and drop_shadow:
+            self._drop(migration['shadow_table'])
+        return dict(self.status(), aborted=migration['target_model'] if migration else None)
+
+    def _drop(self, table_name: str):
+        names = self.db.table_names()
+        for name in (table_name, f'{table_name}_chunks'):
+            if name in names:
+                self.db.drop_table(name)
@@ -8,57 +8,116 @@ This script gets embeddings from OpenAI's API for text content.
 import sys
 import json
 import os
-import requests
+import time
 from typing import List
 
+from utils.instrumentation import Instrumentation
+from utils.serialization import write_json
+
+import requests
+
 # Set environment variables for HuggingFace cache
 os.environ["HF_HOME"] = "/tmp"
 os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
 os.environ["XDG_CACHE_HOME"] = "/tmp"
 
 
+def embeddings_url() -> str:
+    """OpenAI embeddings endpoint; FUKAMI_LENS_OPENAI_BASE_URL points it elsewhere (e.g. a local mock)"""
+    base = os.environ.get("FUKAMI_LENS_OPENAI_BASE_URL", "https://api.openai.com/v1")
+    return f"{base.rstrip('/')}/embeddings"
+
+
 def get_openai_embedding(text: str, model: str, api_key: str) -> List[float]:
     """Get embedding from OpenAI API"""
-    url = "https://api.openai.com/v1/embeddings"
-    
+    return get_openai_embeddings([text], model, api_key)[0]
+
+
+def request_batches(token_counts: List[int], max_inputs: int, max_tokens: int) -> List[range]:
+    """Split inputs into consecutive index ranges, one embeddings request each.
+
+    A request holds at most `max_inputs` inputs and `max_tokens` tokens in total (the
+    API rejects larger requests outright); an input over `max_tokens` is sent alone.
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for i, count in enumerate(token_counts):
+        if i > start and (i - start >= max_inputs or tokens + count > max_tokens):
+            batches.append(range(start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append(range(start, len(token_counts)))
+    return batches
+
+
+def get_openai_embeddings(texts: List[str], model: str, api_key: str,
+                          max_retries: int = 5, backoff: float = 1.0) -> List[List[float]]:
+    """Get embeddings for many texts in one request, in input order.
+
+    Rate-limited (429) and server error (5xx) responses are retried with exponential
+    backoff, honouring Retry-After when the API sends it.
+    """
+    url = embeddings_url()
+
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
-    
+
     data = {
-        "input": text,
+        "input": list(texts),
         "model": model
     }
-    
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        return result['data'][0]['embedding']
-        
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"OpenAI API request failed: {str(e)}")
-    except (KeyError, IndexError) as e:
-        raise Exception(f"Unexpected response format: {str(e)}")
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = requests.post(url, headers=headers, json=data, timeout=60)
+        except requests.exceptions.RequestException as e:
+            if attempt == max_retries:
+                raise Exception(f"OpenAI API request failed: {str(e)}")
+            time.sleep(backoff * 2 ** attempt)
+            continue
+
+        if response.status_code == 429 or response.status_code >= 500:
+            if attempt == max_retries:
+                raise Exception(f"OpenAI API request failed: HTTP {response.status_code} after {attempt + 1} attempts")
+            try:
+                delay = float(response.headers.get('Retry-After', ''))
+            except ValueError:
+                delay = backoff * 2 ** attempt
+            time.sleep(delay)
+            continue
+
+        try:
+            response.raise_for_status()
+            result = response.json()
+            items = sorted(result['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in items]
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"OpenAI API request failed: {str(e)}")
+        except (KeyError, IndexError) as e:
+            raise Exception(f"Unexpected response format: {str(e)}")
 
 
 def main():
     """Main function to get embedding"""
     if len(sys.argv) < 2:
-        print(json.dumps({
+        write_json({
             'success': False,
             'data': 'Usage: python get_embedding.py <input_file>'
-        }))
+        })
         sys.exit(1)
     
     input_file = sys.argv[1]
+    instr = Instrumentation('get_embedding')
+    instr.operation = 'embed'
     
     try:
         # Read input data
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = instr.read_input(input_file, json.load)
+        instr.enable_timings(data.get('timings', False))
         
         text = data.get('text', '')
         model = data.get('model', 'text-embedding-3-small')
@@ -71,7 +130,8 @@ def main():
             raise Exception('No API key provided')
         
         # Get embedding
-        embedding = get_openai_embedding(text, model, api_key)
+        with instr.stage('api_request'):
+            embedding = get_openai_embedding(text, model, api_key)
         
         # Return result
         result = {
@@ -83,13 +143,13 @@ def main():
             }
         }
         
-        print(json.dumps(result, ensure_ascii=False))
+        instr.emit(result)
         
     except Exception as e:
-        print(json.dumps({
+        instr.emit({
             'success': False,
             'data': f'Error: {str(e)}'
-        }))
+        })
 
 
 if __name__ == '__main__':
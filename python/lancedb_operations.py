@@ -4,17 +4,35 @@ LanceDB Operations for WP Fukami Lens AI
 
 This script handles LanceDB vector database operations including:
 - Storing post embeddings
-- Searching for similar content
+- Searching for similar content (by vector, or by query text embedded in-process)
+- Assembling token-budgeted RAG context (see context_builder.py)
+- Queueing upserts for a single batching writer (see utils/job_queue.py)
+- Caching answers by query similarity (semantic cache)
 - Database statistics
+- Re-embedding the table with a new model (see embedding_migration.py)
 """
 
 import sys
 import json
+import hashlib
 import os
 import tempfile
-from datetime import datetime
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
+from config import load_config
+from utils import instrumentation
+from utils.embedding_cache import QueryEmbeddingCache
+from utils.embedding_state import METRICS, load_state, save_state, state_lock
+from utils.instrumentation import Instrumentation
+from utils.job_queue import IngestQueue
+from utils.ngram_index import NgramIndex
+from utils.serialization import write_json
+from vector_cache import VectorCache
+
 # Set environment variables for HuggingFace cache
 os.environ["HF_HOME"] = "/tmp"
 os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
@@ -25,12 +43,13 @@ try:
     import numpy as np
     import pandas as pd
     import pyarrow as pa
+    import pyarrow.compute as pc
     from pydantic import BaseModel, Field
 except ImportError as e:
-    print(json.dumps({
+    write_json({
         'success': False,
         'data': f'Missing required packages: {str(e)}. Please install lancedb, numpy, pandas, pyarrow, and pydantic.'
-    }))
+    })
     sys.exit(1)
 
 
@@ -45,72 +64,397 @@ class PostData(BaseModel):
     tags: List[str] = Field(default_factory=list)
 
 
+def posts_schema(dim: int = 1536) -> pa.Schema:
+    """Schema of a posts table holding `dim`-dimensional embeddings"""
+    # Microsecond timestamps to match existing data
+    return pa.schema([
+        ('id', pa.int64()),
+        ('title', pa.string()),
+        ('content', pa.string()),
+        ('date', pa.string()),
+        ('permalink', pa.string()),
+        ('categories', pa.list_(pa.string())),
+        ('tags', pa.list_(pa.string())),
+        ('embedding', pa.list_(pa.float32(), dim)),  # 1536: OpenAI text-embedding-3-small
+        ('created_at', pa.timestamp('us')),
+        ('content_hash', pa.string()),  # content_hash() of the embedded text
+        ('modified', pa.string())       # The post's modified date when it was embedded
+    ])
+
+
+# Columns added to the posts schema after the first release; older tables get them on write
+ADDED_POST_COLUMNS = {
+    'content_hash': 'CAST(NULL AS string)',
+    'modified': 'CAST(NULL AS string)',
+}
+
+
+def content_hash(post: Dict) -> str:
+    """SHA-256 of the embedded text (title and content), unless the post carries its own"""
+    if post.get('content_hash'):
+        return post['content_hash']
+    text = f"{post.get('title', '')}\0{post.get('content', '')}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def normalize_vectors(vectors) -> np.ndarray:
+    """Vectors scaled to unit length (zero vectors are kept as they are)
+
+    Vectors that already are unit-length, like OpenAI embeddings, are returned
+    without a copy.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.sqrt(np.einsum('...i,...i->...', vectors, vectors))[..., None]
+    if np.allclose(norms, 1, atol=1e-4):
+        return vectors
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+# Sidecar formats by file extension; anything else is read as raw float32
+EMBEDDINGS_FILE_FORMATS = {'.npy': 'npy', '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'}
+
+
+def load_embeddings_file(path: str, fmt: Optional[str] = None, dim: Optional[int] = None) -> np.ndarray:
+    """(rows, dim) float32 vectors from a binary sidecar file, memory-mapped rather than parsed
+
+    - 'f32': raw little-endian float32, one row after the other (needs `dim`)
+    - 'npy': a 2-D NumPy array (copied only when it is not float32)
+    - 'arrow': an Arrow IPC file or stream whose first column holds fixed-size
+      float32 lists
+    """
+    fmt = fmt or EMBEDDINGS_FILE_FORMATS.get(os.path.splitext(path)[1].lower(), 'f32')
+    if fmt == 'f32':
+        if os.path.getsize(path) == 0:
+            return np.empty((0, int(dim or 0)), dtype=np.float32)
+        if not dim:
+            raise ValueError('embeddings_dim is required for raw float32 embeddings files')
+        vectors = np.memmap(path, dtype='<f4', mode='r')
+        if vectors.size % int(dim):
+            raise ValueError(f'{vectors.size} floats in {path} are not rows of {dim}')
+        return vectors.reshape(-1, int(dim))
+    if fmt == 'npy':
+        vectors = np.load(path, mmap_mode='r')
+        if vectors.ndim != 2:
+            raise ValueError(f'Expected a 2-D array in {path}, got {vectors.ndim}-D')
+        return vectors if vectors.dtype == np.float32 else vectors.astype(np.float32)
+    if fmt == 'arrow':
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        except pa.ArrowInvalid:
+            table = pa.ipc.open_stream(pa.memory_map(path)).read_all()
+        column = table.column(0).combine_chunks()
+        if not pa.types.is_fixed_size_list(column.type):
+            raise ValueError(f'Expected fixed-size lists in {path}, got {column.type}')
+        values = column.flatten().to_numpy(zero_copy_only=False).astype(np.float32, copy=False)
+        return values.reshape(-1, column.type.list_size)
+    raise ValueError(f"Unknown embeddings format '{fmt}'; use f32, npy or arrow")
+
+
+def similarity(metric: str, distance: float) -> float:
+    """Cosine similarity of two unit vectors from their `metric` distance"""
+    return 1.0 - distance / 2 if metric == 'l2' else 1.0 - distance
+
+
+def max_distance(metric: str, min_similarity: Optional[float]) -> Optional[float]:
+    """Largest `metric` distance between unit vectors at least `min_similarity` similar"""
+    if min_similarity is None:
+        return None
+    return 2 * (1 - float(min_similarity)) if metric == 'l2' else 1 - float(min_similarity)
+
+
+def chunks_schema(dim: int = 1536) -> pa.Schema:
+    """Schema of a chunks table (one row per chunk of a post)"""
+    return pa.schema([
+        ('post_id', pa.int64()),
+        ('chunk_index', pa.int32()),
+        ('title', pa.string()),
+        ('permalink', pa.string()),
+        ('heading_path', pa.list_(pa.string())),
+        ('text', pa.string()),
+        ('tokens', pa.int32()),
+        ('embedding', pa.list_(pa.float32(), dim)),
+        ('created_at', pa.timestamp('us'))
+    ])
+
+
+def sql_string(value: str) -> str:
+    """`value` as a quoted SQL string literal"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def filter_condition(filters: Optional[Dict]) -> Optional[str]:
+    """SQL condition on the posts table for `start_date`, `end_date` and `categories` filters"""
+    conditions = []
+    if filters:
+        if 'start_date' in filters:
+            conditions.append(f"date >= '{filters['start_date']}'")
+        if 'end_date' in filters:
+            conditions.append(f"date <= '{filters['end_date']}'")
+        if 'categories' in filters and filters['categories']:
+            categories_filter = " OR ".join([f"'{cat}' IN categories" for cat in filters['categories']])
+            conditions.append(f"({categories_filter})")
+    return " AND ".join(conditions) or None
+
+
 class LanceDBManager:
     """Manages LanceDB operations for WordPress posts"""
     
     def __init__(self, db_path: str, table_name: str = 'wordpress_posts'):
         self.db_path = db_path
-        self.table_name = table_name
+        self.logical_table_name = table_name
         self.db = lancedb.connect(db_path)
+        self.vector_caches = {}
+        self.refresh_state()
+
+    def refresh_state(self) -> Dict[str, Any]:
+        """Re-read the embedding state; `table_name` is the physical table serving reads"""
+        self.state = load_state(self.db_path, self.logical_table_name)
+        self.table_name = self.state['active_table']
+        return self.state
+
+    @property
+    def metric(self) -> str:
+        """Distance metric the table is searched and indexed with (recorded on its first write)"""
+        metric = self.state.get('metric') or load_config().distance_metric
+        if metric not in METRICS:
+            raise ValueError(f"Unknown distance metric '{metric}'; use one of {', '.join(METRICS)}")
+        return metric
+
+    @contextmanager
+    def _writing(self, post_ids: List[int], model: Optional[str] = None):
+        """Hold the state lock around a write and pick the table it goes to.
+
+        Yields the physical posts table to write. Vectors of the serving model (or of an
+        unspecified model) go to the active table; during a re-embedding migration the
+        written posts are also dropped from the shadow table so they get re-embedded.
+        Vectors of the migration's target model go straight to the shadow table.
+        """
+        with state_lock(self.db_path, self.logical_table_name):
+            state = self.refresh_state()
+            migration = state['migration']
+            if migration and model and model == migration['target_model']:
+                yield migration['shadow_table']
+                return
+            if model and state['model'] and model != state['model']:
+                raise ValueError(
+                    f"'{self.logical_table_name}' holds {state['model']} embeddings, not {model}; "
+                    f"run the reembed operation to migrate it"
+                )
+            yield self.table_name
+            recorded = {}
+            if model and state['model'] is None and migration is None:
+                recorded['model'] = model
+            if state['metric'] is None:
+                recorded['metric'] = self.metric
+            if recorded:
+                state.update(recorded)
+                save_state(self.db_path, self.logical_table_name, state)
+            if migration and post_ids:
+                self._delete_posts(migration['shadow_table'], post_ids)
+            if post_ids:
+                self.invalidate_semantic_cache(post_ids)
+
+    def _delete_posts(self, table_name: str, post_ids: List[int]):
+        """Delete posts and their chunks from a physical table, if it exists"""
+        ids = ', '.join(str(int(pid)) for pid in post_ids)
+        names = self.db.table_names()
+        if table_name in names:
+            self.db.open_table(table_name).delete(f"id IN ({ids})")
+        if f'{table_name}_chunks' in names:
+            self.db.open_table(f'{table_name}_chunks').delete(f"post_id IN ({ids})")
         
-    def create_table_if_not_exists(self):
+    def _open_table(self, name: Optional[str] = None):
+        with instrumentation.stage('open_table'):
+            return self.db.open_table(name or self.table_name)
+
+    def create_table_if_not_exists(self, table_name: Optional[str] = None, dim: int = 1536):
         """Create the posts table if it doesn't exist"""
-        if self.table_name not in self.db.table_names():
-            # Define schema using PyArrow with microsecond precision for timestamps
-            schema = pa.schema([
-                ('id', pa.int64()),
-                ('title', pa.string()),
-                ('content', pa.string()),
-                ('date', pa.string()),
-                ('permalink', pa.string()),
-                ('categories', pa.list_(pa.string())),
-                ('tags', pa.list_(pa.string())),
-                ('embedding', pa.list_(pa.float32(), 1536)),  # OpenAI text-embedding-3-small dimension
-                ('created_at', pa.timestamp('us'))  # Use microsecond precision to match existing data
-            ])
-            
+        table_name = table_name or self.table_name
+        if table_name not in self.db.table_names():
             # Create empty table with schema
-            self.db.create_table(self.table_name, schema=schema)
-            print(f"Created table '{self.table_name}' in LanceDB")
+            self.db.create_table(table_name, schema=posts_schema(dim))
+            print(f"Created table '{table_name}' in LanceDB", file=sys.stderr)
+            return
+        table = self.db.open_table(table_name)
+        missing = {name: sql for name, sql in ADDED_POST_COLUMNS.items() if name not in table.schema.names}
+        if missing:
+            table.add_columns(missing)
     
-    def store_embeddings(self, posts: List[Dict], embeddings: List[List[float]]) -> Dict[str, Any]:
+    def _post_rows(self, table, posts: List[Dict], embeddings) -> pa.Table:
+        """Posts and their unit-length vectors as an Arrow table in `table`'s schema.
+
+        The vectors go into the embedding column as one buffer, so a memory-mapped
+        array is written without a per-float conversion.
+        """
+        vectors = normalize_vectors(embeddings)
+        if len(vectors) != len(posts):
+            raise ValueError(f'{len(posts)} posts but {len(vectors)} embeddings')
+        dim = table.schema.field('embedding').type.list_size
+        if len(vectors) and vectors.shape[1] != dim:
+            raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the table {dim}")
+        now = datetime.now()
+        columns = {
+            'id': pa.array([int(post['id']) for post in posts], pa.int64()),
+            'title': pa.array([post['title'] for post in posts], pa.string()),
+            'content': pa.array([post['content'] for post in posts], pa.string()),
+            'date': pa.array([post['date'] for post in posts], pa.string()),
+            'permalink': pa.array([post['permalink'] for post in posts], pa.string()),
+            'categories': pa.array([post.get('categories') or [] for post in posts], pa.list_(pa.string())),
+            'tags': pa.array([post.get('tags') or [] for post in posts], pa.list_(pa.string())),
+            'embedding': pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1), pa.float32()), dim),
+            'created_at': pa.array([now] * len(posts), pa.timestamp('us')),
+            'content_hash': pa.array([content_hash(post) for post in posts], pa.string()),
+            'modified': pa.array([post.get('modified') for post in posts], pa.string()),
+        }
+        return pa.Table.from_arrays([columns[field.name] for field in table.schema], schema=table.schema)
+
+    def store_embeddings(self, posts: List[Dict], embeddings: List[List[float]],
+                         model: Optional[str] = None) -> Dict[str, Any]:
         """Store post embeddings in LanceDB"""
         try:
-            self.create_table_if_not_exists()
-            table = self.db.open_table(self.table_name)
-            
-            # Prepare data for insertion
-            data = []
-            for post, embedding in zip(posts, embeddings):
-                data.append({
-                    'id': post['id'],
-                    'title': post['title'],
-                    'content': post['content'],
-                    'date': post['date'],
-                    'permalink': post['permalink'],
-                    'categories': post.get('categories', []),
-                    'tags': post.get('tags', []),
-                    'embedding': embedding,
-                    'created_at': datetime.now().replace(microsecond=datetime.now().microsecond)  # Ensure microsecond precision
-                })
-            
-            # Insert data (LanceDB will handle duplicates automatically)
-            table.add(data)
-            
-            return {
-                'success': True,
-                'data': f'Stored {len(data)} embeddings in LanceDB'
-            }
-            
+            with self._writing([post['id'] for post in posts], model) as table_name:
+                return self._store(table_name, posts, embeddings)
         except Exception as e:
             return {
                 'success': False,
                 'data': f'Failed to store embeddings: {str(e)}'
             }
+
+    def _store(self, table_name: str, posts: List[Dict], embeddings: List[List[float]]) -> Dict[str, Any]:
+        self.create_table_if_not_exists(table_name, len(embeddings[0]) if len(embeddings) else 1536)
+        table = self._open_table(table_name)
+
+        # Prepare data for insertion
+        with instrumentation.stage('prepare'):
+            data = self._post_rows(table, posts, embeddings)
+
+        # Insert data (LanceDB will handle duplicates automatically)
+        version = table.version
+        with instrumentation.stage('add'):
+            table.add(data)
+        instrumentation.count('rows_written', data.num_rows)
+        self._update_keyword_index(table_name, table, version, posts)
+
+        return {
+            'success': True,
+            'data': f'Stored {data.num_rows} embeddings in LanceDB'
+        }
     
+    def _update_keyword_index(self, table_name: str, table, before_version: int, posts: List[Dict]):
+        """Index written posts in the viewer's keyword index, if it was built and in sync.
+
+        Only the serving table is indexed; a failure leaves the index behind the table,
+        and the viewer's next search catches up.
+        """
+        if table_name != self.table_name or not NgramIndex.exists(self.db_path, self.logical_table_name):
+            return
+        try:
+            with instrumentation.stage('keyword_index'):
+                index = NgramIndex(self.db_path, self.logical_table_name)
+                try:
+                    index.update(table_name, before_version, table.version, [
+                        {'id': post['id'], 'title': post['title'], 'content': post['content'],
+                         'content_hash': content_hash(post)}
+                        for post in posts
+                    ])
+                finally:
+                    index.close()
+        except Exception as e:
+            print(f"Keyword index not updated: {e}", file=sys.stderr)
+
+    def _post_ids_matching(self, condition: str) -> List[int]:
+        table = self._open_table()
+        with instrumentation.stage('filter'):
+            ids = table.search().where(condition).select(['id']).limit(None).to_arrow()
+        return ids.column('id').to_pylist()
+
+    def _vector_cache(self, table) -> VectorCache:
+        """The memory-mapped vectors of `table`, remapped when the table has changed"""
+        cache = self.vector_caches.get(table.name)
+        if cache is None or cache.meta['version'] != table.version:
+            cache = VectorCache(self.db_path, table.name).load(table)
+            self.vector_caches[table.name] = cache
+        return cache
+
+    def _use_exact_search(self, table, mode: str = 'auto') -> bool:
+        if mode in ('exact', 'ann'):
+            return mode == 'exact'
+        return table.count_rows() <= load_config().exact_search_max_rows
+
+    def _nearest(self, table, query_embedding: List[float], limit: int,
+                 filters: Optional[Dict], columns: List[str], mode: str = 'auto',
+                 min_similarity: Optional[float] = None) -> pa.Table:
+        """Nearest rows of a posts table with their `_distance` in the table's metric, closest first.
+
+        Small tables are scanned exactly over the memory-mapped vector cache (filters
+        applied as a mask over its metadata); larger ones go through LanceDB search.
+        Rows less similar than `min_similarity` are excluded by the search itself.
+        """
+        query_embedding = normalize_vectors(query_embedding)
+        bound = max_distance(self.metric, min_similarity)
+        if not self._use_exact_search(table, mode):
+            query = table.search(query_embedding.tolist()).distance_type(self.metric).limit(limit)
+            if bound is not None:
+                query = query.distance_range(upper_bound=bound)
+            condition = filter_condition(filters)
+            if condition:
+                query = query.where(condition)
+            with instrumentation.stage('query'):
+                return query.select(columns).to_arrow()
+
+        ids, distances = self._vector_cache(table).search(query_embedding, limit, filters, self.metric, bound)
+        if not len(ids):
+            return pa.schema([table.schema.field(c) for c in columns]).empty_table().append_column(
+                '_distance', pa.array([], pa.float32()))
+        with instrumentation.stage('fetch'):
+            rows = (table.search().where(f"id IN ({', '.join(str(int(pid)) for pid in ids)})")
+                    .select(columns).limit(None).to_arrow())
+        position = {pid: i for i, pid in enumerate(rows.column('id').to_pylist())}
+        # Posts deleted since the cache was mapped are skipped
+        found = [i for i, pid in enumerate(ids.tolist()) if pid in position]
+        rows = rows.take([position[int(ids[i])] for i in found])
+        return rows.append_column('_distance', pa.array(distances[found], pa.float32()))
+
+    def nearest_posts(self, query_embedding: List[float], limit: int = 10,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        """Nearest posts (without embeddings), closest first"""
+        if self.table_name not in self.db.table_names():
+            return []
+        rows = self._nearest(self._open_table(), query_embedding, limit, filters,
+                             ['id', 'title', 'content', 'permalink']).drop_columns(['_distance']).to_pylist()
+        instrumentation.count('rows_returned', len(rows))
+        return rows
+
+    def nearest_chunks(self, query_embedding: List[float], limit: int = 40,
+                       filters: Optional[Dict] = None) -> Optional[List[Dict]]:
+        """Nearest chunks (without embeddings), closest first; None when there is no chunks table"""
+        if self.chunks_table_name not in self.db.table_names():
+            return None
+        query = (self._open_table(self.chunks_table_name).search(normalize_vectors(query_embedding).tolist())
+                 .distance_type(self.metric).limit(limit))
+        condition = filter_condition(filters)
+        if condition:
+            # Chunks have no dates or categories: restrict them to the matching posts
+            post_ids = self._post_ids_matching(condition)
+            if not post_ids:
+                return []
+            query = query.where(f"post_id IN ({', '.join(str(int(pid)) for pid in post_ids)})", prefilter=True)
+        query = query.select(['post_id', 'chunk_index', 'title', 'permalink', 'heading_path', 'text'])
+        with instrumentation.stage('query'):
+            rows = query.to_arrow().to_pylist()
+        instrumentation.count('rows_returned', len(rows))
+        return rows
+
     def search_similar(self, query_embedding: List[float], limit: int = 5, 
-                      filters: Optional[Dict] = None) -> Dict[str, Any]:
-        """Search for similar content using embeddings"""
+                      filters: Optional[Dict] = None, mode: str = 'auto',
+                      min_similarity: Optional[float] = None) -> Dict[str, Any]:
+        """Search for similar content using embeddings
+
+        `mode` is 'exact' (scan the memory-mapped vectors), 'ann' (LanceDB search) or
+        'auto', which scans exactly up to FUKAMI_LENS_EXACT_SEARCH_MAX_ROWS posts.
+        `similarity_score` is the cosine similarity (higher is closer) and `distance`
+        the raw distance in the table's metric; `min_similarity` drops weaker matches.
+        """
         try:
             if self.table_name not in self.db.table_names():
                 return {
@@ -118,23 +462,14 @@ class LanceDBManager:
                     'data': 'No embeddings table found. Please store embeddings first.'
                 }
             
-            table = self.db.open_table(self.table_name)
-            
-            # Build query
-            query = table.search(query_embedding).limit(limit)
-            
-            # Apply filters if provided
-            if filters:
-                if 'start_date' in filters:
-                    query = query.where(f"date >= '{filters['start_date']}'")
-                if 'end_date' in filters:
-                    query = query.where(f"date <= '{filters['end_date']}'")
-                if 'categories' in filters and filters['categories']:
-                    categories_filter = " OR ".join([f"'{cat}' IN categories" for cat in filters['categories']])
-                    query = query.where(f"({categories_filter})")
-            
-            # Execute search
-            results = query.to_pandas()
+            table = self._open_table()
+            metric = self.metric
+            results = self._nearest(table, query_embedding, limit, filters,
+                                    ['id', 'title', 'content', 'date', 'permalink', 'categories', 'tags'],
+                                    mode, min_similarity)
+            with instrumentation.stage('to_pandas'):
+                results = results.to_pandas()
+            instrumentation.count('rows_returned', len(results))
             
             # Convert results to list of dictionaries
             similar_posts = []
@@ -147,14 +482,16 @@ class LanceDBManager:
                     'permalink': row['permalink'],
                     'categories': row['categories'],
                     'tags': row['tags'],
-                    'similarity_score': float(row['_distance']) if '_distance' in row else None
+                    'similarity_score': similarity(metric, float(row['_distance'])),
+                    'distance': float(row['_distance'])
                 })
             
             return {
                 'success': True,
                 'data': {
                     'posts': similar_posts,
-                    'count': len(similar_posts)
+                    'count': len(similar_posts),
+                    'metric': metric
                 }
             }
             
@@ -164,6 +501,116 @@ class LanceDBManager:
                 'data': f'Failed to search embeddings: {str(e)}'
             }
     
+    def create_vector_index(self, index_type: str = 'IVF_PQ', num_partitions: Optional[int] = None,
+                            num_sub_vectors: Optional[int] = None) -> Dict[str, Any]:
+        """Build (or rebuild) the vector index of the posts table with the table's metric"""
+        try:
+            if self.table_name not in self.db.table_names():
+                return {
+                    'success': False,
+                    'data': 'No embeddings table found. Please store embeddings first.'
+                }
+            params = {k: v for k, v in (('num_partitions', num_partitions),
+                                        ('num_sub_vectors', num_sub_vectors)) if v}
+            started = time.perf_counter()
+            with instrumentation.stage('create_index'):
+                self._open_table().create_index(metric=self.metric, vector_column_name='embedding',
+                                                index_type=index_type, replace=True, **params)
+            return {
+                'success': True,
+                'data': {
+                    'index_type': index_type,
+                    'metric': self.metric,
+                    'seconds': round(time.perf_counter() - started, 3),
+                    **params
+                }
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to create index: {str(e)}'
+            }
+
+    def set_metric(self, metric: str) -> Dict[str, Any]:
+        """Search the table with `metric` from now on, rebuilding its vector index if it has one.
+
+        Stored vectors are unit-length, so they need no rewrite: for unit vectors the
+        three metrics rank neighbours the same way.
+        """
+        if metric not in METRICS:
+            return {
+                'success': False,
+                'data': f"Unknown distance metric '{metric}'; use one of {', '.join(METRICS)}"
+            }
+        with state_lock(self.db_path, self.logical_table_name):
+            state = self.refresh_state()
+            state['metric'] = metric
+            save_state(self.db_path, self.logical_table_name, state)
+        rebuilt = []
+        if self.table_name in self.db.table_names():
+            for index in self._open_table().list_indices():
+                if index.columns == ['embedding']:
+                    index_type = {'IvfPq': 'IVF_PQ', 'IvfFlat': 'IVF_FLAT', 'IvfSq': 'IVF_SQ',
+                                  'IvfHnswSq': 'IVF_HNSW_SQ', 'IvfHnswPq': 'IVF_HNSW_PQ',
+                                  'IvfHnswFlat': 'IVF_HNSW_FLAT', 'IvfRq': 'IVF_RQ'}.get(index.index_type, 'IVF_PQ')
+                    result = self.create_vector_index(index_type)
+                    if not result['success']:
+                        return result
+                    rebuilt.append(index_type)
+        return {
+            'success': True,
+            'data': {
+                'metric': metric,
+                'rebuilt_indexes': rebuilt
+            }
+        }
+
+    def embed_query(self, text: str, api_key: str, model: Optional[str] = None):
+        """Embedding of a search query, from the query-embedding cache when possible.
+
+        `model` defaults to the model of the vectors being served. Returns the vector
+        and whether it came from the cache.
+        """
+        config = load_config()
+        model = self.state['model'] or model or config.embeddings_model
+        cache = QueryEmbeddingCache(self.db_path, config.query_embedding_cache_max_entries)
+        try:
+            with instrumentation.stage('embedding_cache'):
+                vector = cache.get(text, model)
+            if vector is not None:
+                instrumentation.count('cache_hits', 1)
+                return vector.tolist(), True
+            if not api_key:
+                raise ValueError('No API key provided')
+            from get_embedding import get_openai_embeddings
+            with instrumentation.stage('api_request'):
+                vector = get_openai_embeddings([text], model, api_key)[0]
+            cache.put(text, model, vector)
+            return vector, False
+        finally:
+            cache.close()
+
+    def search_text(self, query_text: str, api_key: str, limit: int = 5,
+                    filters: Optional[Dict] = None, model: Optional[str] = None,
+                    mode: str = 'auto', min_similarity: Optional[float] = None) -> Dict[str, Any]:
+        """Embed a query and search with it in one call"""
+        if not query_text.strip():
+            return {
+                'success': False,
+                'data': 'No query text provided'
+            }
+        try:
+            query_embedding, cached = self.embed_query(query_text, api_key, model)
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to embed query: {str(e)}'
+            }
+        result = self.search_similar(query_embedding, limit, filters, mode, min_similarity)
+        if result['success']:
+            result['data']['embedding_cached'] = cached
+        return result
+
     def get_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
         try:
@@ -177,7 +624,7 @@ class LanceDBManager:
                     }
                 }
             
-            table = self.db.open_table(self.table_name)
+            table = self._open_table()
             
             # Get table statistics
             total_posts = len(table)
@@ -202,7 +649,10 @@ class LanceDBManager:
                     'total_posts': total_posts,
                     'db_size_mb': db_size_mb,
                     'table_name': self.table_name,
-                    'db_path': self.db_path
+                    'db_path': self.db_path,
+                    'embedding_model': self.state['model'],
+                    'metric': self.metric,
+                    'migrating_to': (self.state['migration'] or {}).get('target_model')
                 }
             }
             
@@ -215,36 +665,33 @@ class LanceDBManager:
     def check_existing_embeddings(self, post_ids: List[int]) -> Dict[str, Any]:
         """Check which post IDs already have embeddings in the database"""
         try:
-            if self.table_name not in self.db.table_names():
+            # Posts waiting in the ingestion queue already have their embedding
+            queued_ids = self._queued_ids(post_ids)
+            if queued_ids:
+                post_ids = [pid for pid in post_ids if pid not in queued_ids]
+
+            if self.table_name not in self.db.table_names() or not post_ids:
                 return {
                     'success': True,
                     'data': {
-                        'existing_ids': [],
+                        'existing_ids': sorted(queued_ids),
                         'missing_ids': post_ids
                     }
                 }
             
-            table = self.db.open_table(self.table_name)
-            
-            # Use a single query to get all existing post IDs
-            if not post_ids:
-                return {
-                    'success': True,
-                    'data': {
-                        'existing_ids': [],
-                        'missing_ids': []
-                    }
-                }
+            table = self._open_table()
             
             # Build query for all post IDs at once
-            id_conditions = " OR ".join([f"id = {pid}" for pid in post_ids])
-            results = table.search().where(f"({id_conditions})").to_pandas()
-            
-            # Extract existing IDs from results
-            existing_ids = results['id'].tolist() if not results.empty else []
+            requested = pa.array(post_ids, pa.int64())
+            with instrumentation.stage('query'):
+                results = (table.search().where(f"id IN ({', '.join(str(int(pid)) for pid in post_ids)})")
+                           .select(['id']).limit(None).to_arrow())
+            instrumentation.count('rows_returned', results.num_rows)
             
-            # Find missing IDs
-            missing_ids = [pid for pid in post_ids if pid not in existing_ids]
+            # Existing and missing IDs, in request order
+            found = pc.is_in(requested, value_set=results.column('id').combine_chunks())
+            existing_ids = pc.filter(requested, found).to_pylist() + sorted(queued_ids)
+            missing_ids = pc.filter(requested, pc.invert(found)).to_pylist()
             
             return {
                 'success': True,
@@ -259,6 +706,67 @@ class LanceDBManager:
                 'success': False,
                 'data': f'Failed to check existing embeddings: {str(e)}'
             }
+
+    def diff(self, posts: List[Dict]) -> Dict[str, Any]:
+        """Compare `posts` ({'id', 'hash'} for every published post) with the table.
+
+        missing: not embedded yet; stale: embedded from other content (or before
+        hashes were recorded); orphaned: embedded but no longer in `posts`. Posts
+        waiting in the ingestion queue count as up to date.
+        """
+        try:
+            wanted = pa.table({
+                'id': pa.array([int(p['id']) for p in posts], pa.int64()),
+                'hash': pa.array([p.get('hash') for p in posts], pa.string()),
+            })
+            if self.table_name in self.db.table_names():
+                table = self._open_table()
+                has_hash = 'content_hash' in table.schema.names
+                with instrumentation.stage('scan_keys'):
+                    stored = table.search().select(['id', 'content_hash'] if has_hash else ['id']).limit(None).to_arrow()
+                if not has_hash:
+                    # Written before hashes were recorded: everything is stale
+                    stored = stored.append_column('content_hash', pa.nulls(stored.num_rows, pa.string()))
+                instrumentation.count('rows_scanned', stored.num_rows)
+            else:
+                stored = pa.table({'id': pa.array([], pa.int64()), 'content_hash': pa.array([], pa.string())})
+
+            with instrumentation.stage('diff'):
+                missing = wanted.join(stored, 'id', join_type='left anti').column('id')
+                orphaned = stored.join(wanted, 'id', join_type='left anti').column('id')
+                both = wanted.join(stored, 'id', join_type='inner')
+                changed = pc.or_kleene(
+                    pc.is_null(both.column('content_hash')),
+                    pc.not_equal(both.column('hash'), both.column('content_hash'))
+                )
+                stale = pc.filter(both.column('id'), pc.fill_null(changed, True))
+
+                queued = self._queued_ids(pc.unique(pa.concat_arrays([
+                    missing.combine_chunks(), stale.combine_chunks()
+                ])).to_pylist())
+                if queued:
+                    queued = pa.array(sorted(queued), pa.int64())
+                    missing = pc.filter(missing, pc.invert(pc.is_in(missing, value_set=queued)))
+                    stale = pc.filter(stale, pc.invert(pc.is_in(stale, value_set=queued)))
+
+            def ids(column):
+                return pc.take(column, pc.sort_indices(column)).to_pylist()
+
+            return {
+                'success': True,
+                'data': {
+                    'missing_ids': ids(missing),
+                    'stale_ids': ids(stale),
+                    'orphaned_ids': ids(orphaned),
+                    'up_to_date': len(wanted) - len(missing) - len(stale)
+                }
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to diff embeddings: {str(e)}'
+            }
     
     def get_embeddings_by_ids(self, post_ids: List[int]) -> Dict[str, Any]:
         """Get embeddings for specific post IDs"""
@@ -269,16 +777,20 @@ class LanceDBManager:
                     'data': 'No embeddings table found'
                 }
             
-            table = self.db.open_table(self.table_name)
+            table = self._open_table()
             
             # Build query for multiple IDs
             id_conditions = " OR ".join([f"id = {pid}" for pid in post_ids])
-            results = table.search().where(f"({id_conditions})").to_pandas()
+            with instrumentation.stage('query'):
+                results = table.search().where(f"({id_conditions})").to_arrow()
+            with instrumentation.stage('to_pandas'):
+                results = results.to_pandas()
+            instrumentation.count('rows_returned', len(results))
             
             embeddings = {}
             for _, row in results.iterrows():
                 embeddings[int(row['id'])] = {
-                    'embedding': row['embedding'].tolist() if hasattr(row['embedding'], 'tolist') else list(row['embedding']),
+                    'embedding': row['embedding'],
                     'title': row['title'],
                     'content': row['content'],
                     'date': row['date'],
@@ -298,82 +810,477 @@ class LanceDBManager:
                 'data': f'Failed to get embeddings by IDs: {str(e)}'
             }
     
-    def upsert_embeddings(self, posts: List[Dict], embeddings: List[List[float]]) -> Dict[str, Any]:
+    def upsert_embeddings(self, posts: List[Dict], embeddings: List[List[float]],
+                          model: Optional[str] = None) -> Dict[str, Any]:
         """Upsert post embeddings (insert new, update existing)"""
         try:
-            self.create_table_if_not_exists()
-            table = self.db.open_table(self.table_name)
-            
-            # Prepare data for upsert
-            data = []
-            post_ids = []
-            for post, embedding in zip(posts, embeddings):
-                post_ids.append(post['id'])
-                data.append({
-                    'id': post['id'],
-                    'title': post['title'],
-                    'content': post['content'],
-                    'date': post['date'],
-                    'permalink': post['permalink'],
-                    'categories': post.get('categories', []),
-                    'tags': post.get('tags', []),
-                    'embedding': embedding,
-                    'created_at': datetime.now().replace(microsecond=datetime.now().microsecond)  # Ensure microsecond precision
-                })
-            
-            # Delete existing records with the same IDs to avoid duplicates
-            if post_ids:
-                id_conditions = " OR ".join([f"id = {pid}" for pid in post_ids])
+            with self._writing([post['id'] for post in posts], model) as table_name:
+                return self._upsert(table_name, posts, embeddings)
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to upsert embeddings: {str(e)}'
+            }
+
+    def _upsert(self, table_name: str, posts: List[Dict], embeddings: List[List[float]]) -> Dict[str, Any]:
+        self.create_table_if_not_exists(table_name, len(embeddings[0]) if len(embeddings) else 1536)
+        table = self._open_table(table_name)
+
+        # Prepare data for upsert
+        with instrumentation.stage('prepare'):
+            data = self._post_rows(table, posts, embeddings)
+        post_ids = [post['id'] for post in posts]
+
+        # Delete existing records with the same IDs to avoid duplicates
+        version = table.version
+        if post_ids:
+            id_conditions = " OR ".join([f"id = {pid}" for pid in post_ids])
+            with instrumentation.stage('delete'):
                 table.delete(f"({id_conditions})")
-            
-            # Add new data
+
+        # Add new data
+        with instrumentation.stage('add'):
             table.add(data)
-            
+        instrumentation.count('rows_written', data.num_rows)
+        self._update_keyword_index(table_name, table, version, posts)
+
+        return {
+            'success': True,
+            'data': f'Upserted {data.num_rows} embeddings in LanceDB'
+        }
+
+    @property
+    def chunks_table_name(self) -> str:
+        return f'{self.table_name}_chunks'
+
+    def upsert_chunks(self, post_ids: List[int], chunks: List[Dict], embeddings,
+                      model: Optional[str] = None) -> Dict[str, Any]:
+        """Replace the chunks of `post_ids` with `chunks` and their `embeddings` (one row each)"""
+        try:
+            with self._writing(post_ids, model) as table_name:
+                self.write_chunks(f'{table_name}_chunks', post_ids, chunks, embeddings)
+
             return {
                 'success': True,
-                'data': f'Upserted {len(data)} embeddings in LanceDB'
+                'data': f'Upserted {len(chunks)} chunks for {len(post_ids)} posts in LanceDB'
             }
-            
+
         except Exception as e:
             return {
                 'success': False,
-                'data': f'Failed to upsert embeddings: {str(e)}'
+                'data': f'Failed to upsert chunks: {str(e)}'
+            }
+
+    def write_chunks(self, table_name: str, post_ids: List[int], chunks: List[Dict], embeddings):
+        """Replace the rows of `post_ids` in the chunks table `table_name`"""
+        embeddings = normalize_vectors(embeddings)
+        dim = embeddings.shape[1] if embeddings.ndim == 2 else 1536
+        schema = chunks_schema(dim)
+        if table_name not in self.db.table_names():
+            self.db.create_table(table_name, schema=schema)
+        table = self._open_table(table_name)
+
+        if post_ids:
+            with instrumentation.stage('delete_chunks'):
+                table.delete(f"post_id IN ({', '.join(str(int(pid)) for pid in post_ids)})")
+        if chunks:
+            now = datetime.now()
+            batch = pa.table({
+                'post_id': pa.array([c['post_id'] for c in chunks], pa.int64()),
+                'chunk_index': pa.array([c['chunk_index'] for c in chunks], pa.int32()),
+                'title': pa.array([c.get('title', '') for c in chunks], pa.string()),
+                'permalink': pa.array([c.get('permalink', '') for c in chunks], pa.string()),
+                'heading_path': pa.array([c.get('heading_path', []) for c in chunks], pa.list_(pa.string())),
+                'text': pa.array([c['text'] for c in chunks], pa.string()),
+                'tokens': pa.array([c['tokens'] for c in chunks], pa.int32()),
+                'embedding': pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel(), pa.float32()), dim),
+                'created_at': pa.array([now] * len(chunks), pa.timestamp('us')),
+            }, schema=schema)
+            with instrumentation.stage('add_chunks'):
+                table.add(batch)
+            instrumentation.count('chunks_written', len(chunks))
+
+    # Ingestion queue
+
+    def _queued_ids(self, post_ids: List[int]) -> set:
+        if not post_ids or not os.path.exists(os.path.join(self.db_path, f'{self.logical_table_name}.queue.sqlite3')):
+            return set()
+        queue = IngestQueue(self.db_path, self.logical_table_name)
+        try:
+            return queue.pending_ids(post_ids)
+        finally:
+            queue.close()
+
+    def enqueue_embeddings(self, posts: List[Dict], embeddings: List[List[float]],
+                           model: Optional[str] = None) -> Dict[str, Any]:
+        """Queue post upserts for the single queue writer (see drain_queue)"""
+        try:
+            if len(embeddings) != len(posts):
+                raise ValueError(f'{len(posts)} posts but {len(embeddings)} embeddings')
+            queue = IngestQueue(self.db_path, self.logical_table_name)
+            try:
+                queued = queue.enqueue(posts, embeddings, model)
+                stats = queue.stats()
+            finally:
+                queue.close()
+            return {
+                'success': True,
+                'data': {'queued': queued, 'queue': stats}
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to queue embeddings: {str(e)}'
             }
 
+    def drain_queue(self, batch_size: Optional[int] = None, linger: Optional[float] = None,
+                    max_seconds: float = 300) -> Dict[str, Any]:
+        """Write queued posts in batches of up to `batch_size`, as the only writer.
+
+        While fewer than `batch_size` posts are queued, the writer waits until the
+        oldest has been queued for `linger` seconds so concurrent saves share a commit.
+        Returns at once when another process is already draining.
+        """
+        config = load_config()
+        batch_size = batch_size or config.write_batch_size
+        linger = config.queue_linger_ms / 1000 if linger is None else linger
+        queue = IngestQueue(self.db_path, self.logical_table_name)
+        started = time.monotonic()
+        written = 0
+        batches = 0
+        try:
+            while True:
+                with queue.writer_lock() as writer:
+                    if not writer:
+                        return {
+                            'success': True,
+                            'data': {'writer': 'busy', 'written': written, 'batches': batches, 'queue': queue.stats()}
+                        }
+                    while time.monotonic() - started < max_seconds:
+                        depth = queue.depth()
+                        if depth == 0:
+                            break
+                        wait = linger - queue.oldest_age()
+                        if depth < batch_size and wait > 0:
+                            time.sleep(wait)
+                            continue
+                        jobs = queue.claim(batch_size)
+                        by_model = {}
+                        for job in jobs:
+                            by_model.setdefault(job['model'], []).append(job)
+                        for model, group in by_model.items():
+                            with instrumentation.stage('write_batch'):
+                                result = self.upsert_embeddings(
+                                    [job['post'] for job in group],
+                                    np.stack([job['embedding'] for job in group]),
+                                    model
+                                )
+                            if not result['success']:
+                                queue.record_error(result['data'])
+                                raise Exception(result['data'])
+                            queue.ack(group)
+                            written += len(group)
+                        batches += 1
+                # A post queued while the lock was released has seen it held and left
+                # the work to this writer
+                if queue.depth() == 0 or time.monotonic() - started >= max_seconds:
+                    break
+            return {
+                'success': True,
+                'data': {'writer': 'done', 'written': written, 'batches': batches, 'queue': queue.stats()}
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to drain queue: {str(e)}'
+            }
+        finally:
+            queue.close()
+
+    def queue_stats(self) -> Dict[str, Any]:
+        queue = IngestQueue(self.db_path, self.logical_table_name)
+        try:
+            return {
+                'success': True,
+                'data': queue.stats()
+            }
+        finally:
+            queue.close()
+
+    # Semantic answer cache
+
+    SEMANTIC_CACHE_TABLE = 'semantic_cache'
+
+    def _semantic_cache_schema(self, dim: int) -> pa.Schema:
+        return pa.schema([
+            ('id', pa.string()),
+            ('query', pa.string()),
+            ('embedding', pa.list_(pa.float32(), dim)),
+            ('answer', pa.string()),
+            ('source_ids', pa.list_(pa.int64())),
+            ('scope', pa.string()),           # What else the answer depends on (LLM, prompt, filters)
+            ('table_name', pa.string()),      # Physical posts table it was answered from
+            ('table_version', pa.int64()),
+            ('hits', pa.int64()),
+            ('created_at', pa.timestamp('us')),
+            ('last_hit_at', pa.timestamp('us'))
+        ])
+
+    def _semantic_cache(self, dim: Optional[int] = None):
+        """The cache table, created for `dim`-dimensional queries; None if it does not fit them"""
+        if self.SEMANTIC_CACHE_TABLE not in self.db.table_names():
+            if dim is None:
+                return None
+            return self.db.create_table(self.SEMANTIC_CACHE_TABLE, schema=self._semantic_cache_schema(dim))
+        table = self._open_table(self.SEMANTIC_CACHE_TABLE)
+        if dim is not None and table.schema.field('embedding').type.list_size != dim:
+            # Queries of another embedding model: the entries can never match again
+            self.db.drop_table(self.SEMANTIC_CACHE_TABLE)
+            return self.db.create_table(self.SEMANTIC_CACHE_TABLE, schema=self._semantic_cache_schema(dim))
+        return table
+
+    def semantic_cache_lookup(self, query_embedding: List[float], scope: str = '',
+                              threshold: Optional[float] = None) -> Dict[str, Any]:
+        """Cached answer for the most similar earlier query, if its cosine similarity reaches `threshold`"""
+        try:
+            config = load_config()
+            threshold = config.semantic_cache_threshold if threshold is None else float(threshold)
+            miss = {'success': True, 'data': {'hit': False}}
+            if self.SEMANTIC_CACHE_TABLE not in self.db.table_names():
+                return miss
+            table = self._open_table(self.SEMANTIC_CACHE_TABLE)
+            if table.schema.field('embedding').type.list_size != len(query_embedding):
+                return miss
+
+            cutoff = datetime.now() - timedelta(seconds=config.semantic_cache_ttl)
+            condition = (
+                f"scope = {sql_string(scope)} AND table_name = {sql_string(self.table_name)} "
+                f"AND created_at >= timestamp '{cutoff.isoformat(sep=' ')}'"
+            )
+            query = (table.search(query_embedding).metric('cosine').where(condition, prefilter=True)
+                     .select(['id', 'query', 'answer', 'source_ids', 'created_at']).limit(1))
+            with instrumentation.stage('query'):
+                rows = query.to_arrow().to_pylist()
+            if not rows:
+                return miss
+            entry = rows[0]
+            similarity = 1.0 - float(entry['_distance'])
+            if similarity < threshold:
+                return {'success': True, 'data': {'hit': False, 'best_similarity': round(similarity, 4)}}
+
+            with instrumentation.stage('update'):
+                table.update(where=f"id = {sql_string(entry['id'])}",
+                             values_sql={'hits': 'hits + 1', 'last_hit_at': f"timestamp '{datetime.now().isoformat(sep=' ')}'"})
+            return {
+                'success': True,
+                'data': {
+                    'hit': True,
+                    'similarity': round(similarity, 4),
+                    'query': entry['query'],
+                    'answer': entry['answer'],
+                    'source_ids': entry['source_ids'],
+                    'cached_at': entry['created_at']
+                }
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to look up semantic cache: {str(e)}'
+            }
+
+    def semantic_cache_store(self, query: str, query_embedding: List[float], answer: str,
+                             source_ids: List[int], scope: str = '') -> Dict[str, Any]:
+        """Cache `answer` for `query`, then evict expired and excess entries"""
+        try:
+            config = load_config()
+            table = self._semantic_cache(len(query_embedding))
+            posts_version = (self._open_table().version
+                             if self.table_name in self.db.table_names() else 0)
+            now = datetime.now()
+            row = pa.table({
+                'id': [uuid.uuid4().hex],
+                'query': [query],
+                'embedding': [query_embedding],
+                'answer': [answer],
+                'source_ids': [[int(pid) for pid in source_ids]],
+                'scope': [scope],
+                'table_name': [self.table_name],
+                'table_version': [posts_version],
+                'hits': [0],
+                'created_at': [now],
+                'last_hit_at': [now],
+            }, schema=table.schema)
+            with instrumentation.stage('add'):
+                table.add(row)
+            evicted = self._evict_semantic_cache(table, config.semantic_cache_ttl, config.semantic_cache_max_entries)
+            return {
+                'success': True,
+                'data': {'stored': True, 'evicted': evicted}
+            }
+
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Failed to store in semantic cache: {str(e)}'
+            }
+
+    def _evict_semantic_cache(self, table, ttl: int, max_entries: int) -> int:
+        """Drop entries older than `ttl` seconds, then the least recently used beyond `max_entries`"""
+        before = table.count_rows()
+        cutoff = datetime.now() - timedelta(seconds=ttl)
+        with instrumentation.stage('evict'):
+            table.delete(f"created_at < timestamp '{cutoff.isoformat(sep=' ')}'")
+            excess = table.count_rows() - max_entries
+            if excess > 0:
+                entries = table.search().select(['id', 'last_hit_at']).limit(None).to_arrow()
+                oldest = entries.sort_by('last_hit_at').column('id').slice(0, excess).to_pylist()
+                table.delete(f"id IN ({', '.join(sql_string(i) for i in oldest)})")
+        return before - table.count_rows()
+
+    def invalidate_semantic_cache(self, post_ids: List[int]) -> int:
+        """Drop cached answers that used any of `post_ids` as a source"""
+        table = self._semantic_cache()
+        if table is None or not post_ids:
+            return 0
+        before = table.count_rows()
+        with instrumentation.stage('invalidate_cache'):
+            table.delete(f"array_has_any(source_ids, [{', '.join(str(int(pid)) for pid in post_ids)}])")
+        return before - table.count_rows()
+
+    def clear_semantic_cache(self) -> Dict[str, Any]:
+        if self.SEMANTIC_CACHE_TABLE in self.db.table_names():
+            self.db.drop_table(self.SEMANTIC_CACHE_TABLE)
+        return {
+            'success': True,
+            'data': 'Cleared the semantic cache'
+        }
+
+
+def request_embeddings(data: Dict) -> Any:
+    """A write request's vectors: the `embeddings` JSON lists, or the binary
+    `embeddings_file` sidecar (`embeddings_format` f32/npy/arrow, `embeddings_dim`)"""
+    if data.get('embeddings_file'):
+        with instrumentation.stage('read_embeddings'):
+            return load_embeddings_file(data['embeddings_file'], data.get('embeddings_format'),
+                                        data.get('embeddings_dim'))
+    return data.get('embeddings', [])
+
 
 def main():
     """Main function to handle LanceDB operations"""
     if len(sys.argv) < 3:
-        print(json.dumps({
+        write_json({
             'success': False,
             'data': 'Usage: python lancedb_operations.py <input_file> <operation>'
-        }))
+        })
         sys.exit(1)
     
     input_file = sys.argv[1]
     operation = sys.argv[2]
+    instr = Instrumentation('lancedb_operations')
+    instr.operation = operation
     
     try:
         # Read input data
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = instr.read_input(input_file, json.load)
+        instr.enable_timings(data.get('timings', False))
         
         # Initialize LanceDB manager
         db_path = data.get('db_path', '/tmp/lancedb')
         table_name = data.get('table_name', 'wordpress_posts')
-        manager = LanceDBManager(db_path, table_name)
+        with instr.stage('connect'):
+            manager = LanceDBManager(db_path, table_name)
         
         # Execute operation
         if operation == 'store':
             posts = data.get('posts', [])
-            embeddings = data.get('embeddings', [])
-            result = manager.store_embeddings(posts, embeddings)
+            embeddings = request_embeddings(data)
+            result = manager.store_embeddings(posts, embeddings, data.get('model'))
             
         elif operation == 'search':
             query_embedding = data.get('query_embedding', [])
             limit = data.get('limit', 5)
             filters = data.get('filters', {})
-            result = manager.search_similar(query_embedding, limit, filters)
+            result = manager.search_similar(query_embedding, limit, filters, data.get('search_mode', 'auto'),
+                                            data.get('min_similarity'))
+            
+        elif operation == 'search_text':
+            result = manager.search_text(
+                data.get('query_text', ''),
+                data.get('api_key', ''),
+                data.get('limit', 5),
+                data.get('filters', {}),
+                data.get('model'),
+                data.get('search_mode', 'auto'),
+                data.get('min_similarity')
+            )
+            
+        elif operation == 'create_index':
+            result = manager.create_vector_index(
+                data.get('index_type', 'IVF_PQ'),
+                data.get('num_partitions'),
+                data.get('num_sub_vectors')
+            )
+            
+        elif operation == 'set_metric':
+            result = manager.set_metric(data.get('metric', ''))
+            
+        elif operation == 'build_context':
+            from context_builder import ContextBuilder, DEFAULT_CANDIDATES
+            query_embedding = data.get('query_embedding', [])
+            if not query_embedding:
+                result = {
+                    'success': False,
+                    'data': 'build_context needs query_embedding'
+                }
+            else:
+                builder = ContextBuilder(manager, data.get('model') or 'gpt-4o-mini')
+                result = {
+                    'success': True,
+                    'data': builder.build(
+                        query_embedding,
+                        int(data.get('token_budget', 2048)),
+                        data.get('filters', {}),
+                        int(data.get('candidates', DEFAULT_CANDIDATES))
+                    )
+                }
+            
+        elif operation == 'enqueue_embeddings':
+            posts = data.get('posts', [])
+            embeddings = request_embeddings(data)
+            result = manager.enqueue_embeddings(posts, embeddings, data.get('model'))
+            
+        elif operation == 'drain_queue':
+            result = manager.drain_queue(
+                data.get('batch_size'),
+                data.get('linger'),
+                float(data.get('max_seconds', 300))
+            )
+            
+        elif operation == 'queue_stats':
+            result = manager.queue_stats()
+            
+        elif operation == 'semantic_cache_lookup':
+            result = manager.semantic_cache_lookup(
+                data.get('query_embedding', []),
+                data.get('scope', ''),
+                data.get('threshold')
+            )
+            
+        elif operation == 'semantic_cache_store':
+            result = manager.semantic_cache_store(
+                data.get('query', ''),
+                data.get('query_embedding', []),
+                data.get('answer', ''),
+                data.get('source_ids', []),
+                data.get('scope', '')
+            )
+            
+        elif operation == 'semantic_cache_clear':
+            result = manager.clear_semantic_cache()
             
         elif operation == 'stats':
             result = manager.get_stats()
@@ -382,14 +1289,42 @@ def main():
             post_ids = data.get('post_ids', [])
             result = manager.check_existing_embeddings(post_ids)
             
+        elif operation == 'diff':
+            result = manager.diff(data.get('posts', []))
+            
         elif operation == 'get_embeddings_by_ids':
             post_ids = data.get('post_ids', [])
             result = manager.get_embeddings_by_ids(post_ids)
             
         elif operation == 'upsert_embeddings':
             posts = data.get('posts', [])
-            embeddings = data.get('embeddings', [])
-            result = manager.upsert_embeddings(posts, embeddings)
+            embeddings = request_embeddings(data)
+            result = manager.upsert_embeddings(posts, embeddings, data.get('model'))
+
+        elif operation in ('reembed', 'reembed_status', 'reembed_abort'):
+            from embedding_migration import EmbeddingMigration
+            migration = EmbeddingMigration(manager)
+            if operation == 'reembed_status':
+                result = {'success': True, 'data': migration.status()}
+            elif operation == 'reembed_abort':
+                result = {'success': True, 'data': migration.abort()}
+            elif not data.get('api_key') or not data.get('target_model'):
+                result = {
+                    'success': False,
+                    'data': 'reembed needs api_key and target_model'
+                }
+            else:
+                result = {
+                    'success': True,
+                    'data': migration.run(
+                        data['api_key'],
+                        data['target_model'],
+                        batch_size=int(data.get('batch_size', 100)),
+                        max_batches=int(data.get('max_batches', 10)),
+                        drop_old=bool(data.get('drop_old', False)),
+                        current_model=data.get('current_model')
+                    )
+                }
             
         else:
             result = {
@@ -398,13 +1333,13 @@ def main():
             }
         
         # Output result
-        print(json.dumps(result, ensure_ascii=False))
+        instr.emit(result)
         
     except Exception as e:
-        print(json.dumps({
+        instr.emit({
             'success': False,
             'data': f'Error: {str(e)}'
-        }))
+        })
 
 
 if __name__ == '__main__':
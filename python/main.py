@@ -1,91 +1,107 @@
+import os
 import sys
+from utils.instrumentation import Instrumentation
 from config import load_config
-from conversion.html_to_markdown import html_to_markdown
-from chunking.tokenizer import get_tokenizer
-import tempfile, os
+from conversion.html_to_markdown import convert_document
+from chunking.fallback import TokenChunker
+from chunking.tokenizer import build_hybrid_chunker, get_tokenizer
 import json
 
+def parse_options(argv):
+    """Split argv into positional args and --name[=value] options."""
+    args = [arg for arg in argv if not arg.startswith('--')]
+    options = {}
+    for arg in argv:
+        if arg.startswith('--'):
+            name, _, value = arg[2:].partition('=')
+            options[name] = value or '1'
+    return args, options
+
+def emit_jsonl(html_content, config, instr, post_id=None):
+    """Write one JSON object per chunk to stdout, flushed as each is produced."""
+    from chunking.post_chunker import PostChunker
+
+    chunker = PostChunker(config.max_input_tokens, config.embeddings_model, overlap=config.chunk_overlap_tokens)
+    chunks = chunker.iter_html_chunks(html_content)
+    index = 0
+    while True:
+        with instr.stage('chunk'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        instr.count('chunks', 1)
+        instr.write({
+            'post_id': post_id,
+            'chunk_index': index,
+            'heading_path': chunk['heading_path'],
+            'tokens': chunk['tokens'],
+            'text': chunk['text'],
+            'contextualized_tokens': chunk['contextualized_tokens'],
+            'contextualized': chunk['contextualized'],
+        })
+        index += 1
+    instr.emit_footer()
+
 def main():
+    instr = Instrumentation('main')
+    instr.operation = 'chunk'
     config = load_config()
-    print(config.max_input_tokens)
+    args, options = parse_options(sys.argv[1:])
+    output_format = options.get('format', os.environ.get('FUKAMI_LENS_CHUNK_OUTPUT', 'text'))
+
     # Retrieve HTML file and read it
-    input_path = sys.argv[1]
-    with open(input_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
+    input_path = args[0]
+    html_content = instr.read_input(input_path, lambda f: f.read())
+
+    if output_format == 'jsonl':
+        post_id = int(options['post-id']) if options.get('post-id') else None
+        emit_jsonl(html_content, config, instr, post_id)
+        return
+
+    print(config.max_input_tokens)
 
     # Retrieve model encoding and tokenizer
     tokenizer = get_tokenizer(config.embeddings_model)
 
-    # Save HTML to a temp file for Docling
-    with tempfile.NamedTemporaryFile('w+', suffix='.html', delete=False, encoding='utf-8') as tmp_html:
-        tmp_html.write(html_content)
-        tmp_html.flush()
-        tmp_html_path = tmp_html.name
+    # Convert the HTML for Docling straight from memory
     try:
-        try:
-            from docling.document_converter import DocumentConverter
-            from docling.chunking import HybridChunker
-
-            doc_conv = DocumentConverter().convert(source=tmp_html_path)
-            doc = doc_conv.document
+        doc = convert_document(html_content, 'post.html')
 
-            print(f"\n{doc}\n")
-            # Output Docling document as JSON for debugging
-            # try:
-            #     doc_json = doc.export_to_dict() if hasattr(doc, 'export_to_dict') else (doc.to_dict() if hasattr(doc, 'to_dict') else None)
-            #     if doc_json is not None:
-            #         print(f"[JSON] {json.dumps(doc_json, ensure_ascii=False, indent=2)}")
-            #     else:
-            #         print("[JSON] [Error: Docling document cannot be serialized to JSON]")
-            # except Exception as e:
-            #     print(f"[JSON] [Docling Document JSON Error] {e}")
+        print(f"\n{doc}\n")
+        # Output Docling document as JSON for debugging
+        # try:
+        #     doc_json = doc.export_to_dict() if hasattr(doc, 'export_to_dict') else (doc.to_dict() if hasattr(doc, 'to_dict') else None)
+        #     if doc_json is not None:
+        #         print(f"[JSON] {json.dumps(doc_json, ensure_ascii=False, indent=2)}")
+        #     else:
+        #         print("[JSON] [Error: Docling document cannot be serialized to JSON]")
+        # except Exception as e:
+        #     print(f"[JSON] [Docling Document JSON Error] {e}")
 
-            chunker = HybridChunker(
-                tokenizer=tokenizer, 
-                max_tokens=config.max_input_tokens, 
-                merge_peers=True
-            )
-            chunks = list(chunker.chunk(dl_doc=doc))
+        chunker = build_hybrid_chunker(tokenizer, config.max_input_tokens)
+        chunks = list(chunker.chunk(dl_doc=doc))
 
-            for i, chunk in enumerate(chunks):
-                print(f"=== {i} ===")
-                txt = chunk.text if hasattr(chunk, 'text') else chunk
-                txt_tokens = len(tokenizer.tokenizer.encode(txt))
-                print(f"chunk.text ({txt_tokens} tokens):\n{repr(txt)}")
+        for i, chunk in enumerate(chunks):
+            print(f"=== {i} ===")
+            txt = chunk.text if hasattr(chunk, 'text') else chunk
+            txt_tokens = tokenizer.count_tokens(txt)
+            print(f"chunk.text ({txt_tokens} tokens):\n{repr(txt)}")
 
-                ser_txt = chunker.contextualize(chunk=chunk)
-                ser_tokens = len(tokenizer.tokenizer.encode(ser_txt))
-                print(f"chunker.contextualize(chunk) ({ser_tokens} tokens):\n{repr(ser_txt)}")
+            ser_txt = chunker.contextualize(chunk=chunk)
+            ser_tokens = tokenizer.count_tokens(ser_txt)
+            print(f"chunker.contextualize(chunk) ({ser_tokens} tokens):\n{repr(ser_txt)}")
 
+    except ImportError:
+        print("[Docling not available: using tiktoken fallback chunking]")
+        try:
+            import tiktoken
+            enc = tiktoken.encoding_for_model(config.embeddings_model)
+            chunker = TokenChunker(enc, config.max_input_tokens, config.chunk_overlap_tokens)
+            for i, chunk in enumerate(chunker.iter_chunks(html_content)):
+                print(f"=== {i} ===")
+                print(f"chunk.text ({chunk['tokens']} tokens):\n{repr(chunk['text'])}")
         except ImportError:
-            print("[Docling not available: using tiktoken fallback chunking]")
-            try:
-                import tiktoken
-                enc = tiktoken.encoding_for_model(config.embeddings_model)
-                lines = html_content.splitlines(keepends=True)
-                max_tokens = config.max_input_tokens
-                chunks = []
-                current_chunk = ""
-                current_tokens = 0
-                for line in lines:
-                    line_tokens = len(enc.encode(line))
-                    if current_tokens + line_tokens > max_tokens and current_chunk:
-                        chunks.append(current_chunk)
-                        current_chunk = line
-                        current_tokens = line_tokens
-                    else:
-                        current_chunk += line
-                        current_tokens += line_tokens
-                if current_chunk:
-                    chunks.append(current_chunk)
-                for i, chunk in enumerate(chunks):
-                    token_count = len(enc.encode(chunk))
-                    print(f"=== {i} ===")
-                    print(f"chunk.text ({token_count} tokens):\n{repr(chunk)}")
-            except ImportError:
-                print("[Neither Docling nor tiktoken available: cannot chunk or tokenize]")
-    finally:
-        os.unlink(tmp_html_path)
+            print("[Neither Docling nor tiktoken available: cannot chunk or tokenize]")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,6 +1,15 @@
 import json
 
+# Characters read from the export per step when streaming without ijson
+READ_SIZE = 1 << 20
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789+-.eE'
+
+
 class Post:
+    __slots__ = ('id', 'title', 'date', 'content', 'permalink', 'categories', 'tags')
+
     def __init__(self, data):
         self.id = data.get('ID', '')
         self.title = data.get('title', {}).get('rendered', '')
@@ -10,7 +19,94 @@ class Post:
         self.categories = data.get('categories', [])
         self.tags = data.get('tags', [])
 
-def load_posts_from_json(path):
+
+def _iter_array_items(f, read_size=READ_SIZE):
+    """Yield the elements of the top-level JSON array in text stream `f`, one at a time."""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill(size):
+        nonlocal buf, pos, eof
+        data = f.read(size)
+        if not data:
+            eof = True
+        buf = buf[pos:] + data
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill(read_size)
+
+    skip_whitespace()
+    if buf[pos:pos + 1] != '[':
+        raise ValueError('Expected a JSON array of posts')
+    pos += 1
+    first = True
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError('Unterminated JSON array')
+        if buf[pos] == ']':
+            return
+        if not first:
+            if buf[pos] != ',':
+                raise ValueError(f'Expected "," between array items, got {buf[pos]!r}')
+            pos += 1
+            skip_whitespace()
+        first = False
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                item, end = None, None
+            # A number followed only by number characters up to the end of the buffer may
+            # continue (e.g. "-0" of "-0.25" cut before its fraction)
+            if end is not None and isinstance(item, (int, float)) and not eof:
+                tail = buf[end:].lstrip(_NUMBER_CHARS)
+                if not tail:
+                    end = None
+            if end is not None and (end < len(buf) or eof):
+                break
+            # Grow the read with the pending item so long posts are not re-parsed many times
+            fill(max(read_size, len(buf) - pos))
+        pos = end
+        yield item
+
+
+def iter_items_from_json(path):
+    """Yield the raw post dicts of a WordPress posts.json export without loading it whole.
+
+    Uses ijson when installed, otherwise an incremental decoder over buffered reads;
+    either way only the post being parsed is held in memory.
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'item', use_float=True)
+        return
+
     with open(path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return [Post(post) for post in data] 
\ No newline at end of file
+        yield from _iter_array_items(f)
+
+
+def iter_posts_from_json(path):
+    """Yield Post objects from a WordPress posts.json export without loading it whole."""
+    for data in iter_items_from_json(path):
+        yield Post(data)
+
+
+def load_posts_from_json(path):
+    return list(iter_posts_from_json(path))
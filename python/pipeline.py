@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Ingestion Pipeline for WP Fukami Lens AI
+
+Streams WordPress posts through convert → chunk → embed → write in one process:
+
+- convert/chunk: posts are read incrementally from posts.json, converted in a process
+  pool (`convert_workers`) and chunked one post at a time (see chunking/post_chunker.py).
+- embed: `embed_workers` threads send batches of chunks to the OpenAI embeddings API.
+- write: a single writer upserts posts and their chunks into LanceDB in batches.
+
+The stages are connected by bounded queues, so a slow stage applies backpressure to
+the ones before it instead of letting work pile up in memory, and CPU-bound conversion
+overlaps with network-bound embedding. Per-stage throughput and queue depths are
+reported in the result.
+
+Usage:
+    python3 pipeline.py <input_file>
+
+The input JSON holds `posts_path` (a posts.json export) or inline `posts`, `api_key`,
+`db_path`, `table_name`, and optionally `model`, `convert_workers`, `embed_workers`,
+`embed_batch_size`, `embed_batch_max_tokens`, `write_batch_size` and `queue_size`.
+"""
+
+import sys
+import json
+import os
+import html
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict
+
+from utils.instrumentation import Instrumentation
+
+# Set environment variables for HuggingFace cache
+os.environ["HF_HOME"] = "/tmp"
+os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
+os.environ["XDG_CACHE_HOME"] = "/tmp"
+
+from config import load_config
+from chunking.cache import ChunkCache
+from chunking.post_chunker import PostChunker
+from get_embedding import get_openai_embeddings, request_batches
+from lancedb_operations import LanceDBManager, np
+from models.post import Post, iter_posts_from_json
+from utils.serialization import write_json
+
+# Marks the end of a queue's input
+_DONE = object()
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+
+
+def strip_tags(content):
+    """Plain text of a post's HTML, like WordPress' wp_strip_all_tags()."""
+    return SPACE_RE.sub(' ', html.unescape(TAG_RE.sub(' ', content))).strip()
+
+
+def post_vector(vectors):
+    """Unit-length mean of a post's chunk vectors."""
+    mean = np.mean(vectors, axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm > 0 else mean
+
+
+class StageStats:
+    """Items processed and time spent working by one pipeline stage."""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def to_dict(self, elapsed):
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'busy_seconds': round(self.busy, 3),
+            'items_per_sec': round(self.items / elapsed, 2) if elapsed > 0 else None,
+            'utilization': round(self.busy / (elapsed * self.workers), 3) if elapsed > 0 else None,
+        }
+
+
+class BoundedQueue:
+    """queue.Queue that records its depth and gives up when the pipeline is stopping."""
+
+    def __init__(self, maxsize, stop):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.maxsize = maxsize
+        self.stop = stop
+        self.samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            depth = self.queue.qsize()
+            self.samples += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+            return True
+        return False
+
+    def get(self):
+        while not self.stop.is_set():
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def to_dict(self):
+        return {
+            'maxsize': self.maxsize,
+            'max_depth': self.max_depth,
+            'mean_depth': round(self.depth_total / self.samples, 2) if self.samples else 0,
+        }
+
+
+class IngestionPipeline:
+    """Runs posts through convert → chunk → embed → write with bounded queues between stages."""
+
+    def __init__(self, chunker, manager, api_key, model, embed_workers=4,
+                 embed_batch_size=128, write_batch_size=500, queue_size=8, embed_batch_max_tokens=250000):
+        self.chunker = chunker
+        self.manager = manager
+        self.api_key = api_key
+        self.model = model
+        self.embed_workers = max(1, embed_workers)
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.embed_batch_max_tokens = max(1, embed_batch_max_tokens)
+        self.write_batch_size = max(1, write_batch_size)
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.embed_queue = BoundedQueue(queue_size, self.stop)
+        self.write_queue = BoundedQueue(queue_size, self.stop)
+        self.stats = {
+            'chunk': StageStats(1),
+            'embed': StageStats(self.embed_workers),
+            'write': StageStats(1),
+        }
+        self.posts_written = 0
+        self.chunks_written = 0
+        self.skipped = []
+
+    def _fail(self, e):
+        self.errors.append(e)
+        self.stop.set()
+
+    def _title_chunk(self, post):
+        """Chunk record embedding a post by its title alone."""
+        return {
+            'post_id': post.id,
+            'chunk_index': 0,
+            'title': post.title,
+            'permalink': post.permalink,
+            'heading_path': [],
+            'tokens': len(self.chunker.enc.encode_ordinary(post.title)),
+            'text': post.title,
+            'contextualized_tokens': len(self.chunker.enc.encode_ordinary(post.title)),
+            'contextualized': post.title,
+        }
+
+    def _chunk_stage(self, posts):
+        """Group chunk records by post and hand whole posts to the embedders in batches.
+
+        A post that yields no chunks (an empty body, or only images or shortcodes) is
+        embedded by its title alone, or listed in `skipped` when it has no title either.
+        """
+        pending = {}
+
+        def remember(posts):
+            for post in posts:
+                pending[post.id] = post
+                yield post
+
+        try:
+            batch, batch_chunks, group = [], 0, []
+            started = time.perf_counter()
+
+            def close_group():
+                nonlocal batch_chunks
+                batch.append((pending.pop(group[0]['post_id']), list(group)))
+                batch_chunks += len(group)
+                group.clear()
+
+            def close_empty(until=None):
+                # Chunks come in post order: posts remembered before `until` had none
+                nonlocal batch_chunks
+                while pending:
+                    post_id = next(iter(pending))
+                    if post_id == until:
+                        return
+                    post = pending.pop(post_id)
+                    if post.title.strip():
+                        batch.append((post, [self._title_chunk(post)]))
+                        batch_chunks += 1
+                    else:
+                        self.skipped.append(post.id)
+
+            for record in self.chunker.iter_chunks(remember(posts)):
+                if not group or record['post_id'] != group[0]['post_id']:
+                    if group:
+                        close_group()
+                    close_empty(record['post_id'])
+                    if batch_chunks >= self.embed_batch_size:
+                        self.stats['chunk'].record(len(batch), time.perf_counter() - started)
+                        if not self.embed_queue.put(batch):
+                            return
+                        batch, batch_chunks = [], 0
+                        started = time.perf_counter()
+                group.append(record)
+            if group:
+                close_group()
+            close_empty()
+            if batch:
+                self.stats['chunk'].record(len(batch), time.perf_counter() - started)
+                self.embed_queue.put(batch)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.embed_workers):
+                self.embed_queue.put(_DONE)
+
+    def _embed_stage(self):
+        try:
+            while True:
+                batch = self.embed_queue.get()
+                if batch is _DONE:
+                    return
+                started = time.perf_counter()
+                chunks = [chunk for _, group in batch for chunk in group]
+                texts = [chunk['contextualized'] for chunk in chunks]
+                vectors = []
+                # Requests are capped by token count too: full-length chunks would
+                # exceed the API's per-request token limit long before embed_batch_size
+                for part in request_batches([chunk['contextualized_tokens'] for chunk in chunks],
+                                            self.embed_batch_size, self.embed_batch_max_tokens):
+                    vectors.extend(get_openai_embeddings(texts[part.start:part.stop], self.model, self.api_key))
+                vectors = np.asarray(vectors, dtype=np.float32)
+                self.stats['embed'].record(len(texts), time.perf_counter() - started)
+                if not self.write_queue.put((batch, vectors)):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.write_queue.put(_DONE)
+
+    def _flush(self, posts, chunks, vectors):
+        started = time.perf_counter()
+        post_ids = [post.id for post, _ in posts]
+        post_rows = [{
+            'id': post.id,
+            'title': post.title,
+            'content': strip_tags(post.content),
+            'date': post.date,
+            'permalink': post.permalink,
+            'categories': post.categories,
+            'tags': post.tags,
+        } for post, _ in posts]
+        for result in (
+            self.manager.upsert_embeddings(post_rows, [vector.tolist() for _, vector in posts], self.model),
+            self.manager.upsert_chunks(post_ids, chunks, np.concatenate(vectors), self.model),
+        ):
+            if not result['success']:
+                raise Exception(result['data'])
+        self.posts_written += len(posts)
+        self.chunks_written += len(chunks)
+        self.stats['write'].record(len(posts), time.perf_counter() - started)
+
+    def _write_stage(self):
+        done = 0
+        posts, chunks, vectors = [], [], []
+        try:
+            while done < self.embed_workers:
+                item = self.write_queue.get()
+                if item is _DONE:
+                    if self.stop.is_set():
+                        return
+                    done += 1
+                    continue
+                batch, batch_vectors = item
+                offset = 0
+                for post, group in batch:
+                    group_vectors = batch_vectors[offset:offset + len(group)]
+                    offset += len(group)
+                    posts.append((post, post_vector(group_vectors)))
+                    chunks.extend(group)
+                    vectors.append(group_vectors)
+                if len(posts) >= self.write_batch_size:
+                    self._flush(posts, chunks, vectors)
+                    posts, chunks, vectors = [], [], []
+            if posts:
+                self._flush(posts, chunks, vectors)
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, posts) -> Dict[str, Any]:
+        """Run the pipeline over an iterable of Post objects; returns the stage report."""
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._chunk_stage, args=(posts,), name='chunk')]
+        threads += [
+            threading.Thread(target=self._embed_stage, name=f'embed-{i}') for i in range(self.embed_workers)
+        ]
+        threads.append(threading.Thread(target=self._write_stage, name='write'))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if self.errors:
+            raise self.errors[0]
+        return {
+            'posts': self.posts_written,
+            'chunks': self.chunks_written,
+            'skipped': self.skipped,
+            'elapsed_seconds': round(elapsed, 3),
+            'stages': {name: stats.to_dict(elapsed) for name, stats in self.stats.items()},
+            'queues': {
+                'embed': self.embed_queue.to_dict(),
+                'write': self.write_queue.to_dict(),
+            },
+        }
+
+
+def main():
+    """Main function to run the ingestion pipeline"""
+    if len(sys.argv) < 2:
+        write_json({
+            'success': False,
+            'data': 'Usage: python pipeline.py <input_file>'
+        })
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    instr = Instrumentation('pipeline')
+    instr.operation = 'ingest'
+
+    try:
+        data = instr.read_input(input_file, json.load)
+        instr.enable_timings(data.get('timings', False))
+
+        config = load_config()
+        api_key = data.get('api_key', '')
+        model = data.get('model', config.embeddings_model)
+        if not api_key:
+            raise Exception('No API key provided')
+
+        if data.get('posts_path'):
+            posts = iter_posts_from_json(data['posts_path'])
+        else:
+            posts = (Post(post) for post in data.get('posts', []))
+
+        chunker = PostChunker(
+            config.max_input_tokens,
+            model,
+            workers=data.get('convert_workers', config.convert_workers),
+            max_posts_per_worker=config.convert_max_posts_per_worker,
+            overlap=config.chunk_overlap_tokens,
+        )
+        cache = ChunkCache(config_fingerprint=chunker.config_fingerprint)
+        chunker.cache = cache
+
+        manager = LanceDBManager(data.get('db_path', '/tmp/lancedb'), data.get('table_name', 'wordpress_posts'))
+        pipeline = IngestionPipeline(
+            chunker,
+            manager,
+            api_key,
+            model,
+            embed_workers=data.get('embed_workers', config.embed_workers),
+            embed_batch_size=data.get('embed_batch_size', config.embed_batch_size),
+            write_batch_size=data.get('write_batch_size', config.write_batch_size),
+            queue_size=data.get('queue_size', config.pipeline_queue_size),
+            embed_batch_max_tokens=data.get('embed_batch_max_tokens', config.embed_batch_max_tokens),
+        )
+        try:
+            report = pipeline.run(posts)
+            report['cache'] = cache.stats()
+        finally:
+            cache.close()
+
+        instr.emit({
+            'success': True,
+            'data': report
+        })
+
+    except Exception as e:
+        instr.emit({
+            'success': False,
+            'data': f'Error: {str(e)}'
+        })
+
+
+if __name__ == '__main__':
+    main()
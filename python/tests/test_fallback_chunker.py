@@ -0,0 +1,34 @@
+from chunking.fallback import TokenChunker
+
+
+class CharEncoding:
+    """One token per character, enough to exercise token offsets without tiktoken."""
+
+    def encode_ordinary(self, text):
+        return [ord(c) for c in text]
+
+    def decode_tokens_bytes(self, tokens):
+        return [chr(t).encode('utf-8') for t in tokens]
+
+
+def test_overlap_advances_through_text_without_boundaries():
+    max_tokens, overlap = 50, 10
+    chunker = TokenChunker(CharEncoding(), max_tokens, overlap=overlap)
+    text = 'Hello world. ' + 'x' * 200
+    chunks = chunker.chunk(text)
+
+    assert chunks[0]['text'] == 'Hello world.'
+    # After the sentence, every chunk is a hard cut that steps forward by max_tokens - overlap
+    for previous, chunk in zip(chunks[1:], chunks[2:]):
+        assert chunk['start'] - previous['start'] >= max_tokens - overlap
+    assert chunks[-1]['end'] == len(text)
+    assert all(chunk['tokens'] <= max_tokens for chunk in chunks)
+
+
+def test_overlap_repeats_the_tail_of_the_previous_chunk():
+    chunker = TokenChunker(CharEncoding(), 20, overlap=5)
+    chunks = chunker.chunk('y' * 100)
+
+    assert [chunk['start'] for chunk in chunks] == [0, 15, 30, 45, 60, 75, 90]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous['end'] - chunk['start'] == 5
@@ -0,0 +1,39 @@
+import threading
+
+from utils.job_queue import IngestQueue
+
+
+def test_writer_active_reflects_the_writer(tmp_path):
+    writer = IngestQueue(str(tmp_path), 'wordpress_posts')
+    observer = IngestQueue(str(tmp_path), 'wordpress_posts')
+
+    assert not observer.writer_active()
+    with writer.writer_lock() as acquired:
+        assert acquired
+        assert observer.writer_active()
+        assert observer.stats()['writer_active']
+        with observer.writer_lock() as second:
+            assert not second
+    assert not observer.writer_active()
+
+
+def test_stats_reads_never_make_the_writer_busy(tmp_path):
+    writer = IngestQueue(str(tmp_path), 'wordpress_posts')
+    stop = threading.Event()
+
+    def poll():
+        observer = IngestQueue(str(tmp_path), 'wordpress_posts')
+        while not stop.is_set():
+            observer.writer_active()
+
+    thread = threading.Thread(target=poll)
+    thread.start()
+    try:
+        busy = 0
+        for _ in range(2000):
+            with writer.writer_lock() as acquired:
+                busy += not acquired
+    finally:
+        stop.set()
+        thread.join()
+    assert busy == 0
@@ -0,0 +1,65 @@
+import numpy as np
+
+from lancedb_operations import LanceDBManager, content_hash
+
+
+def make_posts(ids):
+    return [{
+        'id': i,
+        'title': f'Post {i}',
+        'content': f'Body {i}',
+        'date': '2024-01-01 10:00:00',
+        'permalink': f'https://example.com/{i}',
+        'categories': [],
+        'tags': [],
+    } for i in ids]
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, 8), dtype=np.float32)
+
+
+def test_diff_reports_new_changed_and_removed_posts(tmp_path):
+    manager = LanceDBManager(str(tmp_path))
+    assert manager.upsert_embeddings(make_posts([1, 2, 3, 4]), vectors(4))['success']
+
+    current = make_posts([1, 2, 3, 5, 6])
+    current[1]['content'] = 'Edited body'
+    wanted = [{'id': p['id'], 'hash': content_hash(p)} for p in current]
+    result = manager.diff(wanted)
+    assert result['success']
+    assert result['data'] == {
+        'missing_ids': [5, 6],
+        'stale_ids': [2],
+        'orphaned_ids': [4],
+        'up_to_date': 2,
+    }
+
+    # Posts waiting in the ingestion queue count as up to date
+    assert manager.enqueue_embeddings([current[1], current[3]], vectors(2, 1))['success']
+    data = manager.diff(wanted)['data']
+    assert data['missing_ids'] == [6]
+    assert data['stale_ids'] == []
+    assert data['up_to_date'] == 4
+
+
+def test_semantic_cache_hits_near_duplicates_in_scope_until_a_source_changes(tmp_path):
+    manager = LanceDBManager(str(tmp_path))
+    assert manager.upsert_embeddings(make_posts([1, 2, 3]), vectors(3))['success']
+    query = vectors(1, 2)[0]
+    near = query + np.float32(0.001)
+    assert manager.semantic_cache_store('What is Fukami?', query.tolist(), 'An answer', [2, 3],
+                                        scope='gpt-4o')['success']
+
+    data = manager.semantic_cache_lookup(near.tolist(), scope='gpt-4o', threshold=0.99)['data']
+    assert data['hit']
+    assert data['answer'] == 'An answer'
+    assert data['source_ids'] == [2, 3]
+
+    assert not manager.semantic_cache_lookup(near.tolist(), scope='claude', threshold=0.99)['data']['hit']
+
+    # Re-embedding a post the answer used drops it; other posts leave it alone
+    assert manager.upsert_embeddings(make_posts([1]), vectors(1, 3))['success']
+    assert manager.semantic_cache_lookup(near.tolist(), scope='gpt-4o', threshold=0.99)['data']['hit']
+    assert manager.upsert_embeddings(make_posts([3]), vectors(1, 4))['success']
+    assert not manager.semantic_cache_lookup(near.tolist(), scope='gpt-4o', threshold=0.99)['data']['hit']
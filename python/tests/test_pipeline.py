@@ -0,0 +1,94 @@
+import numpy as np
+
+import pipeline
+from models.post import Post
+from pipeline import IngestionPipeline
+
+DIM = 8
+
+
+class WordEncoding:
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class FakeChunker:
+    """One chunk per paragraph of the post body, none for an empty body."""
+
+    enc = WordEncoding()
+
+    def iter_chunks(self, posts):
+        for post in posts:
+            for index, paragraph in enumerate(p for p in post.content.split('\n\n') if p.strip()):
+                tokens = len(paragraph.split())
+                yield {
+                    'post_id': post.id,
+                    'chunk_index': index,
+                    'title': post.title,
+                    'permalink': post.permalink,
+                    'heading_path': [],
+                    'tokens': tokens,
+                    'text': paragraph,
+                    'contextualized_tokens': tokens,
+                    'contextualized': paragraph,
+                }
+
+
+class FakeManager:
+    def __init__(self):
+        self.posts = {}
+        self.chunks = []
+
+    def upsert_embeddings(self, posts, embeddings, model=None):
+        for post in posts:
+            self.posts[post['id']] = post
+        return {'success': True, 'data': ''}
+
+    def upsert_chunks(self, post_ids, chunks, embeddings, model=None):
+        self.chunks.extend(chunks)
+        return {'success': True, 'data': ''}
+
+
+def make_post(post_id, title, content):
+    return Post({'ID': post_id, 'title': {'rendered': title}, 'content': {'rendered': content},
+                 'date': '2024-01-01', 'permalink': f'https://example.com/{post_id}'})
+
+
+def fake_embeddings(requests):
+    def embed(texts, model, api_key):
+        requests.append(list(texts))
+        return [np.ones(DIM, dtype=np.float32) for _ in texts]
+    return embed
+
+
+def test_posts_without_chunks_are_embedded_by_title_or_skipped(monkeypatch):
+    monkeypatch.setattr(pipeline, 'get_openai_embeddings', fake_embeddings([]))
+    manager = FakeManager()
+    posts = [
+        make_post(1, 'First', 'one two\n\nthree'),
+        make_post(2, 'Only images', ''),
+        make_post(3, '', ''),
+        make_post(4, 'Last', 'four five'),
+        make_post(5, 'Trailing empty', ''),
+    ]
+    report = IngestionPipeline(FakeChunker(), manager, 'key', 'model', embed_workers=2,
+                               embed_batch_size=2).run(posts)
+
+    assert sorted(manager.posts) == [1, 2, 4, 5]
+    assert report['posts'] == 4
+    assert report['skipped'] == [3]
+    title_chunks = [chunk for chunk in manager.chunks if chunk['post_id'] in (2, 5)]
+    assert [chunk['text'] for chunk in title_chunks] == ['Only images', 'Trailing empty']
+
+
+def test_embedding_requests_are_capped_by_tokens(monkeypatch):
+    requests = []
+    monkeypatch.setattr(pipeline, 'get_openai_embeddings', fake_embeddings(requests))
+    paragraph = ' '.join(['word'] * 100)
+    posts = [make_post(i, f'Post {i}', '\n\n'.join([paragraph] * 3)) for i in range(1, 6)]
+    report = IngestionPipeline(FakeChunker(), FakeManager(), 'key', 'model', embed_workers=1,
+                               embed_batch_size=128, embed_batch_max_tokens=250).run(posts)
+
+    assert report['chunks'] == 15
+    assert sum(len(texts) for texts in requests) == 15
+    assert all(sum(len(text.split()) for text in texts) <= 250 for texts in requests)
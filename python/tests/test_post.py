@@ -0,0 +1,34 @@
+import io
+import json
+
+import pytest
+
+from models.post import _iter_array_items
+
+
+POSTS = [
+    {'ID': 1, 'title': {'rendered': '深見レンズ'}, 'content': {'rendered': '<p>日本語の本文 🌸</p>' * 7}},
+    {'ID': 22, 'title': {'rendered': 'Ünïcödé'}, 'content': {'rendered': 'é' * 37}, 'tags': []},
+    123456789,
+    -0.25,
+    'naïve string',
+    [1, [2, {'a': '😀'}]],
+    None,
+    {'ID': 333, 'title': {'rendered': ''}, 'content': {'rendered': 'x' * 100}},
+]
+
+
+@pytest.mark.parametrize('read_size', [1, 2, 3, 5, 7, 16, 64, 1 << 20])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_streamed_items_match_json_load(read_size, indent):
+    text = json.dumps(POSTS, ensure_ascii=False, indent=indent)
+    expected = json.load(io.StringIO(text))
+    # Read through a UTF-8 byte stream, as iter_items_from_json does
+    f = io.TextIOWrapper(io.BytesIO(text.encode('utf-8')), encoding='utf-8')
+    assert list(_iter_array_items(f, read_size)) == expected
+
+
+def test_rejects_truncated_arrays():
+    text = json.dumps(POSTS, ensure_ascii=False)[:-1]
+    with pytest.raises(ValueError):
+        list(_iter_array_items(io.StringIO(text), 4))
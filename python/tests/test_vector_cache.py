@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+import vector_cache
+from lancedb_operations import LanceDBManager
+from vector_cache import VectorCache
+
+
+def make_posts(ids):
+    return [{
+        'id': i,
+        'title': f'Post {i}',
+        'content': f'Body {i}',
+        'date': '2024-01-01 10:00:00',
+        'permalink': f'https://example.com/{i}',
+        'categories': [],
+        'tags': [],
+    } for i in ids]
+
+
+def test_superseded_version_is_kept_for_the_grace_period(tmp_path, monkeypatch):
+    manager = LanceDBManager(str(tmp_path))
+    rng = np.random.default_rng(0)
+    assert manager.upsert_embeddings(make_posts([1, 2]), rng.random((2, 8), dtype=np.float32))['success']
+    table = manager._open_table()
+    old = VectorCache(str(tmp_path), table.name).load(table)
+
+    assert manager.upsert_embeddings(make_posts([3]), rng.random((1, 8), dtype=np.float32))['success']
+    table = manager._open_table()
+    new = VectorCache(str(tmp_path), table.name).load(table)
+    assert new.directory != old.directory
+    assert list(new.ids) == [1, 2, 3]
+    # A process that read the old pointer can still open the old version
+    assert os.path.exists(os.path.join(old.directory, 'vectors.npy'))
+
+    monkeypatch.setattr(vector_cache, 'GRACE_SECONDS', -1)
+    new._remove_old(os.path.basename(new.directory))
+    assert not os.path.exists(old.directory)
+    assert os.path.exists(new.directory)
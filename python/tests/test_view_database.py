@@ -0,0 +1,58 @@
+import numpy as np
+
+from lancedb_operations import LanceDBManager
+from view_database import DatabaseViewer
+
+
+def make_posts(n):
+    return [{
+        'id': i,
+        'title': f'Post {i}',
+        'content': f'Body {i}',
+        'date': f'2024-{1 + i % 12:02d}-01 10:00:00',
+        'permalink': f'https://example.com/{i}',
+        'categories': [],
+        'tags': [],
+    } for i in range(1, n + 1)]
+
+
+def walk(viewer, order_by, per_page):
+    ids, cursor = [], {}
+    while cursor is not None:
+        data = viewer.get_paginated_data(per_page=per_page, cursor=cursor, order_by=order_by)['data']
+        ids.extend(post['id'] for post in data['posts'])
+        cursor = data['next_cursor']
+    return ids
+
+
+def test_keyset_pages_cover_the_table_in_order(tmp_path):
+    posts = make_posts(57)
+    manager = LanceDBManager(str(tmp_path))
+    assert manager.upsert_embeddings(posts, np.random.default_rng(0).random((57, 8), dtype=np.float32))['success']
+    viewer = DatabaseViewer(str(tmp_path))
+
+    assert walk(viewer, 'id', 10) == sorted((p['id'] for p in posts), reverse=True)
+    by_date = sorted(posts, key=lambda p: (p['date'], p['id']), reverse=True)
+    assert walk(viewer, 'date', 10) == [p['id'] for p in by_date]
+
+
+def test_search_matches_with_and_without_the_id_list(tmp_path, monkeypatch):
+    posts = make_posts(30)
+    posts[3]['content'] = '東京タワーの夜景'
+    posts[17]['title'] = 'ＴＯＫＹＯ tower'
+    manager = LanceDBManager(str(tmp_path))
+    assert manager.upsert_embeddings(posts, np.random.default_rng(0).random((30, 8), dtype=np.float32))['success']
+    viewer = DatabaseViewer(str(tmp_path))
+
+    def search(term):
+        data = viewer.get_paginated_data(per_page=100, search=term)['data']
+        assert data['total_count'] == len(data['posts'])
+        return sorted(post['id'] for post in data['posts'])
+
+    assert search('タワー') == [4]
+    assert search('tokyo') == [18]
+    assert search('body 1') == [i for i in range(1, 31) if i != 4]
+    # Terms matching more posts than MAX_SEARCH_IDS are scanned instead
+    monkeypatch.setattr(DatabaseViewer, 'MAX_SEARCH_IDS', 5)
+    assert search('body') == [i for i in range(1, 31) if i != 4]
+    assert search('タワー') == [4]
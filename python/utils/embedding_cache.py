@@ -0,0 +1,70 @@
+"""
+Cache of query embeddings.
+
+Front-end searches repeat the same queries, and each one costs an embeddings API
+round trip before the search can start. Query vectors are kept in
+`<db_path>/query_embeddings.sqlite3`, keyed by a hash of the model and the query
+text, and the least recently used entries are evicted beyond `max_entries`.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+
+def query_key(text, model):
+    return hashlib.sha256(f"{model}\0{text.strip()}".encode('utf-8')).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """SQLite-backed LRU cache of query vectors, shared by all processes."""
+
+    def __init__(self, db_path, max_entries=10000):
+        os.makedirs(db_path, exist_ok=True)
+        self.path = os.path.join(db_path, 'query_embeddings.sqlite3')
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings ('
+            ' key TEXT PRIMARY KEY,'
+            ' model TEXT NOT NULL,'
+            ' embedding BLOB NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' used_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, text, model):
+        """The cached vector of `text` under `model`, or None."""
+        key = query_key(text, model)
+        row = self.conn.execute('SELECT embedding FROM embeddings WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.conn:
+            self.conn.execute('UPDATE embeddings SET used_at = ? WHERE key = ?', (time.time(), key))
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, text, model, embedding):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO embeddings (key, model, embedding, created_at, used_at)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (query_key(text, model), model, np.asarray(embedding, dtype=np.float32).tobytes(), now, now)
+            )
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries beyond `max_entries`."""
+        self.conn.execute(
+            'DELETE FROM embeddings WHERE key IN ('
+            ' SELECT key FROM embeddings ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
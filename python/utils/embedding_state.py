@@ -0,0 +1,84 @@
+"""
+Per-table embedding state, stored next to the LanceDB tables.
+
+`<db_path>/<table_name>.state.json` records which physical table currently serves a
+logical table name (e.g. `wordpress_posts`), the embedding model its vectors came
+from, the distance metric it is searched and indexed with, and any re-embedding
+migration in progress. The file is only ever replaced
+with os.replace(), so readers see either the old state or the new one; switching
+`active_table` is how a migration cuts over atomically.
+
+Writers that must not interleave with a cutover (upserts, the cutover itself) hold
+`state_lock()` while they resolve the active table and write.
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+
+# Distance metrics a table can be searched with (vectors are stored unit-length)
+METRICS = ('cosine', 'dot', 'l2')
+
+
+def state_path(db_path, table_name):
+    return os.path.join(db_path, f'{table_name}.state.json')
+
+
+def default_state(table_name):
+    return {
+        'table': table_name,
+        'active_table': table_name,
+        'model': None,
+        'metric': None,
+        'migration': None,
+    }
+
+
+def load_state(db_path, table_name):
+    """The table's state, or the default (the logical name is the physical table)."""
+    state = default_state(table_name)
+    try:
+        with open(state_path(db_path, table_name), 'r', encoding='utf-8') as f:
+            state.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return state
+
+
+def save_state(db_path, table_name, state):
+    """Atomically replace the state file."""
+    os.makedirs(db_path, exist_ok=True)
+    path = state_path(db_path, table_name)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def active_table(db_path, table_name):
+    """Physical table currently serving `table_name`."""
+    return load_state(db_path, table_name)['active_table']
+
+
+def shadow_table_name(table_name, model):
+    """Physical table that holds `table_name` re-embedded with `model`."""
+    return f"{table_name}__{re.sub(r'[^0-9A-Za-z]+', '_', model).strip('_').lower()}"
+
+
+@contextmanager
+def state_lock(db_path, table_name):
+    """Exclusive lock serializing writers against a cutover."""
+    os.makedirs(db_path, exist_ok=True)
+    with open(state_path(db_path, table_name) + '.lock', 'w') as lock:
+        try:
+            import fcntl
+        except ImportError:  # Windows: no cross-process lock
+            yield
+            return
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
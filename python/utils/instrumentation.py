@@ -0,0 +1,274 @@
+"""
+Opt-in timing and profiling for the WP Fukami Lens AI Python scripts.
+
+Scripts import this module before their heavy imports, create one Instrumentation
+at the start of main() and wrap the interesting parts of their work in `stage()`.
+Nothing is reported unless it is switched on:
+
+- FUKAMI_LENS_TIMINGS=1, or `"timings": true` in the request, adds a `timings` block
+  to the response envelope: ms per stage (interpreter startup, imports, reading the
+  input, the operation's own stages, writing the output), counters such as rows
+  scanned, bytes in/out and peak RSS.
+- FUKAMI_LENS_PROFILE_DIR=<dir> runs the script under cProfile and writes
+  `<script>-<operation>-<pid>.prof` there (open with `python3 -m pstats` or snakeviz).
+  For sampling profiles, run the script under `py-spy record` instead.
+- FUKAMI_LENS_PROMETHEUS_TEXTFILE=<path> accumulates per-operation counters in a
+  Prometheus textfile (for node_exporter's textfile collector), rewritten atomically.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from utils.serialization import write_json
+
+METRIC_PREFIX = 'fukami_lens_operation'
+
+# name: (type, help)
+METRICS = {
+    'runs_total': ('counter', 'Operations run, by outcome.'),
+    'stage_seconds_total': ('counter', 'Time spent per stage.'),
+    'count_total': ('counter', 'Rows and items processed, by kind.'),
+    'bytes_total': ('counter', 'Bytes read from the request and written to the response.'),
+    'peak_rss_bytes': ('gauge', 'Peak resident set size of the last run.'),
+}
+
+# The active Instrumentation, for code that does not have it passed in
+_current = None
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def _process_age():
+    """Seconds since this process started (Linux only), else None."""
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces; fields resume after the last ')'
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Scripts import this module first, so everything after it counts as imports
+_LOADED = time.perf_counter()
+_PROCESS_AGE = _process_age()
+
+
+class Instrumentation:
+    """Collects stage timings and counters for one script run."""
+
+    def __init__(self, script):
+        global _current
+        self.created = _LOADED
+        self.script = script
+        self.operation = None
+        self.timings = _env_flag('FUKAMI_LENS_TIMINGS')
+        self.profile_dir = os.environ.get('FUKAMI_LENS_PROFILE_DIR')
+        self.textfile = os.environ.get('FUKAMI_LENS_PROMETHEUS_TEXTFILE')
+        self.stages = {}
+        self.counts = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._profiler = None
+        self._lock = threading.Lock()
+
+        if _PROCESS_AGE is not None:
+            self.stages['startup'] = _PROCESS_AGE * 1000
+        self.stages['imports'] = (time.perf_counter() - _LOADED) * 1000
+        if self.profile_dir:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        _current = self
+
+    @property
+    def enabled(self):
+        return bool(self.timings or self.profile_dir or self.textfile)
+
+    def enable_timings(self, requested=True):
+        """Switch the timings block on when the request asks for it."""
+        if requested:
+            self.timings = True
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def count(self, name, n):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def read_input(self, path, load):
+        """Time reading the request file with `load(f)`, recording its size."""
+        with self.stage('read_input'):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = load(f)
+            self.bytes_in += os.path.getsize(path)
+        return data
+
+    def report(self, pending_output_ms=None, pending_bytes=0):
+        """The `timings` block; `pending_*` cover output still being written."""
+        stages = {name: round(ms, 3) for name, ms in self.stages.items()}
+        if pending_output_ms is not None:
+            stages['output'] = round(self.stages.get('output', 0.0) + pending_output_ms, 3)
+        return {
+            'total_ms': round((time.perf_counter() - self.created) * 1000 + self.stages.get('startup', 0.0), 3),
+            'stages': stages,
+            'counts': dict(self.counts),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out + pending_bytes,
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+
+    def write(self, obj, stream=None):
+        """write_json() that counts towards the output stage and bytes out."""
+        with self.stage('output'):
+            written = write_json(obj, stream)
+        self.bytes_out += written
+        return written
+
+    def emit(self, result, stream=None):
+        """Write the response envelope, with a `timings` block when requested."""
+        if not self.enabled:
+            return write_json(result, stream)
+
+        started = time.perf_counter()
+        trailer = None
+        if self.timings and isinstance(result, dict):
+            trailer = lambda written: {
+                'timings': self.report((time.perf_counter() - started) * 1000, written)
+            }
+        with self.stage('output'):
+            written = write_json(result, stream, trailer=trailer)
+        self.bytes_out += written
+        self.finish(success=bool(result.get('success', True)) if isinstance(result, dict) else True)
+        return written
+
+    def emit_footer(self, stream=None):
+        """For scripts that stream records: write the timings as a last `{"timings": ...}` line."""
+        if self.timings:
+            write_json({'timings': self.report()}, stream)
+        self.finish()
+
+    def finish(self, success=True):
+        """Write the profile and Prometheus metrics, if configured."""
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = f'{self.script}-{self.operation or "run"}-{os.getpid()}.prof'
+            self._profiler.dump_stats(os.path.join(self.profile_dir, name))
+            self._profiler = None
+        if self.textfile:
+            try:
+                self._write_textfile(success)
+            except OSError as e:
+                print(f'[instrumentation] Could not write {self.textfile}: {e}', file=sys.stderr)
+
+    def _samples(self, success):
+        labels = {'script': self.script, 'operation': self.operation or 'run'}
+        yield 'runs_total', dict(labels, status='success' if success else 'error'), 1
+        for name, ms in self.stages.items():
+            yield 'stage_seconds_total', dict(labels, stage=name), ms / 1000
+        for name, n in self.counts.items():
+            yield 'count_total', dict(labels, kind=name), n
+        yield 'bytes_total', dict(labels, direction='in'), self.bytes_in
+        yield 'bytes_total', dict(labels, direction='out'), self.bytes_out
+        rss = peak_rss_bytes()
+        if rss is not None:
+            yield 'peak_rss_bytes', labels, rss
+
+    def _write_textfile(self, success):
+        """Add this run to the textfile's counters; written to a temp file and renamed."""
+        path = self.textfile
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path + '.lock', 'w') as lock:
+            try:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+
+            values = {}
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.startswith('#') or not line.strip():
+                            continue
+                        key, _, value = line.rstrip('\n').rpartition(' ')
+                        values[key] = float(value)
+
+            for metric, labels, value in self._samples(success):
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in sorted(labels.items()))
+                key = f'{METRIC_PREFIX}_{metric}{{{label_text}}}'
+                kind = METRICS[metric][0]
+                values[key] = values.get(key, 0.0) + value if kind == 'counter' else value
+
+            lines = []
+            for metric, (kind, help_text) in METRICS.items():
+                name = f'{METRIC_PREFIX}_{metric}'
+                keys = sorted(k for k in values if k.startswith(name + '{'))
+                if not keys:
+                    continue
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.extend(f'{key} {_format_value(values[key])}' for key in keys)
+
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp, path)
+
+
+def current():
+    """The active Instrumentation, or None outside an instrumented script."""
+    return _current
+
+
+@contextmanager
+def stage(name):
+    """Time a stage on the active Instrumentation; a no-op when there is none."""
+    if _current is None or not _current.enabled:
+        yield
+        return
+    with _current.stage(name):
+        yield
+
+
+def count(name, n):
+    """Add to a counter on the active Instrumentation; a no-op when there is none."""
+    if _current is not None and _current.enabled:
+        _current.count(name, n)
@@ -0,0 +1,188 @@
+"""
+Durable ingestion queue for post embeddings.
+
+Saves from several editors or cron each start their own Python process. Instead of
+each of them committing a tiny write to LanceDB, they enqueue the post and its
+embedding here (`<db_path>/<table>.queue.sqlite3`). A single writer drains the queue
+into large batched upserts:
+
+- Jobs are keyed by post id, so saving a post again before it was written replaces
+  the queued job instead of adding a second write.
+- The writer holds an exclusive flock for as long as it drains; other processes
+  trying to drain return immediately and leave the work to it.
+- A job is only removed after its write succeeded, and only if it was not replaced
+  in the meantime, so a crash or a concurrent re-save never loses an update.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class IngestQueue:
+    """SQLite-backed queue of post upserts, one pending job per post."""
+
+    def __init__(self, db_path, table_name):
+        os.makedirs(db_path, exist_ok=True)
+        self.path = os.path.join(db_path, f'{table_name}.queue.sqlite3')
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' post_id INTEGER PRIMARY KEY,'
+            ' post TEXT NOT NULL,'
+            ' embedding BLOB NOT NULL,'
+            ' model TEXT,'
+            ' enqueued_at REAL NOT NULL,'
+            ' first_enqueued_at REAL NOT NULL,'
+            ' saves INTEGER NOT NULL DEFAULT 1)'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, posts, embeddings, model=None):
+        """Queue upserts; a post already waiting is replaced. Returns the number queued."""
+        now = time.time()
+        rows = [
+            (int(post['id']), json.dumps(post, ensure_ascii=False),
+             np.asarray(embedding, dtype=np.float32).tobytes(), model, now, now)
+            for post, embedding in zip(posts, embeddings)
+        ]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT INTO jobs (post_id, post, embedding, model, enqueued_at, first_enqueued_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT(post_id) DO UPDATE SET'
+                '  post = excluded.post, embedding = excluded.embedding, model = excluded.model,'
+                '  enqueued_at = excluded.enqueued_at, saves = saves + 1',
+                rows
+            )
+        return len(rows)
+
+    def claim(self, limit):
+        """The `limit` longest-waiting jobs as dicts (they stay queued until `ack`)."""
+        rows = self.conn.execute(
+            'SELECT post_id, post, embedding, model, enqueued_at FROM jobs'
+            ' ORDER BY first_enqueued_at LIMIT ?', (limit,)
+        ).fetchall()
+        return [{
+            'post_id': post_id,
+            'post': json.loads(post),
+            'embedding': np.frombuffer(embedding, dtype=np.float32),
+            'model': model,
+            'enqueued_at': enqueued_at,
+        } for post_id, post, embedding, model, enqueued_at in rows]
+
+    def ack(self, jobs):
+        """Remove written jobs, except those re-saved since they were claimed."""
+        with self.conn:
+            self.conn.executemany(
+                'DELETE FROM jobs WHERE post_id = ? AND enqueued_at = ?',
+                [(job['post_id'], job['enqueued_at']) for job in jobs]
+            )
+            self._set_meta({'last_write_at': time.time(), 'last_batch_size': len(jobs)})
+            self.conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('posts_written', ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+                (len(jobs),)
+            )
+
+    def record_error(self, message):
+        with self.conn:
+            self._set_meta({'last_error': message, 'last_error_at': time.time()})
+
+    def _set_meta(self, values):
+        self.conn.executemany(
+            'INSERT INTO meta (key, value) VALUES (?, ?)'
+            ' ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            [(key, str(value)) for key, value in values.items()]
+        )
+
+    def pending_ids(self, post_ids):
+        """Which of `post_ids` are waiting in the queue."""
+        if not post_ids:
+            return set()
+        ids = [int(pid) for pid in post_ids]
+        placeholders = ', '.join('?' * len(ids))
+        rows = self.conn.execute(f'SELECT post_id FROM jobs WHERE post_id IN ({placeholders})', ids)
+        return {row[0] for row in rows}
+
+    def depth(self):
+        return self.conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def oldest_age(self):
+        """Seconds the longest-waiting job has been queued, or 0."""
+        oldest = self.conn.execute('SELECT MIN(first_enqueued_at) FROM jobs').fetchone()[0]
+        return max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def stats(self):
+        depth, saves, oldest = self.conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(saves), 0), MIN(first_enqueued_at) FROM jobs'
+        ).fetchone()
+        meta = dict(self.conn.execute('SELECT key, value FROM meta').fetchall())
+        now = time.time()
+        last_write_at = float(meta['last_write_at']) if 'last_write_at' in meta else None
+        return {
+            'depth': depth,
+            # Saves absorbed by coalescing: queued saves beyond one per post
+            'coalesced_saves': saves - depth,
+            'lag_seconds': round(now - oldest, 3) if oldest is not None else 0.0,
+            'posts_written': int(meta.get('posts_written', 0)),
+            'last_batch_size': int(meta.get('last_batch_size', 0)),
+            'seconds_since_last_write': round(now - last_write_at, 3) if last_write_at else None,
+            'last_error': meta.get('last_error'),
+            'writer_active': self.writer_active(),
+        }
+
+    @property
+    def lock_path(self):
+        return self.path + '.writer.lock'
+
+    @property
+    def active_lock_path(self):
+        return self.path + '.active.lock'
+
+    @contextmanager
+    def writer_lock(self):
+        """Yields True if this process became the writer, False if another one is.
+
+        The writer also holds the active lock, which `writer_active` probes, so reading
+        stats never contends for the writer lock itself.
+        """
+        with open(self.lock_path, 'w') as lock:
+            try:
+                import fcntl
+            except ImportError:  # Windows: no cross-process lock
+                yield True
+                return
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                with open(self.active_lock_path, 'w') as active:
+                    # Blocks only for as long as a writer_active() probe holds it
+                    fcntl.flock(active, fcntl.LOCK_EX)
+                    yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def writer_active(self):
+        with open(self.active_lock_path, 'w') as active:
+            try:
+                import fcntl
+            except ImportError:
+                return False
+            try:
+                fcntl.flock(active, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(active, fcntl.LOCK_UN)
+            return False
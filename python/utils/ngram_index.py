@@ -0,0 +1,307 @@
+"""
+Bigram keyword index over post titles and content.
+
+The admin viewer's search used to run `LIKE '%term%'` over every post body, which
+scans the whole table per keystroke. This index (`<db_path>/<table>.ngrams.sqlite3`)
+maps every character bigram of a post's title and content to the posts holding it:
+
+- Text is NFKC-normalized and lowercased, so full-width and half-width forms match
+  and Japanese or Chinese text, which has no spaces between words, is searchable by
+  any substring.
+- A term of one or two characters is answered by the index alone. A longer term is
+  answered with the posts holding all its bigrams, and those candidates are checked
+  for the actual substring.
+- Every indexed version of a post gets a new document number. Posting lists are
+  written per batch of posts as a segment (one blob of document numbers per bigram),
+  and segments of similar size are merged ten at a time, dropping the documents that
+  were replaced or deleted since.
+- Writes to the posts table index the written posts (see
+  `LanceDBManager._update_keyword_index`). `sync` catches up with any other change
+  by comparing content hashes, in steps of `max_seconds`, so the first search on a
+  large site builds the index over several requests.
+"""
+import math
+import os
+import sqlite3
+import time
+import unicodedata
+from itertools import groupby
+
+import numpy as np
+
+# Posts indexed per segment while syncing
+SYNC_BATCH_SIZE = 2000
+
+# Segments of one size tier (a power of ten posts) merged together
+MERGE_FACTOR = 10
+
+# Candidate posts fetched per query when verifying a term
+VERIFY_BATCH_SIZE = 1000
+
+# A bigram is stored as one integer: first code point << 21 | second code point
+CODE_POINT_BITS = 21
+
+DOCNUM_DTYPE = '<u4'
+
+
+def normalize_text(text):
+    """NFKC, lowercase, whitespace collapsed to single spaces and a trailing space."""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split()) + ' '
+
+
+def text_grams(text):
+    """The distinct bigram codes of normalized `text`, except those starting with a space.
+
+    With the trailing space every character starts a bigram, so single-character
+    terms are found by prefix.
+    """
+    points = np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(np.int64)
+    grams = (points[:-1] << CODE_POINT_BITS) | points[1:]
+    return np.unique(grams[points[:-1] != ord(' ')])
+
+
+def term_grams(term):
+    return sorted({(ord(a) << CODE_POINT_BITS) | ord(b) for a, b in zip(term, term[1:])})
+
+
+def query_terms(query):
+    return normalize_text(query).split()
+
+
+def sql_ids(ids):
+    return ', '.join(str(int(pid)) for pid in ids)
+
+
+class NgramIndex:
+    """SQLite-backed bigram inverted index of one posts table."""
+
+    def __init__(self, db_path, table_name):
+        os.makedirs(db_path, exist_ok=True)
+        self.path = os.path.join(db_path, f'{table_name}.ngrams.sqlite3')
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS docs ('
+            ' docnum INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' post_id INTEGER NOT NULL UNIQUE,'
+            ' content_hash TEXT)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS segments ('
+            ' segment INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' docs INTEGER NOT NULL)'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS postings ('
+            ' gram INTEGER NOT NULL,'
+            ' segment INTEGER NOT NULL,'
+            ' docnums BLOB NOT NULL,'
+            ' PRIMARY KEY (gram, segment)) WITHOUT ROWID'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS postings_segment ON postings (segment)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    @staticmethod
+    def exists(db_path, table_name):
+        return os.path.exists(os.path.join(db_path, f'{table_name}.ngrams.sqlite3'))
+
+    def close(self):
+        self.conn.close()
+
+    def _meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _remove(self, post_ids):
+        """Drop posts; their postings are skipped from now on and dropped on merge."""
+        self.conn.executemany('DELETE FROM docs WHERE post_id = ?', [(int(pid),) for pid in post_ids])
+
+    def _live_docs(self):
+        """(post id by document number, whether each document number is current)"""
+        rows = np.array(self.conn.execute('SELECT docnum, post_id FROM docs').fetchall(), dtype=np.int64)
+        size = int(rows[:, 0].max()) + 1 if len(rows) else 1
+        post_ids = np.zeros(size, dtype=np.int64)
+        live = np.zeros(size, dtype=bool)
+        if len(rows):
+            post_ids[rows[:, 0]] = rows[:, 1]
+            live[rows[:, 0]] = True
+        return post_ids, live
+
+    def _write_segment(self, grams, docnums, docs):
+        """Store (gram, docnum) pairs as a new segment of `docs` posts."""
+        segment = self.conn.execute('INSERT INTO segments (docs) VALUES (?)', (docs,)).lastrowid
+        if len(grams) == 0:
+            return
+        order = np.lexsort((docnums, grams))
+        grams, docnums = grams[order], docnums[order].astype(DOCNUM_DTYPE)
+        unique, starts = np.unique(grams, return_index=True)
+        ends = np.append(starts[1:], len(grams))
+        self.conn.executemany(
+            'INSERT INTO postings (gram, segment, docnums) VALUES (?, ?, ?)',
+            ((int(gram), segment, docnums[start:end].tobytes()) for gram, start, end in zip(unique, starts, ends))
+        )
+
+    def _add(self, posts):
+        """Index `posts` (dicts with id, title, content and content_hash), replacing them."""
+        # The last row wins when a post id appears twice (`store` does not deduplicate)
+        posts = list({int(post['id']): post for post in posts}.values())
+        self._remove([post['id'] for post in posts])
+        grams, docnums = [], []
+        for post in posts:
+            docnum = self.conn.execute(
+                'INSERT INTO docs (post_id, content_hash) VALUES (?, ?)',
+                (int(post['id']), post.get('content_hash') or '')
+            ).lastrowid
+            post_grams = text_grams(normalize_text(post.get('title')) + normalize_text(post.get('content')))
+            grams.append(post_grams)
+            docnums.append(np.full(len(post_grams), docnum, dtype=np.int64))
+        if posts:
+            self._write_segment(np.concatenate(grams), np.concatenate(docnums), len(posts))
+        self._merge()
+
+    def _merge(self):
+        """Merge segments while some size tier holds MERGE_FACTOR of them."""
+        while True:
+            tiers = {}
+            for segment, docs in self.conn.execute('SELECT segment, docs FROM segments ORDER BY segment'):
+                tiers.setdefault(int(math.log10(max(docs, 1))), []).append((segment, docs))
+            full = [segments for segments in tiers.values() if len(segments) >= MERGE_FACTOR]
+            if not full:
+                return
+            self._merge_segments(full[0][:MERGE_FACTOR])
+
+    def _merge_segments(self, segments):
+        ids = [segment for segment, _ in segments]
+        _, live = self._live_docs()
+        placeholders = ', '.join('?' * len(ids))
+        rows = self.conn.execute(
+            f'SELECT gram, docnums FROM postings WHERE segment IN ({placeholders}) ORDER BY gram', ids
+        )
+        merged = []
+        for gram, group in groupby(rows, key=lambda row: row[0]):
+            docnums = np.concatenate([np.frombuffer(blob, dtype=DOCNUM_DTYPE) for _, blob in group])
+            docnums = docnums[docnums < len(live)]
+            docnums = np.sort(docnums[live[docnums]])
+            if len(docnums):
+                merged.append((gram, docnums.tobytes()))
+        segment = self.conn.execute(
+            'INSERT INTO segments (docs) VALUES (?)', (sum(docs for _, docs in segments),)
+        ).lastrowid
+        self.conn.execute(f'DELETE FROM postings WHERE segment IN ({placeholders})', ids)
+        self.conn.execute(f'DELETE FROM segments WHERE segment IN ({placeholders})', ids)
+        self.conn.executemany(
+            'INSERT INTO postings (gram, segment, docnums) VALUES (?, ?, ?)',
+            ((gram, segment, blob) for gram, blob in merged)
+        )
+
+    def update(self, table_name, before_version, after_version, posts):
+        """Index posts just written to `table_name`, taking it from `before_version`
+        to `after_version`.
+
+        Does nothing unless the index was in sync with `before_version`; `sync` then
+        catches up with the table instead. Returns whether the posts were indexed.
+        """
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            if self._meta('version') != f'{table_name}@{before_version}':
+                return False
+            self._add(posts)
+            self._set_meta('version', f'{table_name}@{after_version}')
+        return True
+
+    def sync(self, table, max_seconds=None):
+        """Bring the index up to date with `table` (an opened LanceDB table).
+
+        Only posts whose content hash differs from the indexed one are read and
+        indexed again. Returns whether the index is complete; after `max_seconds` the
+        work done so far is kept and the next call continues from there.
+        """
+        version = f'{table.name}@{table.version}'
+        if self._meta('version') == version:
+            return True
+        started = time.monotonic()
+        columns = ['id', 'content_hash'] if 'content_hash' in table.schema.names else ['id']
+        keys = table.search().select(columns).limit(None).to_arrow()
+        hashes = keys.column('content_hash').to_pylist() if 'content_hash' in columns else [None] * keys.num_rows
+        current = {int(pid): h or '' for pid, h in zip(keys.column('id').to_pylist(), hashes)}
+        indexed = dict(self.conn.execute('SELECT post_id, content_hash FROM docs'))
+
+        removed = [pid for pid in indexed if pid not in current]
+        changed = [pid for pid, h in current.items() if indexed.get(pid) != h]
+        if removed:
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self._remove(removed)
+        for i in range(0, len(changed), SYNC_BATCH_SIZE):
+            if max_seconds is not None and time.monotonic() - started >= max_seconds:
+                return False
+            batch = changed[i:i + SYNC_BATCH_SIZE]
+            rows = (table.search().where(f'id IN ({sql_ids(batch)})')
+                    .select(['id', 'title', 'content']).limit(None).to_arrow().to_pylist())
+            for row in rows:
+                row['content_hash'] = current[int(row['id'])]
+            with self.conn:
+                self.conn.execute('BEGIN IMMEDIATE')
+                self._add(rows)
+        with self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._set_meta('version', version)
+        return True
+
+    def _docnums(self, sql, params):
+        blobs = [np.frombuffer(blob, dtype=DOCNUM_DTYPE) for blob, in self.conn.execute(sql, params)]
+        return np.concatenate(blobs) if blobs else np.empty(0, dtype=DOCNUM_DTYPE)
+
+    def _term_candidates(self, term):
+        """Document numbers that may contain `term`, and whether they certainly do."""
+        if len(term) == 1:
+            low = ord(term) << CODE_POINT_BITS
+            docnums = self._docnums(
+                'SELECT docnums FROM postings WHERE gram >= ? AND gram < ?',
+                (low, low + (1 << CODE_POINT_BITS))
+            )
+            return np.unique(docnums), True
+        lists = sorted(
+            (self._docnums('SELECT docnums FROM postings WHERE gram = ?', (gram,)) for gram in term_grams(term)),
+            key=len
+        )
+        docnums = lists[0]
+        for other in lists[1:]:
+            if len(docnums) == 0:
+                break
+            # A document number is in one segment only, so every list is unique
+            docnums = np.intersect1d(docnums, other, assume_unique=True)
+        return docnums, len(term) == 2
+
+    def search(self, table, query):
+        """Sorted ids of the posts whose title or content contains any term of `query`
+        (split on whitespace, matched case-insensitively)."""
+        post_ids, live = self._live_docs()
+
+        def current_posts(docnums):
+            docnums = docnums[docnums < len(live)].astype(np.int64)
+            return set(post_ids[docnums[live[docnums]]].tolist())
+
+        matched, unverified = set(), {}
+        for term in query_terms(query):
+            docnums, exact = self._term_candidates(term)
+            if exact:
+                matched |= current_posts(docnums)
+            else:
+                unverified[term] = current_posts(docnums)
+
+        pending = sorted(set().union(*unverified.values()) - matched)
+        for i in range(0, len(pending), VERIFY_BATCH_SIZE):
+            batch = pending[i:i + VERIFY_BATCH_SIZE]
+            rows = (table.search().where(f'id IN ({sql_ids(batch)})')
+                    .select(['id', 'title', 'content']).limit(None).to_arrow().to_pylist())
+            for row in rows:
+                pid = int(row['id'])
+                title, content = normalize_text(row['title']), normalize_text(row['content'])
+                if any(pid in ids and (term in title or term in content) for term, ids in unverified.items()):
+                    matched.add(pid)
+        return sorted(matched)
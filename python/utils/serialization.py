@@ -0,0 +1,148 @@
+"""
+Shared JSON serialization for the WP Fukami Lens AI Python scripts.
+
+Uses orjson with native NumPy support when it is installed and falls back to the
+standard library otherwise. NumPy arrays and Arrow arrays/scalars/tables are
+serialized without going through Python lists where possible, and results are
+written to stdout piece by piece instead of being built as one large string.
+"""
+import io
+import json
+import sys
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Containers nested deeper than this are serialized in one piece
+STREAM_DEPTH = 3
+
+
+def _arrow_to_native(obj):
+    """Convert Arrow values to NumPy (when numeric) or Python objects."""
+    import pyarrow as pa
+
+    if isinstance(obj, pa.Scalar):
+        return obj.as_py()
+    if isinstance(obj, pa.ChunkedArray):
+        obj = obj.combine_chunks()
+    if isinstance(obj, pa.FixedSizeListArray) and obj.null_count == 0:
+        values = obj.flatten()
+        if pa.types.is_floating(values.type) or pa.types.is_integer(values.type):
+            return values.to_numpy().reshape(len(obj), obj.type.list_size)
+    if isinstance(obj, pa.Array):
+        if obj.null_count == 0 and (pa.types.is_floating(obj.type) or pa.types.is_integer(obj.type)):
+            return obj.to_numpy()
+        return obj.to_pylist()
+    if isinstance(obj, (pa.Table, pa.RecordBatch)):
+        return obj.to_pylist()
+    return None
+
+
+def _default(obj):
+    """Fallback for values neither serializer handles natively."""
+    if type(obj).__module__.startswith('pyarrow'):
+        native = _arrow_to_native(obj)
+        if native is not None:
+            return native
+    if hasattr(obj, 'tolist'):  # NumPy arrays/scalars (stdlib path, object dtypes)
+        return obj.tolist()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, dict)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _default_orjson(obj):
+        # orjson passes unsupported NumPy dtypes (e.g. object) to default as well
+        return _default(obj)
+
+    def dumps_bytes(obj) -> bytes:
+        """Serialize `obj` to UTF-8 JSON bytes."""
+        return orjson.dumps(obj, default=_default_orjson, option=_ORJSON_OPTIONS)
+else:
+    _ENCODER = json.JSONEncoder(ensure_ascii=False, default=_default)
+
+    def dumps_bytes(obj) -> bytes:
+        """Serialize `obj` to UTF-8 JSON bytes."""
+        return _ENCODER.encode(obj).encode('utf-8')
+
+
+def dumps(obj) -> str:
+    """Serialize `obj` to a JSON string."""
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def _write_items(items, write, depth, first=True):
+    for key, value in items:
+        if not first:
+            write(b',')
+        first = False
+        write(dumps_bytes(str(key)))
+        write(b':')
+        _write(value, write, depth + 1)
+    return first
+
+
+def _write(obj, write, depth, trailer=None):
+    if depth < STREAM_DEPTH and isinstance(obj, dict):
+        write(b'{')
+        first = _write_items(obj.items(), write, depth)
+        if trailer is not None:
+            _write_items((trailer() or {}).items(), write, depth, first)
+        write(b'}')
+    elif depth < STREAM_DEPTH and isinstance(obj, (list, tuple)):
+        write(b'[')
+        for i, value in enumerate(obj):
+            if i:
+                write(b',')
+            _write(value, write, depth + 1)
+        write(b']')
+    elif ORJSON_AVAILABLE:
+        write(dumps_bytes(obj))
+    else:
+        for part in _ENCODER.iterencode(obj):
+            write(part.encode('utf-8'))
+
+
+def write_json(obj, stream=None, newline: bool = True, trailer=None) -> int:
+    """Write `obj` as JSON to `stream` (stdout by default) incrementally.
+
+    The outer containers of the response envelope are streamed element by element,
+    so large responses (many posts, embeddings) are never held as a single string.
+
+    `trailer`, if given, is called with the number of bytes written so far once the
+    rest of the `obj` dict has been streamed; the keys it returns are appended to it.
+    Returns the number of bytes written.
+    """
+    if stream is None:
+        stream = sys.stdout
+    if hasattr(stream, 'buffer'):
+        # Flush pending text output before writing to the underlying binary buffer
+        stream.flush()
+        out = stream.buffer
+        raw_write = out.write
+    elif isinstance(stream, io.TextIOBase):
+        out = stream
+        raw_write = lambda data: stream.write(data.decode('utf-8'))
+    else:
+        out = stream
+        raw_write = out.write
+    written = 0
+
+    def write(data):
+        nonlocal written
+        written += len(data)
+        raw_write(data)
+
+    _write(obj, write, 0, (lambda: trailer(written)) if trailer is not None else None)
+    if newline:
+        write(b'\n')
+    out.flush()
+    return written
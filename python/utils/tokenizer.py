@@ -1,41 +1,106 @@
-from typing import Dict, List, Tuple
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from tiktoken import get_encoding
 from transformers.tokenization_utils_base import PreTrainedTokenizerBase
 
+try:
+    from docling_core.transforms.chunker.tokenizer.base import BaseTokenizer
+except ImportError:
+    BaseTokenizer = None
+
+# Number of distinct segments whose token counts are remembered
+DEFAULT_COUNT_CACHE_SIZE = 16384
+
 
 # Create a wrapper class to make OpenAI's tokenizer compatible with the HybridChunker interface
 class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
     """Minimal wrapper for OpenAI's tokenizer."""
 
     def __init__(
-        self, model_name: str = "cl100k_base", max_length: int = 8191, **kwargs
+        self, model_name: str = "cl100k_base", max_length: int = 8191,
+        count_cache_size: int = DEFAULT_COUNT_CACHE_SIZE, **kwargs
     ):
         """Initialize the tokenizer.
 
         Args:
             model_name: The name of the OpenAI encoding to use
             max_length: Maximum sequence length
+            count_cache_size: Size of the LRU cache of token counts
         """
         super().__init__(model_max_length=max_length, **kwargs)
         self.tokenizer = get_encoding(model_name)
         self._vocab_size = self.tokenizer.max_token_value
+        self._vocab = None
+        self._counts = OrderedDict()
+        self._count_cache_size = count_cache_size
+        self.count_hits = 0
+        self.count_misses = 0
+
+    def tokenize(self, text: str, **kwargs) -> List[int]:
+        """Main method used by HybridChunker.
 
-    def tokenize(self, text: str, **kwargs) -> List[str]:
-        """Main method used by HybridChunker."""
-        return [str(t) for t in self.tokenizer.encode(text)]
+        Returns token ids as-is: the chunker only needs their number, and
+        `_convert_token_to_id` accepts them unchanged.
+        """
+        return self.tokenizer.encode_ordinary(text)
 
-    def _tokenize(self, text: str) -> List[str]:
+    def _tokenize(self, text: str) -> List[int]:
         return self.tokenize(text)
 
-    def _convert_token_to_id(self, token: str) -> int:
+    def _remember_count(self, text: str, count: int):
+        self._counts[text] = count
+        if len(self._counts) > self._count_cache_size:
+            self._counts.popitem(last=False)
+
+    def count_tokens(self, text: str) -> int:
+        """Number of tokens in `text`, memoized in a bounded LRU for repeated segments."""
+        count = self._counts.get(text)
+        if count is not None:
+            self._counts.move_to_end(text)
+            self.count_hits += 1
+            return count
+        self.count_misses += 1
+        count = len(self.tokenizer.encode_ordinary(text))
+        self._remember_count(text, count)
+        return count
+
+    def encode_batch(self, texts: Sequence[str], num_threads: Optional[int] = None) -> List[List[int]]:
+        """Encode many texts at once using tiktoken's thread pool."""
+        return self.tokenizer.encode_ordinary_batch(list(texts), num_threads=num_threads or os.cpu_count() or 1)
+
+    def count_tokens_batch(self, texts: Sequence[str], num_threads: Optional[int] = None) -> List[int]:
+        """Token counts for many texts; only uncached texts are encoded, in parallel."""
+        counts: List[Optional[int]] = [None] * len(texts)
+        misses = []
+        for i, text in enumerate(texts):
+            count = self._counts.get(text)
+            if count is None:
+                misses.append(i)
+            else:
+                self._counts.move_to_end(text)
+                self.count_hits += 1
+                counts[i] = count
+        if misses:
+            self.count_misses += len(misses)
+            encoded = self.encode_batch([texts[i] for i in misses], num_threads)
+            for i, ids in zip(misses, encoded):
+                counts[i] = len(ids)
+                self._remember_count(texts[i], len(ids))
+        return counts
+
+    def _convert_token_to_id(self, token) -> int:
         return int(token)
 
     def _convert_id_to_token(self, index: int) -> str:
         return str(index)
 
     def get_vocab(self) -> Dict[str, int]:
-        return {str(i): i for i in range(self.vocab_size)}
+        if self._vocab is None:
+            self._vocab = {str(i): i for i in range(self.vocab_size)}
+        return self._vocab
 
     @property
     def vocab_size(self) -> int:
@@ -47,7 +112,61 @@ class OpenAITokenizerWrapper(PreTrainedTokenizerBase):
     def __len__(self):
         return self.vocab_size
 
+    def chunker_tokenizer(self, max_tokens: int):
+        """Tokenizer to hand to HybridChunker.
+
+        With docling-core's BaseTokenizer API the chunker calls `count_tokens`
+        directly (cached, no token lists); older Docling versions take this
+        wrapper itself.
+        """
+        if BaseTokenizer is None:
+            return self
+        return CountingTokenizer(wrapper=self, max_tokens=max_tokens)
+
     @classmethod
     def from_pretrained(cls, *args, **kwargs):
         """Class method to match HuggingFace's interface."""
-        return cls()
\ No newline at end of file
+        return cls()
+
+
+if BaseTokenizer is not None:
+    class CountingTokenizer(BaseTokenizer):
+        """docling-core tokenizer backed by OpenAITokenizerWrapper's cached counts."""
+
+        wrapper: Any
+        max_tokens: int
+
+        model_config = {'arbitrary_types_allowed': True}
+
+        def count_tokens(self, text: str) -> int:
+            return self.wrapper.count_tokens(text)
+
+        def get_max_tokens(self) -> int:
+            return self.max_tokens
+
+        def get_tokenizer(self) -> Any:
+            return self.wrapper
+
+
+def measure_throughput(texts: Sequence[str], model_name: str = "cl100k_base", repeat: int = 3) -> Dict[str, Any]:
+    """Tokens/sec of the legacy string tokenization versus the id-native, cached and batch paths."""
+    wrapper = OpenAITokenizerWrapper(model_name=model_name)
+    total_tokens = sum(len(ids) for ids in wrapper.encode_batch(texts))
+
+    def rate(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed = time.perf_counter() - start
+        return round(total_tokens * repeat / elapsed) if elapsed > 0 else None
+
+    return {
+        'texts': len(texts),
+        'tokens': total_tokens,
+        'tokens_per_sec': {
+            'legacy_str_tokenize': rate(lambda: [len([str(t) for t in wrapper.tokenizer.encode(x)]) for x in texts]),
+            'tokenize_ids': rate(lambda: [len(wrapper.tokenize(x)) for x in texts]),
+            'count_tokens_cached': rate(lambda: [wrapper.count_tokens(x) for x in texts]),
+            'encode_batch': rate(lambda: wrapper.encode_batch(texts)),
+        },
+    }
@@ -0,0 +1,218 @@
+"""
+Memory-mapped vector cache and exact search for small posts tables.
+
+For tables of up to a few tens of thousands of posts, a brute-force scan over one
+contiguous float32 matrix is both faster and more accurate than an ANN or LanceDB
+scan per process. The cache lives next to the table:
+
+    <db_path>/<table>.vectors/
+        current              name of the live version directory
+        v<version>/          one per table version it was built from
+            vectors.npy      float32 (rows, dim)
+            sq_norms.npy     float32 squared L2 norm of every row
+            ids.npy          int64 post ids
+            dates.npy        post dates (fixed-width strings)
+            category_offsets.npy, category_codes.npy, categories.json
+                             each row's categories as a CSR list of codes
+            meta.json        table version, rows, dim
+
+Files are opened with np.load(mmap_mode='r'), so every process shares the page
+cache instead of reading the table. A cache stamped with an older table version is
+rebuilt into a new directory and `current` is switched atomically; processes that
+still map the old files keep working until they exit. A superseded directory is kept for
+GRACE_SECONDS so a process that read the old pointer just before the switch can still
+open it, and a load that loses that race anyway re-reads `current`.
+
+The cache is not updated incrementally: any write to the table (a single-post upsert
+included) gives it a new version, and the next search rebuilds the whole cache from a
+full scan. That is cheap at the sizes exact search is used for
+(FUKAMI_LENS_EXACT_SEARCH_MAX_ROWS), but the first search after each write pays it.
+"""
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow.compute as pc
+
+from utils import instrumentation
+
+# Rows scored per matrix multiplication
+BLOCK_ROWS = 65536
+
+# Seconds a superseded version directory is kept for processes still opening it
+GRACE_SECONDS = 300
+
+
+class VectorCache:
+    """Exact nearest-neighbour search over a memory-mapped copy of a table's vectors."""
+
+    def __init__(self, db_path, table_name):
+        self.root = os.path.join(db_path, f'{table_name}.vectors')
+        self.directory = None
+        self.meta = None
+
+    def _current(self):
+        try:
+            with open(os.path.join(self.root, 'current'), 'r') as f:
+                name = f.read().strip()
+            with open(os.path.join(self.root, name, 'meta.json'), 'r') as f:
+                return name, json.load(f)
+        except (OSError, ValueError):
+            return None, None
+
+    def load(self, table):
+        """Map the cache for `table`'s current version, rebuilding it if stale."""
+        try:
+            return self._load(table)
+        except FileNotFoundError:
+            # The version just read from `current` was removed; the pointer has moved on
+            return self._load(table)
+
+    def _load(self, table):
+        name, meta = self._current()
+        if meta is None or meta['version'] != table.version:
+            name, meta = self.build(table)
+        self.directory = os.path.join(self.root, name)
+        self.meta = meta
+        path = lambda f: os.path.join(self.directory, f)
+        with instrumentation.stage('mmap'):
+            self.vectors = np.load(path('vectors.npy'), mmap_mode='r')
+            self.sq_norms = np.load(path('sq_norms.npy'), mmap_mode='r')
+            self.ids = np.load(path('ids.npy'), mmap_mode='r')
+            self.dates = np.load(path('dates.npy'), mmap_mode='r')
+            self.category_offsets = np.load(path('category_offsets.npy'), mmap_mode='r')
+            self.category_codes = np.load(path('category_codes.npy'), mmap_mode='r')
+            with open(path('categories.json'), 'r', encoding='utf-8') as f:
+                self.categories = json.load(f)
+        return self
+
+    def build(self, table):
+        """Write the cache for `table`'s current version and make it live."""
+        version = table.version
+        name = f'v{version}'
+        final = os.path.join(self.root, name)
+        tmp = os.path.join(self.root, f'{name}.{os.getpid()}.tmp')
+        os.makedirs(tmp, exist_ok=True)
+
+        with instrumentation.stage('build_vector_cache'):
+            data = (table.search().select(['id', 'embedding', 'date', 'categories'])
+                    .limit(None).to_arrow())
+            # Rows ordered by id, so rebuilds of an unchanged table are identical
+            data = data.take(pc.sort_indices(data, sort_keys=[('id', 'ascending')]))
+            embeddings = data.column('embedding').combine_chunks()
+            dim = embeddings.type.list_size
+            vectors = embeddings.flatten().to_numpy(zero_copy_only=False).astype(np.float32).reshape(-1, dim)
+
+            categories = data.column('categories').combine_chunks()
+            values = pc.fill_null(categories.flatten(), '')
+            dictionary = values.dictionary_encode()
+            offsets = categories.offsets.to_numpy(zero_copy_only=False).astype(np.int64)
+            offsets -= offsets[0]
+
+            np.save(os.path.join(tmp, 'vectors.npy'), vectors)
+            np.save(os.path.join(tmp, 'sq_norms.npy'), np.einsum('ij,ij->i', vectors, vectors))
+            np.save(os.path.join(tmp, 'ids.npy'), data.column('id').to_numpy().astype(np.int64))
+            np.save(os.path.join(tmp, 'dates.npy'),
+                    np.array(pc.fill_null(data.column('date'), '').to_pylist(), dtype=str))
+            np.save(os.path.join(tmp, 'category_offsets.npy'), offsets)
+            np.save(os.path.join(tmp, 'category_codes.npy'),
+                    dictionary.indices.to_numpy(zero_copy_only=False).astype(np.int32))
+            with open(os.path.join(tmp, 'categories.json'), 'w', encoding='utf-8') as f:
+                json.dump(dictionary.dictionary.to_pylist(), f, ensure_ascii=False)
+            meta = {'version': version, 'rows': len(vectors), 'dim': dim}
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+        if os.path.exists(final):
+            # Another process built the same version first
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, final)
+        previous, _ = self._current()
+        pointer = os.path.join(self.root, f'current.{os.getpid()}.tmp')
+        with open(pointer, 'w') as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(self.root, 'current'))
+        if previous and previous != name:
+            # Start the superseded version's grace period now
+            try:
+                os.utime(os.path.join(self.root, previous))
+            except OSError:
+                pass
+        self._remove_old(name)
+        instrumentation.count('vector_cache_rows', len(vectors))
+        return name, meta
+
+    def _remove_old(self, keep):
+        """Delete version directories other than `keep` superseded over GRACE_SECONDS ago."""
+        cutoff = time.time() - GRACE_SECONDS
+        for entry in os.listdir(self.root):
+            if entry.startswith('v') and entry != keep and not entry.endswith('.tmp'):
+                path = os.path.join(self.root, entry)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                except OSError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+
+    def mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Rows matching `start_date`, `end_date` and `categories` filters (None: all rows)."""
+        if not filters:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if filters.get('start_date'):
+            mask &= self.dates >= str(filters['start_date'])
+        if filters.get('end_date'):
+            mask &= self.dates <= str(filters['end_date'])
+        if filters.get('categories'):
+            wanted = [i for i, name in enumerate(self.categories) if name in set(filters['categories'])]
+            has_category = np.zeros(len(self.ids), dtype=bool)
+            hits = np.isin(self.category_codes, wanted)
+            if hits.any():
+                rows = np.repeat(np.arange(len(self.ids)), np.diff(self.category_offsets))
+                has_category[rows[hits]] = True
+            mask &= has_category
+        return mask
+
+    def search(self, query_embedding: List[float], limit: int = 5,
+               filters: Optional[Dict] = None, metric: str = 'l2',
+               max_distance: Optional[float] = None):
+        """Ids and distances of the nearest rows, as LanceDB computes them for `metric`.
+
+        l2 is the squared Euclidean distance, cosine 1 - cosine similarity and dot
+        1 - dot product. Rows farther than `max_distance` are left out.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.meta['dim'],):
+            raise ValueError(f"Query has {query.size} dimensions, the table {self.meta['dim']}")
+        mask = self.mask(filters)
+        query_sq = float(query @ query)
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+        with instrumentation.stage('exact_search'):
+            for start in range(0, len(self.ids), BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, len(self.ids))
+                dots = self.vectors[start:end] @ query
+                if metric == 'l2':
+                    distances = np.maximum(self.sq_norms[start:end] - 2 * dots + query_sq, 0)
+                elif metric == 'cosine':
+                    distances = 1 - dots / np.sqrt(np.maximum(self.sq_norms[start:end] * query_sq, 1e-30))
+                else:
+                    distances = 1 - dots
+                if mask is not None:
+                    distances = np.where(mask[start:end], distances, np.inf)
+                if max_distance is not None:
+                    distances = np.where(distances <= max_distance, distances, np.inf)
+                k = min(limit, end - start)
+                top = np.argpartition(distances, k - 1)[:k] if k < end - start else np.arange(end - start)
+                best_rows = np.concatenate([best_rows, top + start])
+                best_distances = np.concatenate([best_distances, distances[top]])
+            order = np.argsort(best_distances, kind='stable')[:limit]
+            order = order[np.isfinite(best_distances[order])]
+        instrumentation.count('rows_scanned', len(self.ids))
+        return self.ids[best_rows[order]], best_distances[order]
@@ -2,7 +2,11 @@
 """
 View Database for WP Fukami Lens AI
 
-This script provides paginated viewing of LanceDB database contents with search and filtering.
+This script provides paginated viewing of LanceDB database contents with search and filtering,
+and (operation `facets`) post counts per category, tag and month plus embedding coverage.
+
+Usage:
+    python3 view_database.py <input_file> [view|facets]
 """
 
 import sys
@@ -16,26 +20,24 @@ os.environ["HF_HOME"] = "/tmp"
 os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
 os.environ["XDG_CACHE_HOME"] = "/tmp"
 
-
-class NumpyEncoder(json.JSONEncoder):
-    """Custom JSON encoder to handle NumPy types"""
-    def default(self, obj):
-        if hasattr(obj, 'tolist'):  # Handle numpy arrays and similar
-            return obj.tolist()
-        elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, dict)):
-            return list(obj)
-        return super(NumpyEncoder, self).default(obj)
+from config import load_config
+from utils import instrumentation
+from utils.embedding_state import active_table
+from utils.instrumentation import Instrumentation
+from utils.ngram_index import NgramIndex
+from utils.serialization import write_json
 
 
 try:
     import lancedb
-    import pandas as pd
-    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from lancedb.query import ColumnOrdering
 except ImportError as e:
-    print(json.dumps({
+    write_json({
         'success': False,
-        'data': f'Missing required packages: {str(e)}. Please install lancedb and pandas.'
-    }, cls=NumpyEncoder))
+        'data': f'Missing required packages: {str(e)}. Please install lancedb and pyarrow.'
+    })
     sys.exit(1)
 
 
@@ -44,12 +46,162 @@ class DatabaseViewer:
     
     def __init__(self, db_path: str, table_name: str = 'wordpress_posts'):
         self.db_path = db_path
-        self.table_name = table_name
+        self.logical_table_name = table_name
+        # Physical table serving `table_name` (it changes when the table is re-embedded)
+        self.table_name = active_table(db_path, table_name)
         self.db = lancedb.connect(db_path)
         
+    # Columns returned for every row; the embedding column is only read on request
+    LIST_COLUMNS = ['id', 'title', 'content', 'date', 'permalink', 'categories', 'tags']
+    
+    # Columns scanned for facets: never the embedding or content
+    FACET_COLUMNS = ['id', 'date', 'categories', 'tags']
+    
+    # Keyword index matches above which the LIKE scan is cheaper than an `id IN` list
+    MAX_SEARCH_IDS = 2000
+    
+    def _search_ids(self, table, search: str) -> Optional[List[int]]:
+        """Ids of the posts matching `search` through the keyword index.
+        
+        Returns None while the index is still being built, or when more than
+        MAX_SEARCH_IDS posts match (common terms), so the caller falls back to scanning.
+        """
+        index = NgramIndex(self.db_path, self.logical_table_name)
+        try:
+            with instrumentation.stage('keyword_index_sync'):
+                complete = index.sync(table, load_config().keyword_index_sync_seconds)
+            if not complete:
+                return None
+            with instrumentation.stage('keyword_search'):
+                ids = index.search(table, search)
+            return ids if len(ids) <= self.MAX_SEARCH_IDS else None
+        finally:
+            index.close()
+    
+    def _build_filter(self, search: str = '', date_filter: str = '', table=None) -> Optional[str]:
+        """Build the SQL filter shared by the page scan and the count
+        
+        With `table`, search terms are resolved to post ids through the keyword index.
+        """
+        conditions = []
+        
+        # Apply search filter
+        search_ids = self._search_ids(table, search) if search.strip() and table is not None else None
+        if search_ids is not None:
+            instrumentation.count('search_matches', len(search_ids))
+            conditions.append(f"id IN ({', '.join(str(pid) for pid in search_ids)})" if search_ids else "false")
+        elif search:
+            search_terms = search.lower().split()
+            search_conditions = []
+            for term in search_terms:
+                term = term.replace("'", "''")
+                search_conditions.append(f"LOWER(title) LIKE '%{term}%' OR LOWER(content) LIKE '%{term}%'")
+            if search_conditions:
+                conditions.append("(" + " OR ".join(search_conditions) + ")")
+        
+        # Apply date filter
+        if date_filter:
+            today = datetime.now().date()
+            if date_filter == 'today':
+                start_date = today
+                end_date = today
+            elif date_filter == 'week':
+                start_date = today - timedelta(days=today.weekday())
+                end_date = today
+            elif date_filter == 'month':
+                start_date = today.replace(day=1)
+                end_date = today
+            elif date_filter == 'year':
+                start_date = today.replace(month=1, day=1)
+                end_date = today
+            else:
+                start_date = None
+                end_date = None
+            
+            if start_date and end_date:
+                conditions.append(f"(date >= '{start_date}' AND date <= '{end_date}')")
+        
+        return " AND ".join(conditions) if conditions else None
+    
+    def _keyset_page_ids(self, table, where: Optional[str], per_page: int,
+                         cursor: Dict[str, Any], order_by: str) -> List[int]:
+        """Resolve the ids of the next page after a keyset cursor.
+        
+        The cursor condition, the ordering and the limit all run inside the LanceDB
+        scan (a top-k over the key columns), so no more than `per_page` keys come
+        back and rows before the cursor are filtered out while scanning.
+        """
+        conditions = [where] if where else []
+        if order_by == 'date':
+            key_columns = ['id', 'date']
+            ordering = [ColumnOrdering(column_name='date', ascending=False),
+                        ColumnOrdering(column_name='id', ascending=False)]
+            if cursor.get('date') is not None and cursor.get('id') is not None:
+                cursor_date = str(cursor['date']).replace("'", "''")
+                conditions.append(
+                    f"(date < '{cursor_date}' OR (date = '{cursor_date}' AND id < {int(cursor['id'])}))"
+                )
+        else:
+            key_columns = ['id']
+            ordering = [ColumnOrdering(column_name='id', ascending=False)]
+            if cursor.get('id') is not None:
+                conditions.append(f"id < {int(cursor['id'])}")
+        
+        query = table.search().select(key_columns).order_by(ordering).limit(per_page)
+        if conditions:
+            query = query.where(" AND ".join(conditions))
+        with instrumentation.stage('scan_keys'):
+            keys = query.to_arrow()
+        instrumentation.count('rows_scanned', keys.num_rows)
+        return keys.column('id').to_pylist()
+    
+    def _arrow_rows(self, result) -> List[Dict[str, Any]]:
+        """Convert a query result to row dicts, keeping embeddings as NumPy rows"""
+        if 'embedding' not in result.column_names:
+            return result.to_pylist()
+        embeddings = result.column('embedding').combine_chunks()
+        rows = result.drop_columns(['embedding']).to_pylist()
+        if embeddings.null_count == 0:
+            vectors = embeddings.flatten().to_numpy().reshape(len(rows), -1) if rows else []
+        else:
+            vectors = embeddings.to_pylist()
+        for row, vector in zip(rows, vectors):
+            row['embedding'] = vector
+        return rows
+    
+    def _row_to_post(self, row: Dict[str, Any], embedding_dim: Optional[int],
+                     include_embedding: bool, embedding_preview: int) -> Dict[str, Any]:
+        """Convert an Arrow row dict into the post payload sent to the admin screen"""
+        post = {
+            'id': int(row['id']),
+            'title': str(row['title']),
+            'content': str(row['content']),
+            'date': str(row['date']),
+            'permalink': str(row['permalink']),
+            'categories': row.get('categories') or [],
+            'tags': row.get('tags') or [],
+            'embedding_dim': embedding_dim
+        }
+        embedding = row.get('embedding')
+        if include_embedding:
+            post['embedding'] = embedding
+        elif embedding_preview > 0 and embedding is not None:
+            post['embedding_preview'] = embedding[:embedding_preview]
+        return post
+    
     def get_paginated_data(self, page: int = 1, per_page: int = 20, 
-                          search: str = '', date_filter: str = '') -> Dict[str, Any]:
-        """Get paginated data with optional search and filtering"""
+                          search: str = '', date_filter: str = '',
+                          cursor: Optional[Dict[str, Any]] = None, order_by: str = 'id',
+                          include_embedding: bool = False,
+                          embedding_preview: int = 0) -> Dict[str, Any]:
+        """Get paginated data with optional search and filtering
+        
+        Offset pages are pushed down into the LanceDB scan (scan order). When a
+        `cursor` is given, keyset pagination is used instead, ordered by `id` or by
+        `date` (newest first), and `next_cursor` is returned for the following page.
+        Embeddings are omitted unless `include_embedding` is set; `embedding_preview`
+        returns only the first N dimensions.
+        """
         try:
             if self.table_name not in self.db.table_names():
                 return {
@@ -57,118 +209,177 @@ class DatabaseViewer:
                     'data': 'No database table found'
                 }
             
-            table = self.db.open_table(self.table_name)
-            
-            # Build query
-            query = table.search()
-            
-            # Apply search filter
-            if search:
-                search_terms = search.lower().split()
-                search_conditions = []
-                for term in search_terms:
-                    search_conditions.append(f"LOWER(title) LIKE '%{term}%' OR LOWER(content) LIKE '%{term}%'")
-                if search_conditions:
-                    search_query = " OR ".join(search_conditions)
-                    query = query.where(f"({search_query})")
-            
-            # Apply date filter
-            if date_filter:
-                today = datetime.now().date()
-                if date_filter == 'today':
-                    start_date = today
-                    end_date = today
-                elif date_filter == 'week':
-                    start_date = today - timedelta(days=today.weekday())
-                    end_date = today
-                elif date_filter == 'month':
-                    start_date = today.replace(day=1)
-                    end_date = today
-                elif date_filter == 'year':
-                    start_date = today.replace(month=1, day=1)
-                    end_date = today
-                else:
-                    start_date = None
-                    end_date = None
-                
-                if start_date and end_date:
-                    query = query.where(f"date >= '{start_date}' AND date <= '{end_date}'")
+            with instrumentation.stage('open_table'):
+                table = self.db.open_table(self.table_name)
+            page = max(1, int(page))
+            per_page = max(1, int(per_page))
             
-            # Get total count for pagination
-            all_results = query.to_pandas()
-            total_count = len(all_results)
+            where = self._build_filter(search, date_filter, table)
             
-            # Apply pagination
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
+            # Get total count for pagination without materializing any rows
+            with instrumentation.stage('count'):
+                total_count = table.count_rows(where) if where else table.count_rows()
             
-            if total_count > 0:
-                paginated_results = all_results.iloc[start_idx:end_idx]
+            columns = list(self.LIST_COLUMNS)
+            if include_embedding or embedding_preview > 0:
+                columns.append('embedding')
+            
+            embedding_type = table.schema.field('embedding').type
+            embedding_dim = getattr(embedding_type, 'list_size', None)
+            
+            next_cursor = None
+            if cursor is not None:
+                page_ids = self._keyset_page_ids(table, where, per_page, cursor, order_by)
+                rows = []
+                if page_ids:
+                    id_list = ", ".join(str(pid) for pid in page_ids)
+                    with instrumentation.stage('scan'):
+                        fetched = table.search().where(f"id IN ({id_list})").select(columns).limit(None).to_arrow()
+                    by_id = {row['id']: row for row in self._arrow_rows(fetched)}
+                    rows = [by_id[pid] for pid in page_ids if pid in by_id]
+                if len(rows) == per_page:
+                    last = rows[-1]
+                    next_cursor = {'id': int(last['id'])}
+                    if order_by == 'date':
+                        next_cursor['date'] = str(last['date'])
             else:
-                paginated_results = pd.DataFrame()
+                # Apply pagination inside the scan
+                query = table.search().select(columns).offset((page - 1) * per_page).limit(per_page)
+                if where:
+                    query = query.where(where)
+                with instrumentation.stage('scan'):
+                    result = query.to_arrow() if total_count > 0 else None
+                rows = self._arrow_rows(result) if result is not None else []
+            instrumentation.count('rows_returned', len(rows))
             
             # Convert to list of dictionaries
-            posts = []
-            for _, row in paginated_results.iterrows():
-                # Handle embedding conversion properly
-                embedding = None
-                if 'embedding' in row and row['embedding'] is not None:
-                    if hasattr(row['embedding'], 'tolist'):
-                        embedding = row['embedding'].tolist()
-                    elif hasattr(row['embedding'], '__iter__'):
-                        embedding = list(row['embedding'])
-                    else:
-                        embedding = row['embedding']
-                
-                # Handle categories and tags conversion
-                categories = []
-                if 'categories' in row and row['categories'] is not None:
-                    if hasattr(row['categories'], 'tolist'):
-                        categories = row['categories'].tolist()
-                    elif hasattr(row['categories'], '__iter__'):
-                        categories = list(row['categories'])
-                    else:
-                        categories = row['categories']
-                
-                tags = []
-                if 'tags' in row and row['tags'] is not None:
-                    if hasattr(row['tags'], 'tolist'):
-                        tags = row['tags'].tolist()
-                    elif hasattr(row['tags'], '__iter__'):
-                        tags = list(row['tags'])
-                    else:
-                        tags = row['tags']
+            with instrumentation.stage('convert'):
+                posts = [
+                    self._row_to_post(row, embedding_dim, include_embedding, embedding_preview)
+                    for row in rows
+                ]
+            
+            data = {
+                'posts': posts,
+                'total_count': total_count,
+                'page': page,
+                'per_page': per_page,
+                'total_pages': (total_count + per_page - 1) // per_page
+            }
+            if cursor is not None:
+                data['order_by'] = order_by
+                data['next_cursor'] = next_cursor
+            
+            return {
+                'success': True,
+                'data': data
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'data': f'Error retrieving data: {str(e)}'
+            }
+    
+    @staticmethod
+    def _value_counts(values) -> List[Dict[str, Any]]:
+        """[{'value', 'count'}] for non-empty `values`, most frequent first"""
+        values = pc.drop_null(values)
+        counts = pc.value_counts(values).flatten()
+        order = pc.sort_indices(pa.table({'count': counts[1], 'value': counts[0]}),
+                                sort_keys=[('count', 'descending'), ('value', 'ascending')])
+        return [
+            {'value': value, 'count': count}
+            for value, count in zip(counts[0].take(order).to_pylist(), counts[1].take(order).to_pylist())
+            if value != ''
+        ]
+    
+    def _facets_cache_path(self) -> str:
+        return os.path.join(self.db_path, f'{self.table_name}.facets.json')
+    
+    def get_facets(self) -> Dict[str, Any]:
+        """Post counts per category, tag and month, and embedding coverage
+        
+        Computed in one scan of the id, date, categories and tags columns (plus the
+        chunk table's post ids) and cached in `<table>.facets.json` until either table
+        gets a new version.
+        """
+        try:
+            if self.table_name not in self.db.table_names():
+                return {
+                    'success': False,
+                    'data': 'No database table found'
+                }
+            
+            with instrumentation.stage('open_table'):
+                table = self.db.open_table(self.table_name)
+                chunks_name = f'{self.table_name}_chunks'
+                chunks = self.db.open_table(chunks_name) if chunks_name in self.db.table_names() else None
+            versions = {'posts': table.version, 'chunks': chunks.version if chunks is not None else None}
+            
+            try:
+                with open(self._facets_cache_path(), 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('versions') == versions:
+                    instrumentation.count('cache_hits', 1)
+                    return {
+                        'success': True,
+                        'data': dict(cached['facets'], cached=True)
+                    }
+            except (OSError, ValueError):
+                pass
+            
+            columns = list(self.FACET_COLUMNS)
+            if 'content_hash' in table.schema.names:
+                columns.append('content_hash')
+            with instrumentation.stage('scan'):
+                rows = table.search().select(columns).limit(None).to_arrow()
+            instrumentation.count('rows_scanned', rows.num_rows)
+            
+            with instrumentation.stage('aggregate'):
+                months = pc.utf8_slice_codeunits(pc.cast(rows.column('date'), pa.string()), 0, 7)
+                coverage = {
+                    'posts': rows.num_rows,
+                    # Posts whose content hash is recorded, so edits are detected
+                    'with_content_hash': (
+                        rows.num_rows - rows.column('content_hash').null_count
+                        if 'content_hash' in columns else 0
+                    ),
+                    'with_chunks': None,
+                }
+                if chunks is not None:
+                    with instrumentation.stage('scan_chunks'):
+                        chunk_ids = chunks.search().select(['post_id']).limit(None).to_arrow().column('post_id')
+                    chunked = pc.unique(chunk_ids.combine_chunks())
+                    coverage['with_chunks'] = pc.sum(
+                        pc.is_in(rows.column('id'), value_set=chunked)
+                    ).as_py() or 0
                 
-                post = {
-                    'id': int(row['id']),
-                    'title': str(row['title']),
-                    'content': str(row['content']),
-                    'date': str(row['date']),
-                    'permalink': str(row['permalink']),
-                    'categories': categories,
-                    'tags': tags,
-                    'embedding': embedding
+                facets = {
+                    'total_posts': rows.num_rows,
+                    'categories': self._value_counts(pc.list_flatten(rows.column('categories'))),
+                    'tags': self._value_counts(pc.list_flatten(rows.column('tags'))),
+                    'months': sorted(self._value_counts(months), key=lambda m: m['value'], reverse=True),
+                    'coverage': coverage,
                 }
-                posts.append(post)
+            
+            tmp = f'{self._facets_cache_path()}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'versions': versions, 'facets': facets}, f, ensure_ascii=False)
+            os.replace(tmp, self._facets_cache_path())
             
             return {
                 'success': True,
-                'data': {
-                    'posts': posts,
-                    'total_count': total_count,
-                    'page': page,
-                    'per_page': per_page,
-                    'total_pages': (total_count + per_page - 1) // per_page
-                }
+                'data': dict(facets, cached=False)
             }
             
         except Exception as e:
             return {
                 'success': False,
-                'data': f'Error retrieving data: {str(e)}'
+                'data': f'Error computing facets: {str(e)}'
             }
     
-    def get_sample_data(self, count: int = 20) -> Dict[str, Any]:
+    def get_sample_data(self, count: int = 20, embedding_preview: int = 0) -> Dict[str, Any]:
         """Generate sample data for testing if database is empty"""
         try:
             sample_posts = []
@@ -182,8 +393,10 @@ class DatabaseViewer:
                     'permalink': f'https://example.com/sample-post-{i}',
                     'categories': ['Sample', 'Test'],
                     'tags': ['sample', 'test', f'post-{i}'],
-                    'embedding': [0.1 * i + 0.01 * j for j in range(1536)]  # Sample embedding
+                    'embedding_dim': 1536
                 }
+                if embedding_preview > 0:
+                    post['embedding_preview'] = [0.1 * i + 0.01 * j for j in range(embedding_preview)]  # Sample embedding
                 sample_posts.append(post)
             
             return {
@@ -207,46 +420,63 @@ class DatabaseViewer:
 def main():
     """Main function to handle database viewing"""
     if len(sys.argv) < 2:
-        print(json.dumps({
+        write_json({
             'success': False,
-            'data': 'Usage: python view_database.py <input_file>'
-        }, cls=NumpyEncoder))
+            'data': 'Usage: python view_database.py <input_file> [view|facets]'
+        })
         sys.exit(1)
     
     input_file = sys.argv[1]
+    operation = sys.argv[2] if len(sys.argv) > 2 else 'view'
+    instr = Instrumentation('view_database')
+    instr.operation = operation
     
     try:
         # Read input data
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = instr.read_input(input_file, json.load)
+        instr.enable_timings(data.get('timings', False))
         
         # Initialize database viewer
         db_path = data.get('db_path', '/tmp/lancedb')
         table_name = data.get('table_name', 'wordpress_posts')
-        viewer = DatabaseViewer(db_path, table_name)
+        with instr.stage('connect'):
+            viewer = DatabaseViewer(db_path, table_name)
+        
+        if operation == 'facets':
+            instr.emit(viewer.get_facets())
+            return
         
         # Get parameters
         page = data.get('page', 1)
         per_page = data.get('per_page', 20)
         search = data.get('search', '')
         date_filter = data.get('date_filter', '')
+        cursor = data.get('cursor')
+        order_by = data.get('order_by', 'id')
+        include_embedding = bool(data.get('include_embedding', False))
+        embedding_preview = int(data.get('embedding_preview', 0))
         
         # Check if database exists and has data
-        if table_name not in viewer.db.table_names():
+        if viewer.table_name not in viewer.db.table_names():
             # Return sample data for testing
-            result = viewer.get_sample_data(per_page)
+            result = viewer.get_sample_data(per_page, embedding_preview)
         else:
             # Get real data
-            result = viewer.get_paginated_data(page, per_page, search, date_filter)
+            result = viewer.get_paginated_data(
+                page, per_page, search, date_filter,
+                cursor=cursor, order_by=order_by,
+                include_embedding=include_embedding,
+                embedding_preview=embedding_preview
+            )
         
         # Output result
-        print(json.dumps(result, ensure_ascii=False, cls=NumpyEncoder))
+        instr.emit(result)
         
     except Exception as e:
-        print(json.dumps({
+        instr.emit({
             'success': False,
             'data': f'Error: {str(e)}'
-        }, cls=NumpyEncoder))
+        })
 
 
 if __name__ == '__main__':
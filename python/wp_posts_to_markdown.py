@@ -4,195 +4,111 @@ wp_posts_to_markdown.py
 Converts a list of WordPress posts (in JSON format) to Markdown with YAML front matter for chunking/embedding.
 
 - Expects a JSON file as the first argument (from PHP/WordPress), or defaults to 'posts.json'.
+  The export is read incrementally (see models/post.py), so posts are converted and chunked
+  as they are parsed rather than after the whole file is loaded.
 - Uses docling (preferred) or markdownify (fallback) to convert HTML post content to Markdown.
-- Outputs one Markdown document per post, separated by a clear delimiter.
+- Chunks each post separately (see chunking/post_chunker.py) and outputs the chunks in post
+  order, each with its post id, permalink, heading path and token count.
+- Caches each post's Markdown and chunks on disk (see chunking/cache.py); only posts whose
+  HTML or chunker config changed are reconverted. Pass --clear-cache to rebuild everything.
 - Supports token-based chunking for OpenAI models using tiktoken and FUKAMI_LENS_RAG_MAX_INPUT_TOKENS.
 
 Usage:
-    python3 wp_posts_to_markdown.py /path/to/posts.json
+    python3 wp_posts_to_markdown.py /path/to/posts.json [--clear-cache] [--format=jsonl]
+
+With --format=jsonl (or FUKAMI_LENS_CHUNK_OUTPUT=jsonl) stdout carries one JSON object per
+chunk (post id, chunk index, text, contextualized text, token counts, heading path),
+flushed as it is produced. With FUKAMI_LENS_TIMINGS=1 a final {"timings": ...} line reports
+the time spent converting, chunking and writing (see utils/instrumentation.py).
 
 This script is designed to be called from a PHP integration (see runner.php), but can also be imported as a module.
 """
 import sys
-import json
-import tempfile
+import itertools
 import os
-import pprint
-from utils.tokenizer import OpenAITokenizerWrapper
-
-# Try to import docling HybridChunker and DocumentConverter
-try:
-    from docling.document_converter import DocumentConverter
-    from docling.chunking import HybridChunker
-    DOCLING_AVAILABLE = True
-except ImportError:
-    DOCLING_AVAILABLE = False
-
-import tiktoken
+from utils.instrumentation import Instrumentation
+from config import load_config
+from main import parse_options
+from chunking.cache import ChunkCache
+from chunking.post_chunker import DOCLING_AVAILABLE, PostChunker
+from models.post import iter_posts_from_json
 
 os.environ["HF_HOME"] = "/tmp"
 os.environ["HF_HUB_CACHE"] = "/tmp/huggingface"
 os.environ["XDG_CACHE_HOME"] = "/tmp"
 
-def html_to_markdown(html):
-    """
-    Convert HTML to Markdown using docling (preferred) or markdownify (fallback).
-    If docling is not available, falls back to markdownify.
-    If neither is available, returns an error message.
-    """
-    try:
-        from docling.document_converter import DocumentConverter
-        converter = DocumentConverter()
-        with tempfile.NamedTemporaryFile('w+', suffix='.html', delete=False, encoding='utf-8') as tmp:
-            tmp.write(html)
-            tmp.flush()
-            tmp_path = tmp.name
-        try:
-            result = converter.convert(tmp_path)
-            return result.document.export_to_markdown()
-        finally:
-            os.unlink(tmp_path)
-    except ImportError:
-        try:
-            from markdownify import markdownify as md
-            return md(html)
-        except ImportError:
-            return "[ERROR: Neither docling nor markdownify is available]"
-
-def yaml_escape(s):
-    """Escape double quotes and backslashes for YAML."""
-    if not isinstance(s, str):
-        return s
-    return s.replace('\\', '\\\\').replace('"', '\\"')
-
 def main():
-    if len(sys.argv) > 1:
-        posts_json_path = sys.argv[1]
+    instr = Instrumentation('wp_posts_to_markdown')
+    instr.operation = 'chunk'
+    args, options = parse_options(sys.argv[1:])
+    if args:
+        posts_json_path = args[0]
     else:
         posts_json_path = 'posts.json'
+    clear_cache = 'clear-cache' in options or os.environ.get('FUKAMI_LENS_CHUNK_CACHE_CLEAR') == '1'
+    jsonl = options.get('format', os.environ.get('FUKAMI_LENS_CHUNK_OUTPUT', 'text')) == 'jsonl'
+    # In JSONL mode stdout carries only chunk records; diagnostics go to stderr
+    log = sys.stderr if jsonl else sys.stdout
 
+    # Posts are parsed one at a time as the chunker asks for them
+    posts = iter_posts_from_json(posts_json_path)
     try:
-        with open(posts_json_path, 'r', encoding='utf-8') as f:
-            posts = json.load(f)
+        first = next(posts, None)
     except Exception as e:
-        print(f'Error reading posts.json: {e}')
+        print(f'Error reading posts.json: {e}', file=log)
         sys.exit(1)
 
-    if not posts:
-        print('No published posts found.')
+    if first is None:
+        print('No published posts found.', file=log)
         sys.exit(0)
 
-    all_md = []
-    for post in posts:
-        title = post.get('title', {}).get('rendered', '')
-        date = post.get('date', '')
-        content_html = post.get('content', {}).get('rendered', '')
-        permalink = post.get('permalink', '')
-        post_id = post.get('ID', '')
-        categories = post.get('categories', [])
-        tags = post.get('tags', [])
-
-        # --- Add canonical link to HTML content for Docling provenance ---
-        if '<head>' in content_html:
-            content_html = content_html.replace(
-                '<head>',
-                f'<head>\n<link rel="canonical" href="{permalink}">',
-                1
-            )
-        else:
-            # If no <head>, prepend it
-            content_html = (
-                f'<head><link rel="canonical" href="{permalink}"></head>\n' + content_html
-            )
-
-        # YAML front matter
-        yaml_lines = [
-            "---",
-            f'id: {post_id}',
-            f'title: "{yaml_escape(title)}"',
-            f'date: "{date}"',
-            f'permalink: "{permalink}"',
-            "categories:",
-        ] + [f'  - "{yaml_escape(cat)}"' for cat in categories] + [
-            "tags:",
-        ] + [f'  - "{yaml_escape(tag)}"' for tag in tags] + [
-            "---",
-            "",
-        ]
-
-        # Markdown content
-        md = f'# {title}\n\n'
-        md += html_to_markdown(content_html)
-        all_md.append('\n'.join(yaml_lines) + md)
-
-    # Output: separate each post with a clear delimiter for chunking
-    markdown = '\n\n---\n\n'.join(all_md)
+    config = load_config()
 
     # Get max_input_tokens from environment or default
     max_input_tokens = int(os.environ.get("FUKAMI_LENS_RAG_MAX_INPUT_TOKENS", 1000))
     embeddings_model = os.environ.get("FUKAMI_LENS_RAG_EMBEDDINGS_MODEL", "text-embedding-3-small")
 
-    print(f"[DEBUG] max_input_tokens = {max_input_tokens}")
-    print(f"[DEBUG] embeddings_model = {embeddings_model}")
+    print(f"[DEBUG] max_input_tokens = {max_input_tokens}", file=log)
+    print(f"[DEBUG] embeddings_model = {embeddings_model}", file=log)
 
+    chunker = PostChunker(
+        max_input_tokens,
+        embeddings_model,
+        workers=config.convert_workers,
+        max_posts_per_worker=config.convert_max_posts_per_worker,
+        overlap=config.chunk_overlap_tokens,
+    )
     if DOCLING_AVAILABLE:
-        # Use docling DocumentConverter and HybridChunker for chunking
-        with tempfile.NamedTemporaryFile('w+', suffix='.md', delete=False, encoding='utf-8') as tmp_md:
-            tmp_md.write(markdown)
-            tmp_md.flush()
-            tmp_md_path = tmp_md.name
-        try:
-            doc_conv = DocumentConverter().convert(source=tmp_md_path)
-            doc = doc_conv.document
-            # --- Set doc.origin.uri to permalink if possible ---
-            if hasattr(doc, 'origin') and hasattr(doc.origin, 'uri'):
-                # Try to extract the permalink from the YAML front matter (first post)
-                import re
-                m = re.search(r'permalink: "([^"]+)"', markdown)
-                if m:
-                    doc.origin.uri = m.group(1)
-            # Load our custom tokenizer for OpenAI
-            tokenizer = OpenAITokenizerWrapper()
-            print(f"[DEBUG] Using tokenizer: OpenAITokenizerWrapper (OpenAI tiktoken compatible)")
-            chunker = HybridChunker(
-                tokenizer=tokenizer,
-                max_tokens=max_input_tokens, 
-                merge_peers=True,
-            )
-            chunk_iter = chunker.chunk(dl_doc=doc)
-
-            chunks = list(chunk_iter)
-
-            for i, chunk in enumerate(chunks, 1):
-                token_count = len(tokenizer.tokenizer.encode(chunk.text))
-                print(f"\n\n--- chunk {i} (tokens: {token_count}) ---\n\n")
-                print(chunk.text)
-                
-        finally:
-            os.unlink(tmp_md_path)
+        print(f"[DEBUG] Using tokenizer: OpenAITokenizerWrapper (OpenAI tiktoken compatible)", file=log)
     else:
-        print(f"[DEBUG] Using tokenizer: tiktoken (fallback, no docling)")
-        # Fallback: use tiktoken-based chunking as before
-        enc = tiktoken.encoding_for_model(embeddings_model)
-        lines = markdown.splitlines(keepends=True)
-        chunks = []
-        current_chunk = ""
-        current_tokens = 0
-        for line in lines:
-            line_tokens = len(enc.encode(line))
-            if current_tokens + line_tokens > max_input_tokens and current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = line
-                current_tokens = line_tokens
-            else:
-                current_chunk += line
-                current_tokens += line_tokens
-        if current_chunk:
-            chunks.append(current_chunk)
-        for i, chunk in enumerate(chunks, 1):
-            token_count = len(enc.encode(chunk))
-            print(f"\n\n--- chunk {i} (tokens: {token_count}) ---\n\n")
-            print(chunk)
+        print(f"[DEBUG] Using tokenizer: tiktoken (fallback, no docling)", file=log)
+
+    cache = ChunkCache(config_fingerprint=chunker.config_fingerprint)
+    if clear_cache:
+        cache.invalidate()
+    chunker.cache = cache
+
+    # Chunks are printed as they are produced, one post at a time
+    for i, chunk in enumerate(chunker.iter_chunks(itertools.chain([first], posts)), 1):
+        if jsonl:
+            instr.write(chunk)
+            continue
+        with instr.stage('output'):
+            heading_path = ' > '.join(chunk['heading_path'])
+            print(f"\n\n--- chunk {i} (post {chunk['post_id']} #{chunk['chunk_index']}, tokens: {chunk['tokens']}) ---")
+            print(f"permalink: {chunk['permalink']}")
+            print(f"headings: {heading_path}\n\n")
+            print(chunk['text'])
+
+    stats = cache.stats()
+    print(f"\n[CACHE] hits = {stats['hits']}, misses = {stats['misses']}, stored = {stats['stored']}, "
+          f"invalidated = {stats['invalidated']}, entries = {stats['entries']}", file=log)
+    cache.close()
+
+    instr.bytes_in = os.path.getsize(posts_json_path)
+    instr.count('cache_hits', stats['hits'])
+    # The timings close the JSONL stream; in text mode they go with the other diagnostics
+    instr.emit_footer(sys.stdout if jsonl else log)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file